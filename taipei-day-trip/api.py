@@ -1,93 +1,288 @@
-from fastapi import APIRouter, Query, HTTPException,Request,Response
-from fastapi.responses import JSONResponse
-from database import get_db_connection
+from fastapi import APIRouter, Depends, Query, HTTPException,Request,Response
+from fastapi.responses import ORJSONResponse
+from database import get_db_connection, get_read_connection, mark_written, DIALECT
+from catalog import get_catalog, AttractionRecord, CatalogSnapshot
+from models import AttractionPage, AttractionDetail, NearbyList, AvailabilityCalendar, MrtList, OrderHistory, UserAuth, BookingResponse, BatchResponse, attraction_from_row
+from pagination import encode_cursor, decode_cursor
 from datetime import datetime, timedelta
-from config import SECRET_KEY, ALGORITHM, TOKEN_EXPIRE_DAYS,PARTNER_KEY,MERCHANT_KEY
-from jwt.exceptions import ExpiredSignatureError, InvalidTokenError
-from sqlalchemy import text
+from config import SECRET_KEY, ALGORITHM, TOKEN_EXPIRE_DAYS, SLOT_CAPACITY, MAX_ATTRACTION_IDS
+from sqlalchemy import bindparam, text
+from auth import current_user, current_user_id, invalidate_user
+from passwords import hash_password, verify_password, needs_rehash, PasswordServiceBusy
 import jwt
-import bcrypt
+import logging
 import re
-import requests
-
-
-router = APIRouter()
+import payment
+import inventory
+import idempotency
+import batch
+from order_numbers import next_order_number
+from search import query_terms
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(default_response_class=ORJSONResponse)
+
+# 每位使用者只保留一筆預定（booking.user_id 為唯一鍵），SQLite 供測試與壓測使用
+BOOKING_UPSERT = {
+    "mysql": """
+        INSERT INTO booking (user_id, attraction_id, date, time, price)
+        VALUES (:user_id, :attraction_id, :date, :time, :price)
+        ON DUPLICATE KEY UPDATE attraction_id = VALUES(attraction_id),
+                                date = VALUES(date),
+                                time = VALUES(time),
+                                price = VALUES(price)
+    """,
+    "sqlite": """
+        INSERT INTO booking (user_id, attraction_id, date, time, price)
+        VALUES (:user_id, :attraction_id, :date, :time, :price)
+        ON CONFLICT (user_id) DO UPDATE SET attraction_id = excluded.attraction_id,
+                                            date = excluded.date,
+                                            time = excluded.time,
+                                            price = excluded.price
+    """,
+}
+
+def busy_response(e):
+    return ORJSONResponse(status_code=503, headers={"Retry-After": "1"}, content={
+        "error": True,
+        "message": str(e)
+    })
 
-@router.get("/api/attractions")
-def get_attraction(
+async def sql_facet_counts(conn, category, mrt):
+    # 目錄快照未載入且沒有關鍵字時的備援：與 FacetIndex.counts 相同，計算某欄位時不套用該欄位自己的條件
+    filters = {"category": category, "mrt": mrt}
+    counts = {}
+    for field in ("category", "mrt"):
+        conditions = [f"a.{field} IS NOT NULL"]
+        params = {}
+        for other, value in filters.items():
+            if other != field and value:
+                conditions.append(f"a.{other} = :{other}")
+                params[other] = value
+        result = await conn.execute(text(f"""
+            SELECT a.{field} AS name, COUNT(*) AS count
+            FROM attraction_read a
+            WHERE {" AND ".join(conditions)}
+            GROUP BY a.{field}
+            ORDER BY count DESC
+        """), params)
+        counts[field] = [{"name": row.name, "count": row.count} for row in result]
+    return counts
+
+async def keyword_matches(conn, keyword):
+    """目錄快照未載入時的關鍵字搜尋，回傳只含符合景點的 CatalogSnapshot
+
+    先以 LIKE 取出名稱或描述包含每個查詢詞、或捷運站完全相符的景點，再交給與目錄快照相同的索引
+    篩選（英數字須為完整的詞）與排序，比對與排序規則和目錄快照一致；
+    相關度的統計（文件數、詞出現的文件數、平均長度）只來自這些景點，分數與目錄快照的不能互相比較
+    """
+    # 查詢詞只含中日韓文字或英數字，不會有 LIKE 的萬用字元
+    terms = query_terms(keyword)
+    params = {f"term{i}": f"%{term}%" for i, term in enumerate(terms)}
+    params["keyword"] = keyword.strip()
+    condition = "a.mrt = :keyword"
+    if terms:
+        matched = " AND ".join(f"(a.name LIKE :term{i} OR a.description LIKE :term{i})" for i in range(len(terms)))
+        condition = f"({matched}) OR {condition}"
+    result = await conn.execute(text(f"""
+        SELECT a.id, a.name, a.category, a.description, a.address, a.transport,
+               a.mrt, a.lat, a.lng, a.images
+        FROM attraction_read a
+        WHERE {condition}
+        ORDER BY a.id
+    """), params)
+    return CatalogSnapshot(None, [AttractionRecord(**attraction_from_row(row)) for row in result], terms=set(terms))
+
+def parse_ids(value):
+    # "1,2,3" → [1, 2, 3]，去除重複並保留順序
+    try:
+        ids = list(dict.fromkeys(int(part) for part in value.split(",") if part.strip()))
+    except ValueError:
+        raise ValueError("無效的景點編號")
+    if not ids:
+        raise ValueError("無效的景點編號")
+    if len(ids) > MAX_ATTRACTION_IDS:
+        raise ValueError(f"一次最多查詢 {MAX_ATTRACTION_IDS} 個景點")
+    return ids
+
+async def get_attractions_by_ids(ids):
+    # 依請求的順序回傳，不存在的編號直接略過
+    catalog = get_catalog()
+    if catalog is not None:
+        data = [catalog.by_id[i].to_dict() for i in ids if i in catalog.by_id]
+        return ORJSONResponse({"nextPage": None, "nextCursor": None, "data": data})
+
+    # 目錄未載入時以一次 IN 查詢取得（主鍵查詢）
+    async with get_read_connection() as conn:
+        sql = text("""
+            SELECT a.id, a.name, a.category, a.description, a.address, a.transport,
+                   a.mrt, a.lat, a.lng, a.images
+            FROM attraction_read a
+            WHERE a.id IN :ids
+        """).bindparams(bindparam("ids", expanding=True))
+        result = await conn.execute(sql, {"ids": ids})
+        found = {row.id: attraction_from_row(row) for row in result}
+
+    return ORJSONResponse({"nextPage": None, "nextCursor": None, "data": [found[i] for i in ids if i in found]})
+
+@router.get("/api/attractions", responses={200: {"model": AttractionPage}})
+async def get_attraction(
     page: int = Query(0, alias="page", ge=0),
-    keyword: str = Query(None, alias="keyword")):
+    keyword: str = Query(None, alias="keyword"),
+    category: str = Query(None, alias="category"),
+    mrt: str = Query(None, alias="mrt"),
+    cursor: str = Query(None, alias="cursor"),
+    facets: bool = Query(False, alias="facets"),
+    ids: str = Query(None, alias="ids")):
+
+    # 指定景點編號（例如 ids=1,2,3）時一次取得這些景點，不分頁也不套用其他條件
+    if ids is not None:
+        try:
+            ids = parse_ids(ids)
+        except ValueError as e:
+            return ORJSONResponse(status_code=400, content={"error": True, "message": str(e)})
+        try:
+            return await get_attractions_by_ids(ids)
+        except Exception as e:
+            return ORJSONResponse({"error": True, "message": f"伺服器錯誤: {str(e)}"})
+
+    per_page = 12
+    catalog = get_catalog()
+    # cursor 記錄排序方式：沒有關鍵字時兩條路徑都依 id 排序，可以互用；
+    # 有關鍵字時排序鍵是 (-相關度, id)，分數只在同一份目錄快照（或同樣走資料庫備援）時可以比較
+    if not keyword:
+        sort, size = "id", 1
+    elif catalog is not None:
+        sort, size = f"score:{catalog.version}", 2
+    else:
+        sort, size = "score:db", 2
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor, sort, size)
+        except ValueError as e:
+            return ORJSONResponse(status_code=400, content={"error": True, "message": str(e)})
+        # 景點排序鍵只有數字（相關度與 id）
+        if any(isinstance(v, str) for v in after):
+            return ORJSONResponse(status_code=400, content={"error": True, "message": "無效的 cursor"})
 
     try:
-        per_page = 12
-        offset = page * per_page
+        # 目錄快照已載入時直接由記憶體回應
+        if catalog is not None:
+            items, next_page, next_key = catalog.page(keyword, per_page, page=page, after=after,
+                                                      category=category, mrt=mrt)
+            content = {
+                "nextPage": next_page,
+                "nextCursor": encode_cursor(next_key, sort) if next_key else None,
+                "data": [a.to_dict() for a in items]
+            }
+            if facets:
+                content["facets"] = catalog.facet_counts(keyword, category=category, mrt=mrt)
+            return ORJSONResponse(content)
 
         # 從 connection pool 獲取連線
-        with get_db_connection() as conn:
+        async with get_read_connection() as conn:
             if conn is None:
                 raise HTTPException(status_code=500,detail="無法連接資料庫")
-             
-            # 構建基本 SQL 查詢
+
+            if keyword:
+                # 關鍵字搜尋與目錄快照使用相同的比對與相關度排序
+                matches = await keyword_matches(conn, keyword)
+                items, next_page, next_key = matches.page(keyword, per_page, page=page, after=after,
+                                                          category=category, mrt=mrt)
+                content = {
+                    "nextPage": next_page,
+                    "nextCursor": encode_cursor(next_key, sort) if next_key else None,
+                    "data": [a.to_dict() for a in items]
+                }
+                if facets:
+                    content["facets"] = matches.facet_counts(keyword, category=category, mrt=mrt)
+                return ORJSONResponse(content)
+
+            # 構建基本 SQL 查詢（讀取用資料表已包含排序好的圖片，不需要 JOIN 與 GROUP BY）
             sql = """
                 SELECT a.id, a.name, a.category, a.description, a.address, a.transport, 
-                       a.mrt, a.lat, a.lng, GROUP_CONCAT(ai.image_url) AS images
-                FROM attractions a
-                LEFT JOIN attraction_images ai ON a.id = ai.attraction_id
+                       a.mrt, a.lat, a.lng, a.images
+                FROM attraction_read a
             """
             
             params = {}
+            conditions = []
+
+            if category:
+                conditions.append("a.category = :category")
+                params["category"] = category
+
+            if mrt:
+                conditions.append("a.mrt = :mrt")
+                params["mrt"] = mrt
+
+            # cursor 模式：從上一頁最後一筆 id 之後開始（走主鍵索引，不需要 OFFSET）
+            if after is not None:
+                conditions.append("a.id > :after_id")
+                params["after_id"] = after[-1]
+
+            if conditions:
+                sql += " WHERE " + " AND ".join(conditions)
             
-            if keyword:
-                sql += " WHERE a.name LIKE :keyword_like OR a.mrt = :keyword"
-                params["keyword_like"] = f"%{keyword}%"
-                params["keyword"] = keyword
-            
-            sql += " GROUP BY a.id, a.name, a.category, a.description, a.address, a.transport, a.mrt, a.lat, a.lng"
-            sql += " LIMIT :per_page OFFSET :offset"
-            params["per_page"] = per_page
-            params["offset"] = offset
+            sql += " ORDER BY a.id"
+
+            # 多取一筆來判斷是否還有下一頁，不再另外查詢 COUNT
+            sql += " LIMIT :limit"
+            params["limit"] = per_page + 1
+            if after is None:
+                sql += " OFFSET :offset"
+                params["offset"] = page * per_page
             
             # 使用 SQLAlchemy 的 text() 執行 SQL
-            result = conn.execute(text(sql), params)
-            
-            # 正確處理 SQLAlchemy 結果集
-            attractions = []
-            for row in result:
-                # 使用 ._mapping 或直接使用下標訪問
-                attraction_dict = {}
-                for key in row._mapping.keys():
-                    attraction_dict[key] = row._mapping[key]
-                attractions.append(attraction_dict)
+            result = await conn.execute(text(sql), params)
             
-            # 轉換圖片格式
-            for attraction in attractions:
-                attraction["images"] = attraction["images"].split(",") if attraction["images"] else []
-            
-            # 查詢總數
-            count_sql = "SELECT COUNT(*) AS total FROM attractions"
-            if keyword:
-                count_sql += " WHERE name LIKE :keyword_like OR mrt = :keyword"
-                count_result = conn.execute(text(count_sql), {
-                    "keyword_like": f"%{keyword}%", 
-                    "keyword": keyword
-                })
-            else:
-                count_result = conn.execute(text(count_sql))
-            
-            # 正確處理 COUNT 結果
-            row = count_result.fetchone()
-            total_count = row[0]  # 使用下標訪問第一個欄位
-            next_page = page + 1 if (page + 1) * per_page < total_count else None
+            # 每列一次轉換成可直接序列化的 dict
+            attractions = [attraction_from_row(row) for row in result]
 
-        return {"nextPage": next_page, "data": attractions}
+            facet_counts = await sql_facet_counts(conn, category, mrt) if facets else None
 
-    except Exception as e:
-        return {"error": True, "message": f"伺服器錯誤: {str(e)}"}
+        has_more = len(attractions) > per_page
+        attractions = attractions[:per_page]
+        next_page = page + 1 if has_more and after is None else None
+        next_cursor = encode_cursor((attractions[-1]["id"],), sort) if has_more else None
+
+        content = {"nextPage": next_page, "nextCursor": next_cursor, "data": attractions}
+        if facets:
+            content["facets"] = facet_counts
+        return ORJSONResponse(content)
 
-@router.get("/api/attractions/{id}")
-def get_attractions_id(id:int):
+    except Exception as e:
+        return ORJSONResponse({"error": True, "message": f"伺服器錯誤: {str(e)}"})
+
+@router.get("/api/attractions/nearby", responses={200: {"model": NearbyList}})
+async def get_nearby_attractions(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius: int = Query(2000, ge=1, le=20000),
+    limit: int = Query(6, ge=1, le=50),
+    exclude: int = Query(None)):
+
+    # 只由記憶體中的空間索引回應，不在 SQL 中計算距離
+    catalog = get_catalog()
+    if catalog is None:
+        return ORJSONResponse(status_code=503, content={"error": True, "message": "景點目錄尚未載入"})
+
+    hits = catalog.spatial.nearby(lat, lng, radius, limit, exclude=exclude)
+    return ORJSONResponse({"data": [{**a.to_dict(), "distance": round(distance)} for distance, a in hits]})
+
+@router.get("/api/attractions/{id}", responses={200: {"model": AttractionDetail}})
+async def get_attractions_id(id:int):
     try:
-        with get_db_connection() as conn:
+        catalog = get_catalog()
+        if catalog is not None:
+            record = catalog.by_id.get(id)
+            if record is None:
+                raise HTTPException(status_code=400, detail="景點編號不正確")
+            return ORJSONResponse({"data": record.to_dict()})
+
+        async with get_read_connection() as conn:
             if conn is None:
                 raise HTTPException(status_code=500,detail="無法連接資料庫")
 
@@ -95,15 +290,13 @@ def get_attractions_id(id:int):
             # 查詢指定 ID 的景點
             sql = """
                 SELECT a.id, a.name, a.category, a.description, a.address, a.transport, 
-                    a.mrt, a.lat, a.lng, GROUP_CONCAT(ai.image_url) AS images
-                FROM attractions a
-                LEFT JOIN attraction_images ai ON a.id = ai.attraction_id
+                    a.mrt, a.lat, a.lng, a.images
+                FROM attraction_read a
                 WHERE a.id = :id
-                GROUP BY a.id, a.name, a.category, a.description, a.address, a.transport, a.mrt, a.lat, a.lng
             """
 
             # 執行查詢
-            result = conn.execute(text(sql), {"id": id})
+            result = await conn.execute(text(sql), {"id": id})
 
             # 獲取結果
             attraction_row = result.fetchone()
@@ -112,24 +305,48 @@ def get_attractions_id(id:int):
             if not attraction_row:
                 raise HTTPException(status_code=400, detail="景點編號不正確")
 
-            # 轉換結果為字典
-            attraction = {}
-            for key in attraction_row._mapping.keys():
-                attraction[key] = attraction_row._mapping[key]
-
-            # 處理圖片格式
-            attraction["images"] = attraction["images"].split(",") if attraction["images"] else []
+            attraction = attraction_from_row(attraction_row)
 
-        return {"data": attraction}
+        return ORJSONResponse({"data": attraction})
 
     except Exception as e:
-        return {"error": True, "message": f"伺服器錯誤: {str(e)}"}
+        return ORJSONResponse({"error": True, "message": f"伺服器錯誤: {str(e)}"})
     
-@router.get("/api/mrts")
-def get_mrts():
+@router.get("/api/attractions/{id}/availability", responses={200: {"model": AvailabilityCalendar}})
+async def get_availability(
+    id: int,
+    start: str = Query(None, alias="from"),
+    days: int = Query(30, ge=1, le=inventory.MAX_DAYS)):
+
+    today = datetime.today().date()
+    start_date = today
+    if start:
+        try:
+            start_date = max(datetime.strptime(start, "%Y-%m-%d").date(), today)
+        except ValueError:
+            return ORJSONResponse(status_code=400, content={"error": True, "message": "無效的日期格式"})
+
+    catalog = get_catalog()
+    if catalog is not None and id not in catalog.by_id:
+        return ORJSONResponse(status_code=400, content={"error": True, "message": "景點編號不正確"})
+
     try:
+        # 剩餘名額由短暫快取的計數回應，實際是否額滿以下單時的條件式更新為準
+        counters = await inventory.get_counters(id)
+        return ORJSONResponse({"capacity": SLOT_CAPACITY, "data": inventory.calendar(counters, start_date, days)})
+
+    except Exception as e:
+        return ORJSONResponse(status_code=500, content={"error": True, "message": f"伺服器錯誤: {str(e)}"})
+
+@router.get("/api/mrts", responses={200: {"model": MrtList}})
+async def get_mrts():
+    try:
+        catalog = get_catalog()
+        if catalog is not None:
+            return ORJSONResponse({"data": catalog.mrts})
+
         # 使用 with 語句從 connection pool 獲取連線
-        with get_db_connection() as conn:
+        async with get_read_connection() as conn:
 
             # 查詢 MRT 站點其對應景點數
             sql = """
@@ -141,17 +358,31 @@ def get_mrts():
             """
 
          # 執行查詢
-            result = conn.execute(text(sql))
+            result = await conn.execute(text(sql))
             
             # 從結果中提取 mrt 欄位值
             mrts = []
             for row in result:
                 mrts.append(row.mrt)
 
-        return {"data":mrts}
+        return ORJSONResponse({"data": mrts})
 
     except Exception as e:
-        return {"error": True,"message":f"伺服器錯誤: {str(e)}"}
+        return ORJSONResponse({"error": True, "message": f"伺服器錯誤: {str(e)}"})
+
+# 一次執行多個唯讀 API 請求（見 batch.py），子請求沿用這個請求的登入 token
+@router.post("/api/batch", responses={200: {"model": BatchResponse}})
+async def post_batch(request: Request):
+    try:
+        body = await request.json()
+    except ValueError:
+        return ORJSONResponse(status_code=400, content={"error": True, "message": "批次請求內容不完整"})
+    try:
+        requests = batch.parse_requests(body)
+    except batch.BatchError as e:
+        return ORJSONResponse(status_code=400, content={"error": True, "message": str(e)})
+
+    return ORJSONResponse({"responses": await batch.execute(request, requests)})
 
 @router.post("/api/user")
 async def post_user(request: Request):
@@ -162,86 +393,63 @@ async def post_user(request: Request):
         password = data.get("password", "").strip()
 
         if not name or not email or not password:
-            return JSONResponse(status_code=400, content={
+            return ORJSONResponse(status_code=400, content={
                 "error": True,
                 "message": "請提供完整的註冊資訊"
             })
 
         email_pattern = r"^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$"
         if not re.match(email_pattern, email):
-            return JSONResponse(status_code=400, content={
+            return ORJSONResponse(status_code=400, content={
                 "error": True,
                 "message": "請輸入有效的 Email 格式"
             })
 
         # 使用 with 語句從 connection pool 獲取連線
-        with get_db_connection() as conn:
+        async with get_db_connection() as conn:
             # 檢查 email 是否已被註冊
             check_sql = "SELECT id FROM users WHERE email = :email"
-            result = conn.execute(text(check_sql), {"email": email})
+            result = await conn.execute(text(check_sql), {"email": email})
             existing_user = result.fetchone()
 
-            if existing_user:
-                return JSONResponse(status_code=400, content={
-                    "error": True,
-                    "message": "該 Email 已被註冊"
-                })
+        if existing_user:
+            return ORJSONResponse(status_code=400, content={
+                "error": True,
+                "message": "該 Email 已被註冊"
+            })
 
-            # 密碼加密
-            hashed_password = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
-            
+        # 密碼加密（在 process pool 執行，期間不佔用資料庫連線）
+        hashed_password = await hash_password(password)
+
+        async with get_db_connection() as conn:
             # 插入新用戶
             insert_sql = "INSERT INTO users (name, email, password) VALUES (:name, :email, :password)"
-            conn.execute(text(insert_sql), {
+            await conn.execute(text(insert_sql), {
                 "name": name,
                 "email": email,
                 "password": hashed_password
             })
             
             # 提交事務
-            conn.commit()
+            await conn.commit()
 
         return {"ok": True}
 
+    except PasswordServiceBusy as e:
+        return busy_response(e)
+
     except Exception as e:
-        return JSONResponse(status_code=500, content={
+        return ORJSONResponse(status_code=500, content={
             "error": True,
             "message": f"伺服器錯誤: {str(e)}"
         })
 
-@router.get("/api/user/auth")
-def get_user_auth(request: Request):
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        return JSONResponse(content={"data": None}, status_code=401)
-    
-    token = auth_header.split("Bearer ")[1]
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload.get("user_id")
-        if not user_id:
-            return JSONResponse(content={"data": None}, status_code=401)
-    except (ExpiredSignatureError, InvalidTokenError):
-        return JSONResponse(content={"data": None}, status_code=401)
-
-    # 使用 with 語句從 connection pool 獲取連線
-    with get_db_connection() as conn:
-        # 使用 SQLAlchemy text 執行查詢
-        sql = "SELECT id, name, email FROM users WHERE id = :user_id"
-        result = conn.execute(text(sql), {"user_id": user_id})
-        user = result.fetchone()
-
+@router.get("/api/user/auth", responses={200: {"model": UserAuth}})
+async def get_user_auth(user = Depends(current_user)):
     if not user:
-        return JSONResponse(content={"data": None}, status_code=401)
+        return ORJSONResponse(content={"data": None}, status_code=401)
     
-    return JSONResponse(
-        content={"data": {
-            "id": user.id,  # 使用點記法存取欄位
-            "name": user.name,
-            "email": user.email
-        }},
-        status_code=200
-    )
+    return ORJSONResponse(content={"data": user}, status_code=200)
 
 @router.put("/api/user/auth")
 async def put_user_auth(request: Request):
@@ -251,32 +459,43 @@ async def put_user_auth(request: Request):
         password = data.get("password", "").strip()
 
         if not email or not password:
-            return JSONResponse(status_code=400, content={
+            return ORJSONResponse(status_code=400, content={
                 "error": True,
                 "message": "請提供 Email 和密碼"
             })
 
         email_pattern = r"^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$"
         if not re.match(email_pattern, email):
-            return JSONResponse(status_code=400, content={
+            return ORJSONResponse(status_code=400, content={
                 "error": True,
                 "message": "請輸入有效的 Email 格式"
             })
 
         # 使用 with 語句從 connection pool 獲取連線
-        with get_db_connection() as conn:
+        async with get_db_connection() as conn:
             # 查詢用戶
             sql = "SELECT id, name, email, password FROM users WHERE email = :email"
-            result = conn.execute(text(sql), {"email": email})
+            result = await conn.execute(text(sql), {"email": email})
             user = result.fetchone()
 
         # 檢查用戶是否存在及密碼是否正確
-        if not user or not bcrypt.checkpw(password.encode("utf-8"), user.password.encode("utf-8")):
-            return JSONResponse(status_code=400, content={
+        if not user or not await verify_password(password, user.password):
+            return ORJSONResponse(status_code=400, content={
                 "error": True,
                 "message": "Email 或密碼錯誤"
             })
 
+        # 雜湊成本設定變更後，登入時順便以新成本重新雜湊
+        if needs_rehash(user.password):
+            new_hash = await hash_password(password)
+            async with get_db_connection() as conn:
+                await conn.execute(text("UPDATE users SET password = :password WHERE id = :user_id"), {
+                    "password": new_hash,
+                    "user_id": user.id
+                })
+                await conn.commit()
+            invalidate_user(user.id)
+
         # 生成 JWT token
         expiration = datetime.utcnow() + timedelta(days=TOKEN_EXPIRE_DAYS)
         payload = {
@@ -285,49 +504,39 @@ async def put_user_auth(request: Request):
         }
         token = jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
 
-        return JSONResponse(status_code=200, content={
+        return ORJSONResponse(status_code=200, content={
             "data": {"token": token}
         })
 
+    except PasswordServiceBusy as e:
+        return busy_response(e)
+
     except Exception as e:
-        return JSONResponse(status_code=500, content={
+        return ORJSONResponse(status_code=500, content={
             "error": True,
             "message": f"伺服器錯誤: {str(e)}"
         })
 
-@router.get("/api/booking")
-def get_booking(request: Request):
-    token = request.headers.get("Authorization")
-    if not token or not token.startswith("Bearer "):
-        return JSONResponse(status_code=403, content={"error": True, "message": "為提供授權 token"})
-    
-    try:
-        payload = jwt.decode(token.split("Bearer ")[1], SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload["user_id"]
-    except (ExpiredSignatureError, InvalidTokenError):
-        return JSONResponse(status_code=403, content={"error": True, "message": "無效或過期的 token"})
-    
+@router.get("/api/booking", responses={200: {"model": BookingResponse}})
+async def get_booking(user_id: int = Depends(current_user_id)):
     # 使用 with 語句從 connection pool 獲取連線
-    with get_db_connection() as conn:
+    async with get_db_connection() as conn:
         # 查詢預訂資訊
         sql = """
-            SELECT b.attraction_id, b.date, b.time, b.price, a.name, a.address, GROUP_CONCAT(ai.image_url) AS images
+            SELECT b.attraction_id, b.date, b.time, b.price, a.name, a.address, a.first_image
             FROM booking b
-            JOIN attractions a ON b.attraction_id = a.id
-            LEFT JOIN attraction_images ai ON a.id = ai.attraction_id
+            JOIN attraction_read a ON b.attraction_id = a.id
             WHERE b.user_id = :user_id
-            GROUP BY b.attraction_id, b.date, b.time, b.price, a.name, a.address
         """
-        result = conn.execute(text(sql), {"user_id": user_id})
+        result = await conn.execute(text(sql), {"user_id": user_id})
         booking = result.fetchone()
 
     if not booking:
-        return JSONResponse(status_code=200, content={"data": None})
+        return ORJSONResponse(status_code=200, content={"data": None})
     
-    # 處理圖片 URL
-    image_url = booking.images.split(",")[0] if booking.images else None
+    image_url = booking.first_image
     
-    return JSONResponse(status_code=200, content={
+    return ORJSONResponse(status_code=200, content={
         "data": {
             "attraction": {
                 "id": booking.attraction_id,
@@ -342,17 +551,7 @@ def get_booking(request: Request):
     })
 
 @router.post("/api/booking")
-async def post_booking(request: Request):
-    token = request.headers.get("Authorization")
-    if not token or not token.startswith("Bearer "):
-        return JSONResponse(status_code=403, content={"error": True, "message": "為提供授權 token"})
-    
-    try:
-        payload = jwt.decode(token.split("Bearer ")[1], SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload["user_id"]
-    except (ExpiredSignatureError, InvalidTokenError):
-        return JSONResponse(status_code=403, content={"error": True, "message": "無效或過期的 token"})
-    
+async def post_booking(request: Request, user_id: int = Depends(current_user_id)):
     try:
         data = await request.json()
         attraction_id = data.get("attractionId")
@@ -361,26 +560,27 @@ async def post_booking(request: Request):
         price = data.get("price")
 
         if not all([attraction_id, date, time, price]):
-            return JSONResponse(status_code=400, content={"error": True, "message": "預定資料不完整"})
+            return ORJSONResponse(status_code=400, content={"error": True, "message": "預定資料不完整"})
+
+        if time not in inventory.TIMES:
+            return ORJSONResponse(status_code=400, content={"error": True, "message": "無效的時段"})
+
+        # 預定行程不佔名額，只先擋掉已額滿的時段；名額在下單時才佔用
+        counters = await inventory.get_counters(attraction_id)
+        if inventory.remaining(counters, date, time) <= 0:
+            return ORJSONResponse(status_code=400, content={"error": True, "message": "此時段已額滿"})
         
         # 使用 with 語句從 connection pool 獲取連線
-        with get_db_connection() as conn:
+        async with get_db_connection() as conn:
             # 檢查景點是否存在
             check_sql = "SELECT id FROM attractions WHERE id = :attraction_id"
-            result = conn.execute(text(check_sql), {"attraction_id": attraction_id})
+            result = await conn.execute(text(check_sql), {"attraction_id": attraction_id})
             if not result.fetchone():
-                return JSONResponse(status_code=400, content={"error": True, "message": "無效的景點的 ID"})
+                return ORJSONResponse(status_code=400, content={"error": True, "message": "無效的景點的 ID"})
             
             # 插入或更新預訂
-            insert_sql = """
-                INSERT INTO booking (user_id, attraction_id, date, time, price)
-                VALUES (:user_id, :attraction_id, :date, :time, :price)
-                ON DUPLICATE KEY UPDATE attraction_id = VALUES(attraction_id),
-                                        date = VALUES(date),
-                                        time = VALUES(time),
-                                        price = VALUES(price)
-            """
-            conn.execute(text(insert_sql), {
+            insert_sql = BOOKING_UPSERT[DIALECT]
+            await conn.execute(text(insert_sql), {
                 "user_id": user_id,
                 "attraction_id": attraction_id,
                 "date": date,
@@ -389,62 +589,99 @@ async def post_booking(request: Request):
             })
 
             # 提交事務
-            conn.commit()
+            await conn.commit()
+        mark_written(user_id)
 
-        return JSONResponse(status_code=200, content={"ok": True})
+        return ORJSONResponse(status_code=200, content={"ok": True})
     
     except Exception as e:
-        return JSONResponse(status_code=500, content={"error": True, "message": f"伺服器錯誤: {str(e)}"})
+        return ORJSONResponse(status_code=500, content={"error": True, "message": f"伺服器錯誤: {str(e)}"})
     
 @router.delete("/api/booking")
-def delete_booking(request: Request):
-    token = request.headers.get("Authorization")
-    if not token or not token.startswith("Bearer "):
-        return JSONResponse(status_code=403, content={"error": True, "message": "未提供授權 token"})
-
-    try:
-        payload = jwt.decode(token.split("Bearer ")[1], SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload["user_id"]
-    except (ExpiredSignatureError, InvalidTokenError):
-        return JSONResponse(status_code=403, content={"error": True, "message": "無效或過期的 token"})
-    
+async def delete_booking(user_id: int = Depends(current_user_id)):
     try:
         # 使用 with 語句從 connection pool 獲取連線
-        with get_db_connection() as conn:
+        async with get_db_connection() as conn:
             # 刪除預訂
             delete_sql = "DELETE FROM booking WHERE user_id = :user_id"
-            conn.execute(text(delete_sql), {"user_id": user_id})
+            await conn.execute(text(delete_sql), {"user_id": user_id})
             
             # 提交事務
-            conn.commit()
+            await conn.commit()
+        mark_written(user_id)
 
-        return JSONResponse(status_code=200, content={"ok": True})
+        return ORJSONResponse(status_code=200, content={"ok": True})
     
     except Exception as e:
-        return JSONResponse(status_code=500, content={"error": True, "message": f"伺服器錯誤: {str(e)}"})
+        return ORJSONResponse(status_code=500, content={"error": True, "message": f"伺服器錯誤: {str(e)}"})
 
 #建立訂單並付款的 API
 @router.post("/api/orders")
-async def create_order(request: Request):
+async def create_order(request: Request, user_id: int = Depends(current_user_id)):
+    try:
+        body = await request.json()
+    except ValueError:
+        return ORJSONResponse(status_code=400, content={"error": True, "message": "訂單資料不完整"})
+    # 內容必須是 JSON 物件，否則無法計算 Idempotency-Key 的指紋與讀取欄位
+    if not isinstance(body, dict) or not isinstance(body.get("order"), dict):
+        return ORJSONResponse(status_code=400, content={"error": True, "message": "訂單資料不完整"})
+
+    key = request.headers.get("Idempotency-Key")
+    if not key:
+        return await place_order(body, user_id)
+    if len(key) > idempotency.MAX_KEY_LENGTH:
+        return ORJSONResponse(status_code=400, content={"error": True, "message": "Idempotency-Key 過長"})
+
+    # prime 每次向 TapPay 取得都不同，只以訂單內容判斷是否為同一個請求
     try:
-        token = request.headers.get("Authorization")
-        if not token or not token.startswith("Bearer "):
-            return JSONResponse(status_code=403, content={"error": True, "message": "未登入系統，拒絕存取"})
+        stored = await idempotency.claim(user_id, key, idempotency.fingerprint(body.get("order")))
+    except idempotency.IdempotencyConflict as e:
+        return ORJSONResponse(status_code=422, content={"error": True, "message": str(e)})
+    except idempotency.RequestInProgress as e:
+        return ORJSONResponse(status_code=409, headers={"Retry-After": "1"}, content={"error": True, "message": str(e)})
+    except Exception as e:
+        return ORJSONResponse(status_code=500, content={"error": True, "message": str(e)})
 
-        try:
-            payload = jwt.decode(token.split("Bearer ")[1], SECRET_KEY, algorithms=[ALGORITHM])
-            user_id = payload["user_id"]
-        except Exception:
-            return JSONResponse(status_code=403, content={"error": True, "message": "登入憑證錯誤"})
+    if stored is not None:
+        status_code, content = stored
+        return ORJSONResponse(status_code=status_code, content=content, headers={"Idempotent-Replayed": "true"})
 
-        body = await request.json()
+    response = await place_order(body, user_id, idem_key=key)
+    try:
+        if response.status_code >= 500:
+            await idempotency.release(user_id, key)
+        else:
+            await idempotency.complete(user_id, key, response.status_code, response.body)
+    except Exception:
+        # 回應已經決定，保存失敗只影響之後的重送
+        logger.exception("Idempotency-Key 回應保存失敗")
+    return response
+
+def order_result(order_number, payment_status, message):
+    return {
+        "data": {
+            "number": str(order_number),
+            "payment": {
+                "status": payment_status,
+                "message": message
+            }
+        }
+    }
+
+def order_response(order_number, payment_status, message):
+    return ORJSONResponse(status_code=200, content=order_result(order_number, payment_status, message))
+
+async def place_order(body, user_id, idem_key=None):
+    try:
         prime = body.get("prime")
-        order = body.get("order", {})
+        order = body["order"]
         price = order.get("price")
-        trip = order.get("trip", {})
-        contact = order.get("contact", {})
+        trip = order.get("trip")
+        contact = order.get("contact")
+        attraction = trip.get("attraction") if isinstance(trip, dict) else None
+        if not all(isinstance(part, dict) for part in (trip, contact, attraction)):
+            return ORJSONResponse(status_code=400, content={"error": True, "message": "訂單資料不完整"})
 
-        attraction = trip.get("attraction", {})
         attraction_id = attraction.get("id")
         date = trip.get("date")
         time = trip.get("time")
@@ -453,132 +690,175 @@ async def create_order(request: Request):
         phone = contact.get("phone")
 
         if not all([prime, price, attraction_id, date, time, name, email, phone]):
-            return JSONResponse(status_code=400, content={"error": True, "message": "訂單資料不完整"})
+            return ORJSONResponse(status_code=400, content={"error": True, "message": "訂單資料不完整"})
+
+        if time not in inventory.TIMES:
+            return ORJSONResponse(status_code=400, content={"error": True, "message": "無效的時段"})
 
         try:
             selected_date = datetime.strptime(date, "%Y-%m-%d").date()
             today = datetime.today().date()
             if selected_date < today:
-                return JSONResponse(status_code=400, content={"error": True, "message": "請選擇今天或未來的日期"})
+                return ORJSONResponse(status_code=400, content={"error": True, "message": "請選擇今天或未來的日期"})
         except Exception:
-            return JSONResponse(status_code=400, content={"error": True, "message": "無效的日期格式"})
+            return ORJSONResponse(status_code=400, content={"error": True, "message": "無效的日期格式"})
 
         email_pattern = r"^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$"
         phone_pattern = r"^09\d{8}$"
 
         if not re.match(email_pattern, email):
-            return JSONResponse(status_code=400, content={"error": True, "message": "聯絡人 Email 格式錯誤"})
+            return ORJSONResponse(status_code=400, content={"error": True, "message": "聯絡人 Email 格式錯誤"})
 
         if not re.match(phone_pattern, phone):
-            return JSONResponse(status_code=400, content={"error": True, "message": "聯絡人手機格式錯誤"})
-
-        order_number = datetime.now().strftime("%Y%m%d%H%M%S%f")[:-3]
-
-        with get_db_connection() as conn:
-            trans = conn.begin()
-            try:
-                result = conn.execute(
-                    text("""
-                        INSERT INTO orders (user_id, attraction_id, date, time, price, contact_name, contact_email, contact_phone, status, order_number)
-                        VALUES (:user_id, :attraction_id, :date, :time, :price, :name, :email, :phone, :status, :order_number)
-                    """),
-                    {
-                        "user_id": user_id,
-                        "attraction_id": attraction_id,
-                        "date": date,
-                        "time": time,
-                        "price": price,
-                        "name": name,
-                        "email": email,
-                        "phone": phone,
-                        "status": "UNPAID",
-                        "order_number": order_number
-                    }
-                )
-                order_id = result.lastrowid
-
-                tappay_payload = {
-                    "prime": prime,
-                    "partner_key": PARTNER_KEY,
-                    "merchant_id": MERCHANT_KEY,
-                    "amount": price,
-                    "details": "Taipei Trip",
-                    "cardholder": {
-                        "phone_number": phone,
-                        "name": name,
-                        "email": email
-                    }
-                }
+            return ORJSONResponse(status_code=400, content={"error": True, "message": "聯絡人手機格式錯誤"})
 
-                tappay_response = requests.post(
-                    "https://sandbox.tappaysdk.com/tpc/payment/pay-by-prime",
-                    headers={"Content-Type": "application/json", "x-api-key": PARTNER_KEY},
-                    json=tappay_payload
-                )
-                tappay_result = tappay_response.json()
-                print("TapPay 回傳結果：", tappay_result)
+        order_number = next_order_number()
 
+        # 第一階段：佔用名額並建立 UNPAID 訂單後立即提交，付款期間不持有交易與連線
+        try:
+            async with get_db_connection() as conn:
+                async with conn.begin():
+                    await inventory.reserve(conn, attraction_id, date, time)
+                    result = await conn.execute(
+                        text("""
+                            INSERT INTO orders (user_id, attraction_id, date, time, price, contact_name, contact_email, contact_phone, status, order_number)
+                            VALUES (:user_id, :attraction_id, :date, :time, :price, :name, :email, :phone, :status, :order_number)
+                        """),
+                        {
+                            "user_id": user_id,
+                            "attraction_id": attraction_id,
+                            "date": date,
+                            "time": time,
+                            "price": price,
+                            "name": name,
+                            "email": email,
+                            "phone": phone,
+                            "status": payment.UNPAID,
+                            "order_number": order_number
+                        }
+                    )
+                    order_id = result.lastrowid
+                    if idem_key:
+                        # 與訂單在同一個交易中保存，重送相同 key 時只會拿到這筆訂單
+                        await idempotency.save_pending(conn, user_id, idem_key, order_result(order_number, -1, "付款結果確認中"))
+        except (inventory.SoldOut, inventory.UnknownAttraction) as e:
+            return ORJSONResponse(status_code=400, content={"error": True, "message": str(e)})
+        mark_written(user_id)
+    except Exception as e:
+        # 訂單尚未建立，客戶端可以重試
+        return ORJSONResponse(status_code=500, content={"error": True, "message": str(e)})
+
+    # 訂單已建立：之後任何錯誤都回傳訂單編號與付款結果未知，不再回應 500
+    # 付款請求已送出卻不知道結果時，訂單轉為 UNKNOWN，確認交易結果前不釋放名額
+    try:
+        # 第二階段：呼叫 TapPay
+        try:
+            tappay_result = await payment.pay_by_prime(prime, price, phone, name, email, str(order_number))
+        except payment.TapPayError as e:
+            await payment.mark_unknown(order_id, order_number)
+            return order_response(order_number, -1, str(e))
+
+        # 第三階段：依付款結果轉換訂單狀態，付款成功時一併刪除預定行程，失敗時釋放名額
+        async with get_db_connection() as conn:
+            async with conn.begin():
                 if tappay_result.get("status") == 0:
-                    conn.execute(text("UPDATE orders SET status='PAID' WHERE id=:order_id"), {"order_id": order_id})
-                    conn.execute(text("DELETE FROM booking WHERE user_id = :user_id"), {"user_id": user_id})
+                    await payment.transition(conn, order_id, payment.UNPAID, payment.PAID)
+                    await conn.execute(text("DELETE FROM booking WHERE user_id = :user_id"), {"user_id": user_id})
                     payment_status = 0
                     message = "付款成功"
                 else:
+                    await payment.transition(conn, order_id, payment.UNPAID, payment.FAILED)
+                    await inventory.release(conn, attraction_id, date, time)
                     payment_status = tappay_result.get("status")
                     message = "付款失敗"
+    except Exception:
+        # TapPay 可能已經扣款（例如付款成功後更新訂單失敗）
+        logger.exception("訂單 %s 付款處理失敗", order_number)
+        await payment.mark_unknown(order_id, order_number)
+        return order_response(order_number, -1, "付款結果確認中")
+
+    return order_response(order_number, payment_status, message)
+
+
+# 會員的歷史訂單，依建立時間由新到舊，以 (created, id) 做 keyset 分頁
+@router.get("/api/orders", responses={200: {"model": OrderHistory}})
+async def get_orders(cursor: str = Query(None, alias="cursor"), user_id: int = Depends(current_user_id)):
+    per_page = 10
+    params = {"user_id": user_id, "limit": per_page + 1}
+    condition = ""
+    if cursor:
+        try:
+            key = decode_cursor(cursor, "created", 2)
+        except ValueError as e:
+            return ORJSONResponse(status_code=400, content={"error": True, "message": str(e)})
+        if not isinstance(key[0], str):
+            return ORJSONResponse(status_code=400, content={"error": True, "message": "無效的 cursor"})
+        params["after_created"], params["after_id"] = key
+        # 多加一個 created <= 的條件，讓 (user_id, created) 索引可以直接做範圍掃描
+        condition = "AND o.created <= :after_created AND (o.created < :after_created OR o.id < :after_id)"
 
-                trans.commit()
-
-            except Exception as e:
-                trans.rollback()
-                raise e
-
-        return JSONResponse(status_code=200, content={
-            "data": {
-                "number": str(order_number),
-                "payment": {
-                    "status": payment_status,
-                    "message": message
-                }
+    try:
+        async with get_read_connection(user_id) as conn:
+            # 走 (user_id, created) 索引，依序取出後只 JOIN 這一頁的景點
+            rows = (await conn.execute(text(f"""
+                SELECT o.id, o.order_number, o.price, o.date, o.time, o.status, o.created,
+                       a.id AS attraction_id, a.name, a.address, a.first_image AS image
+                FROM orders o
+                JOIN attraction_read a ON o.attraction_id = a.id
+                WHERE o.user_id = :user_id {condition}
+                ORDER BY o.created DESC, o.id DESC
+                LIMIT :limit
+            """), params)).fetchall()
+
+        has_more = len(rows) > per_page
+        rows = rows[:per_page]
+        orders = [
+            {
+                "number": row.order_number,
+                "price": row.price,
+                "trip": {
+                    "attraction": {
+                        "id": row.attraction_id,
+                        "name": row.name,
+                        "address": row.address,
+                        "image": row.image
+                    },
+                    "date": row.date.strftime("%Y-%m-%d") if hasattr(row.date, "strftime") else row.date,
+                    "time": row.time
+                },
+                "status": 1 if row.status == payment.PAID else 0,
+                "created": str(row.created)
             }
-        })
+            for row in rows
+        ]
+        next_cursor = encode_cursor((str(rows[-1].created), rows[-1].id), "created") if has_more else None
+        return ORJSONResponse({"nextCursor": next_cursor, "data": orders})
 
     except Exception as e:
-        return JSONResponse(status_code=500, content={"error": True, "message": str(e)})
-
+        return ORJSONResponse(status_code=500, content={"error": True, "message": str(e)})
 
 # 取得訂單資訊的 API
 @router.get("/api/order/{order_number}")
-def get_order(order_number: str, request: Request):
+async def get_order(order_number: str, user_id: int = Depends(current_user_id)):
     try:
-        token = request.headers.get("Authorization")
-        if not token or not token.startswith("Bearer "):
-            return JSONResponse(status_code=403, content={"error": True, "message": "未登入系統"})
-
-        try:
-            payload = jwt.decode(token.split("Bearer ")[1], SECRET_KEY, algorithms=[ALGORITHM])
-            user_id = payload["user_id"]
-        except Exception:
-            return JSONResponse(status_code=403, content={"error": True, "message": "登入憑證錯誤"})
-
-        with get_db_connection() as conn:
+        # 剛下單的使用者會被導回主資料庫，避免副本還沒收到訂單
+        async with get_read_connection(user_id) as conn:
             query = text("""
                 SELECT o.id, o.price, o.date, o.time, o.contact_name, o.contact_email, o.contact_phone, o.status,
-                       a.id AS attraction_id, a.name, a.address,
-                       (SELECT image_url FROM attraction_images WHERE attraction_id = a.id LIMIT 1) AS image
+                       a.id AS attraction_id, a.name, a.address, a.first_image AS image
                 FROM orders o
-                JOIN attractions a ON o.attraction_id = a.id
+                JOIN attraction_read a ON o.attraction_id = a.id
                 WHERE o.order_number = :order_number AND o.user_id = :user_id
             """)
-            result = conn.execute(query, {
+            result = (await conn.execute(query, {
                 "order_number": order_number,
                 "user_id": user_id
-            }).fetchone()
+            })).fetchone()
 
             if not result:
-                return JSONResponse(status_code=200, content={"data": None})
+                return ORJSONResponse(status_code=200, content={"data": None})
 
-            return JSONResponse(status_code=200, content={
+            return ORJSONResponse(status_code=200, content={
                 "data": {
                     "number": str(order_number),
                     "price": result.price,
@@ -597,9 +877,9 @@ def get_order(order_number: str, request: Request):
                         "email": result.contact_email,
                         "phone": result.contact_phone
                     },
-                    "status": 1 if result.status == "PAID" else 0
+                    "status": 1 if result.status == payment.PAID else 0
                 }
             })
 
     except Exception as e:
-        return JSONResponse(status_code=500, content={"error": True, "message": str(e)})
+        return ORJSONResponse(status_code=500, content={"error": True, "message": str(e)})
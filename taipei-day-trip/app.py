@@ -1,24 +1,128 @@
+import time
+_import_started = time.perf_counter()
+
+from contextlib import asynccontextmanager
 from fastapi import *
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, ORJSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
 from api import router
+from auth import AuthError, auth_error_handler
+from compression import CompressionMiddleware
+from http_cache import catalog_cache_middleware
+from ratelimit import rate_limit_middleware
+from pages import templates, render_index, render_attraction
+import metrics
+from catalog import get_catalog, refresh_catalog
+from config import (CATALOG_REFRESH_SECONDS, COMPRESSION_MIN_SIZE, REPLICA_CHECK_SECONDS, ORDER_EXPIRE_CHECK_SECONDS,
+                    IDEMPOTENCY_PURGE_SECONDS)
+from startup import StartupReport, warm_up
+import database
+import idempotency
+import passwords
+import payment
+import asyncio
+
+IMPORT_SECONDS = time.perf_counter() - _import_started
+
+# **定期檢查景點目錄版本號**
+async def catalog_refresher():
+    while True:
+        await asyncio.sleep(CATALOG_REFRESH_SECONDS)
+        try:
+            await refresh_catalog()
+        except Exception as e:
+            print("景點目錄更新失敗：", e)
+
+# **定期檢查唯讀副本的連線與延遲，不健康時讀取改走主資料庫**
+async def replica_monitor():
+    while True:
+        try:
+            await database.check_replicas()
+        except Exception as e:
+            print("唯讀副本檢查失敗：", e)
+        await asyncio.sleep(REPLICA_CHECK_SECONDS)
+
+# **定期將逾時未付款的訂單轉為付款失敗並釋放名額**
+async def order_expirer():
+    while True:
+        await asyncio.sleep(ORDER_EXPIRE_CHECK_SECONDS)
+        try:
+            await payment.expire_unpaid_orders()
+        except Exception as e:
+            print("逾時訂單處理失敗：", e)
+
+# **定期清除過期的 Idempotency-Key**
+async def idempotency_purger():
+    while True:
+        await asyncio.sleep(IDEMPOTENCY_PURGE_SECONDS)
+        try:
+            await idempotency.purge_expired()
+        except Exception as e:
+            print("Idempotency-Key 清除失敗：", e)
+
+# **啟動後在背景預熱（見 startup.py），關閉時停止背景工作並釋放資源**
+@asynccontextmanager
+async def lifespan(app):
+    report = StartupReport()
+    report.record("匯入模組", IMPORT_SECONDS)
+    app.state.startup = report
+
+    tasks = [asyncio.create_task(warm_up(report)), asyncio.create_task(catalog_refresher()),
+             asyncio.create_task(order_expirer()), asyncio.create_task(idempotency_purger())]
+    if database.replicas:
+        tasks.append(asyncio.create_task(replica_monitor()))
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+        passwords.shutdown()
+        await payment.close_client()
+        await database.dispose_engines()
 
-app=FastAPI()
+app=FastAPI(lifespan=lifespan)
 app.include_router(router)
+app.add_exception_handler(AuthError, auth_error_handler)
+
+# 景點目錄 API 的 ETag / 304 處理，外層再做回應壓縮
+app.middleware("http")(catalog_cache_middleware)
+app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+# 限流與負載保護在壓縮與路由之前，被拒絕的請求不會取用資料庫連線
+app.middleware("http")(rate_limit_middleware)
+# 最外層記錄每個請求的延遲與 SQL 數
+app.middleware("http")(metrics.metrics_middleware)
+
+# **Prometheus 指標**
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# **就緒檢查：預熱完成前回應 503，並回傳各啟動步驟的耗時**
+@app.get("/ready", include_in_schema=False)
+async def ready(request: Request):
+    report = getattr(request.app.state, "startup", None)
+    if report is None:
+        return ORJSONResponse(status_code=503, content={"ready": False})
+    catalog = get_catalog()
+    content = {
+        **report.to_dict(),
+        "catalog": catalog.version if catalog is not None else None,
+        "replicas": database.replica_status(),
+    }
+    return ORJSONResponse(status_code=200 if report.ready else 503, content=content)
 
 # **提供靜態檔案（CSS、JS、圖片）**
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
-templates = Jinja2Templates(directory="templates")
-
-# Static Pages (Never Modify Code in this Block)
+# **首頁與景點頁由伺服器端渲染第一屏內容（見 pages.py）**
 @app.get("/", include_in_schema=False)
-async def index(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+async def index():
+    return render_index()
 @app.get("/attraction/{id}", include_in_schema=False)
-async def attraction(request: Request):
-	return templates.TemplateResponse("attraction.html", {"request":request})
+async def attraction(id: int):
+    return render_attraction(id)
+
+# Static Pages (Never Modify Code in this Block)
 @app.get("/booking", include_in_schema=False)
 async def booking(request: Request):
     return templates.TemplateResponse("booking.html", {"request": request})
@@ -0,0 +1,92 @@
+# 共用的登入驗證：解析 Authorization header，驗證過的 token 與使用者資料都有快取
+import time
+import jwt
+from fastapi import Request
+from fastapi.responses import ORJSONResponse
+from jwt.exceptions import InvalidTokenError
+from sqlalchemy import text
+from cache import TTLCache
+from config import SECRET_KEY, ALGORITHM, TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL, USER_CACHE_SIZE, USER_CACHE_TTL
+from database import get_read_connection
+
+
+class AuthError(Exception):
+    """未登入或 token 無效，由 auth_error_handler 轉成 403 回應"""
+
+
+async def auth_error_handler(request: Request, exc: AuthError):
+    return ORJSONResponse(status_code=403, content={"error": True, "message": str(exc)})
+
+
+# token → user_id，到期時間不超過 token 本身的 exp
+_tokens = TTLCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL)
+# user_id → {"id", "name", "email"}
+_users = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+
+def bearer_token(request: Request):
+    header = request.headers.get("Authorization")
+    if not header or not header.startswith("Bearer "):
+        return None
+    return header[len("Bearer "):]
+
+
+def verify_token(token):
+    """回傳 token 中的 user_id，無效或過期時回傳 None"""
+    user_id = _tokens.get(token)
+    if user_id is not None:
+        return user_id
+
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except InvalidTokenError:
+        return None
+    user_id = payload.get("user_id")
+    if not user_id:
+        return None
+
+    _tokens.set(token, user_id, expires_at=payload.get("exp", time.time()))
+    return user_id
+
+
+async def get_user_profile(user_id):
+    user = _users.get(user_id)
+    if user is not None:
+        return user
+
+    async with get_read_connection(user_id) as conn:
+        result = await conn.execute(text("SELECT id, name, email FROM users WHERE id = :user_id"), {"user_id": user_id})
+        row = result.fetchone()
+    if not row:
+        return None
+
+    user = {"id": row.id, "name": row.name, "email": row.email}
+    _users.set(user_id, user)
+    return user
+
+
+def invalidate_user(user_id):
+    # 使用者資料變更時呼叫
+    _users.pop(user_id)
+
+
+async def current_user_id(request: Request) -> int:
+    """需要登入的 API 使用：回傳 user_id，未登入時拋出 AuthError"""
+    token = bearer_token(request)
+    if not token:
+        raise AuthError("未登入系統，拒絕存取")
+    user_id = verify_token(token)
+    if user_id is None:
+        raise AuthError("無效或過期的 token")
+    return user_id
+
+
+async def current_user(request: Request):
+    """回傳登入中的使用者資料，未登入時回傳 None"""
+    token = bearer_token(request)
+    if not token:
+        return None
+    user_id = verify_token(token)
+    if user_id is None:
+        return None
+    return await get_user_profile(user_id)
@@ -0,0 +1,84 @@
+# 批次請求：前端一次送出多個唯讀 API 請求，伺服器端同時執行後合併成一個回應，減少頁面載入時的 HTTP 往返
+# 每個子請求都經過完整的 app（含限流、指標、驗證），行為與直接呼叫該 API 相同
+import asyncio
+import re
+from urllib.parse import urlsplit
+import orjson
+from fastapi import Request
+from config import BATCH_MAX_REQUESTS
+
+# 只允許唯讀的 GET API，不能巢狀呼叫 /api/batch
+ALLOWED_PATH = re.compile(r"^/api/(?!batch$)[\w/-]+$")
+# 子請求沿用批次請求的這些標頭（登入 token 等）
+FORWARDED_HEADERS = {b"host", b"authorization", b"x-forwarded-for", b"accept-language"}
+
+
+class BatchError(ValueError):
+    """批次請求的格式錯誤"""
+
+
+def parse_requests(body):
+    """檢查請求內容，回傳 [(id, path, query)]"""
+    items = body.get("requests") if isinstance(body, dict) else None
+    if not isinstance(items, list) or not items:
+        raise BatchError("批次請求內容不完整")
+    if len(items) > BATCH_MAX_REQUESTS:
+        raise BatchError(f"一次最多 {BATCH_MAX_REQUESTS} 個請求")
+
+    parsed = []
+    for index, item in enumerate(items):
+        url = item.get("url") if isinstance(item, dict) else None
+        if not isinstance(url, str):
+            raise BatchError("每個請求都需要 url")
+        parts = urlsplit(url)
+        if parts.scheme or parts.netloc or not ALLOWED_PATH.match(parts.path):
+            raise BatchError(f"不支援的請求：{url}")
+        parsed.append((item.get("id", index), parts.path, parts.query))
+    return parsed
+
+
+async def dispatch(parent: Request, path, query):
+    """在同一個 process 內以 ASGI 呼叫 app，回傳 (狀態碼, 回應內容)"""
+    scope = {
+        "type": "http",
+        "asgi": parent.scope.get("asgi", {"version": "3.0"}),
+        "http_version": parent.scope.get("http_version", "1.1"),
+        "method": "GET",
+        "scheme": parent.scope.get("scheme", "http"),
+        "server": parent.scope.get("server"),
+        "client": parent.scope.get("client"),
+        "root_path": parent.scope.get("root_path", ""),
+        "path": path,
+        "raw_path": path.encode("utf-8"),
+        "query_string": query.encode("utf-8"),
+        "headers": [(name, value) for name, value in parent.scope["headers"] if name in FORWARDED_HEADERS],
+    }
+    status = 500
+    chunks = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    try:
+        await parent.app(scope, receive, send)
+    except Exception as e:
+        # 未處理的例外已由 app 回應 500，這裡只讓其他子請求照常回傳
+        return 500, {"error": True, "message": f"伺服器錯誤: {str(e)}"}
+    content = b"".join(chunks)
+    try:
+        return status, orjson.loads(content) if content else None
+    except orjson.JSONDecodeError:
+        return status, content.decode("utf-8", "replace")
+
+
+async def execute(parent: Request, requests):
+    results = await asyncio.gather(*(dispatch(parent, path, query) for _, path, query in requests))
+    return [{"id": request_id, "status": status, "body": body}
+            for (request_id, _, _), (status, body) in zip(requests, results)]
@@ -0,0 +1,446 @@
+# API 壓測：以 SQLite 建立測試資料（景點資料可放大 N 倍），在同一個 process 內透過 ASGI 直接呼叫每個路由，
+# 回報吞吐量、p50/p95/p99 延遲與每個請求的 SQL 查詢數，並可與 JSON 基準檔比較找出效能退步
+#
+# 用法：
+#   python benchmark.py --scale 10 --concurrency 20 --requests 500 --save-baseline bench_baseline.json
+#   python benchmark.py --scale 10 --concurrency 20 --requests 500 --baseline bench_baseline.json
+import argparse
+import asyncio
+import contextvars
+import datetime
+import json
+import math
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+SOURCE_PATH = "data/taipei-attractions.json"
+BENCH_PASSWORD = "bench-password"
+
+
+# **建立壓測資料庫**
+def seed(path, scale, users):
+    import bcrypt
+    from sqlalchemy import create_engine
+    from config import BCRYPT_ROUNDS
+    from insert_data import iter_results, parse_item
+    from migrations import migrate
+
+    if os.path.exists(path):
+        os.remove(path)
+    # 與正式環境相同的資料表與索引
+    schema_engine = create_engine(f"sqlite:///{path}")
+    with schema_engine.connect() as conn:
+        migrate(conn)
+    schema_engine.dispose()
+
+    db = sqlite3.connect(path)
+    db.execute("PRAGMA journal_mode=WAL")  # 讓讀取不被寫入擋住
+
+    items = [parse_item(item) for item in iter_results(SOURCE_PATH)]
+    attraction_id = 0
+    for copy in range(scale):
+        for record, images in items:
+            attraction_id += 1
+            name = record["name"] if copy == 0 else f"{record['name']} {copy + 1}"
+            row = (attraction_id, f"{record['serial_no']}-{copy}", name, record["category"], record["description"],
+                   record["address"], record["transport"], record["mrt"], record["lat"], record["lng"])
+            db.execute("""
+                INSERT INTO attractions (id, serial_no, name, category, description, address, transport, mrt, lat, lng)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, row)
+            db.executemany("INSERT INTO attraction_images (attraction_id, image_url) VALUES (?, ?)",
+                           [(attraction_id, url) for url in images])
+            db.execute("""
+                INSERT INTO attraction_read (id, name, category, description, address, transport, mrt, lat, lng, images, first_image)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (attraction_id, *row[2:], json.dumps(images, ensure_ascii=False), images[0] if images else None))
+    db.execute("INSERT INTO catalog_meta (id, version) VALUES (1, 1)")
+
+    # 所有壓測帳號共用同一組密碼雜湊
+    hashed = bcrypt.hashpw(BENCH_PASSWORD.encode("utf-8"), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode("utf-8")
+    db.executemany("INSERT INTO users (id, name, email, password) VALUES (?, ?, ?, ?)",
+                   [(i, f"bench{i}", f"bench{i}@example.com", hashed) for i in range(1, users + 1)])
+
+    # 每位使用者預先建立一筆訂單，供查詢訂單的情境使用
+    trip_date = (datetime.date.today() + datetime.timedelta(days=7)).isoformat()
+    db.executemany("""
+        INSERT INTO orders (order_number, user_id, attraction_id, date, time, price,
+                            contact_name, contact_email, contact_phone, status)
+        VALUES (?, ?, ?, ?, 'morning', 2000, ?, ?, '0912345678', 'PAID')
+    """, [(f"BENCH{i:08d}", i, 1 + i % attraction_id, trip_date, f"bench{i}", f"bench{i}@example.com")
+          for i in range(1, users + 1)])
+
+    db.commit()
+    db.close()
+    return attraction_id
+
+
+# **壓測情境：每個函式送出一個請求並回傳 response**
+def build_scenarios(ctx):
+    trip_date = (datetime.date.today() + datetime.timedelta(days=7)).isoformat()
+
+    def auth(worker):
+        return {"Authorization": f"Bearer {ctx['tokens'][worker % len(ctx['tokens'])]}"}
+
+    async def attractions_page(client, worker):
+        return await client.get("/api/attractions", params={"page": random.randrange(ctx["pages"])})
+
+    async def attractions_cursor(client, worker):
+        # 每個 worker 沿著 nextCursor 往下翻，翻到底再從頭開始
+        cursor = ctx["cursors"].get(worker)
+        response = await client.get("/api/attractions", params={"cursor": cursor} if cursor else {})
+        ctx["cursors"][worker] = response.json().get("nextCursor")
+        return response
+
+    async def attraction_detail(client, worker):
+        return await client.get(f"/api/attractions/{random.randint(1, ctx['attractions'])}")
+
+    async def mrts(client, worker):
+        return await client.get("/api/mrts")
+
+    async def keyword_search(client, worker):
+        return await client.get("/api/attractions", params={"keyword": random.choice(ctx["keywords"])})
+
+    async def faceted_search(client, worker):
+        params = {"category": random.choice(ctx["categories"]), "facets": "true"}
+        if worker % 2:
+            params["keyword"] = random.choice(ctx["keywords"])
+        return await client.get("/api/attractions", params=params)
+
+    async def attractions_by_ids(client, worker):
+        ids = random.sample(range(1, ctx["attractions"] + 1), min(6, ctx["attractions"]))
+        return await client.get("/api/attractions", params={"ids": ",".join(map(str, ids))})
+
+    async def nearby(client, worker):
+        # 以景點座標為中心（景點頁的附近景點）與常見的搜尋半徑
+        lat, lng = random.choice(ctx["points"])
+        params = {"lat": lat, "lng": lng, "radius": random.choice((500, 1000, 2000, 5000))}
+        return await client.get("/api/attractions/nearby", params=params)
+
+    async def index_page(client, worker):
+        return await client.get("/")
+
+    async def attraction_page(client, worker):
+        return await client.get(f"/attraction/{random.randint(1, ctx['attractions'])}")
+
+    async def availability(client, worker):
+        return await client.get(f"/api/attractions/{random.randint(1, ctx['attractions'])}/availability")
+
+    async def signup(client, worker):
+        ctx["signups"] += 1
+        email = f"signup{ctx['signups']}-{worker}@example.com"
+        return await client.post("/api/user", json={"name": "bench", "email": email, "password": BENCH_PASSWORD})
+
+    async def login(client, worker):
+        user = 1 + worker % ctx["users"]
+        return await client.put("/api/user/auth", json={"email": f"bench{user}@example.com", "password": BENCH_PASSWORD})
+
+    async def user_auth(client, worker):
+        return await client.get("/api/user/auth", headers=auth(worker))
+
+    async def booking_post(client, worker):
+        body = {"attractionId": random.randint(1, ctx["attractions"]), "date": trip_date, "time": "morning", "price": 2000}
+        return await client.post("/api/booking", json=body, headers=auth(worker))
+
+    async def booking_get(client, worker):
+        return await client.get("/api/booking", headers=auth(worker))
+
+    async def booking_delete(client, worker):
+        return await client.delete("/api/booking", headers=auth(worker))
+
+    async def batch_booking_page(client, worker):
+        # 預定頁載入時的使用者資料與預定行程合併成一個批次請求
+        body = {"requests": [{"url": "/api/user/auth"}, {"url": "/api/booking"}]}
+        return await client.post("/api/batch", json=body, headers=auth(worker))
+
+    async def order_create(client, worker, attraction_id=None, headers=None):
+        body = {
+            "prime": "bench-prime",
+            "order": {
+                "price": 2000,
+                "trip": {
+                    "attraction": {"id": attraction_id or random.randint(1, ctx["attractions"]), "name": "", "address": "", "image": ""},
+                    "date": trip_date,
+                    "time": "morning"
+                },
+                "contact": {"name": "bench", "email": "bench@example.com", "phone": "0912345678"}
+            }
+        }
+        return await client.post("/api/orders", json=body, headers={**auth(worker), **(headers or {})})
+
+    async def order_retry(client, worker):
+        # 同一個 Idempotency-Key 重送，應直接回放而不再呼叫 TapPay
+        # 每個 worker 的請求兩兩一組使用同一個 key 與相同內容
+        attempt = ctx["retries"].get(worker, 0)
+        ctx["retries"][worker] = attempt + 1
+        pair = attempt // 2
+        return await order_create(client, worker, attraction_id=1 + pair % ctx["attractions"],
+                                  headers={"Idempotency-Key": f"bench-{worker}-{pair}"})
+
+    async def order_history(client, worker):
+        return await client.get("/api/orders", headers=auth(worker))
+
+    async def order_get(client, worker):
+        user = 1 + worker % ctx["users"]
+        return await client.get(f"/api/order/BENCH{user:08d}", headers=auth(worker))
+
+    return {
+        "attractions_page": attractions_page,
+        "attractions_cursor": attractions_cursor,
+        "attraction_detail": attraction_detail,
+        "mrts": mrts,
+        "keyword_search": keyword_search,
+        "faceted_search": faceted_search,
+        "attractions_by_ids": attractions_by_ids,
+        "nearby": nearby,
+        "index_page": index_page,
+        "attraction_page": attraction_page,
+        "availability": availability,
+        "signup": signup,
+        "login": login,
+        "user_auth": user_auth,
+        "booking_post": booking_post,
+        "booking_get": booking_get,
+        "booking_delete": booking_delete,
+        "batch_booking_page": batch_booking_page,
+        "order_create": order_create,
+        "order_retry": order_retry,
+        "order_history": order_history,
+        "order_get": order_get,
+    }
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    # nearest-rank
+    index = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def run_scenario(client, scenario, total, concurrency, query_counter):
+    latencies = []
+    queries = []
+    errors = 0
+    remaining = total
+
+    async def worker(worker_id):
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            counter = [0]
+            token = query_counter.set(counter)
+            started = time.perf_counter()
+            try:
+                response = await scenario(client, worker_id)
+                if response.status_code >= 400:
+                    errors += 1
+            except Exception:
+                errors += 1
+            finally:
+                latencies.append(time.perf_counter() - started)
+                queries.append(counter[0])
+                query_counter.reset(token)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": errors,
+        "rps": round(total / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "queries_per_request": round(sum(queries) / len(queries), 2) if queries else 0.0,
+    }
+
+
+def compare(results, baseline, tolerance):
+    # p95 變慢或吞吐量下降超過容許比例、或查詢數增加，都視為退步
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        if current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']}ms → {current['p95_ms']}ms")
+        if current["rps"] < previous["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: 吞吐量 {previous['rps']} → {current['rps']} req/s")
+        if current["queries_per_request"] > previous["queries_per_request"] + 0.01:
+            regressions.append(f"{name}: 每請求查詢數 {previous['queries_per_request']} → {current['queries_per_request']}")
+    return regressions
+
+
+async def main(args):
+    # 設定需在匯入 app 之前完成
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{args.db}"
+    os.environ["SYNC_DATABASE_URL"] = f"sqlite:///{args.db}"
+    os.environ["TAPPAY_URL"] = "http://tappay/tpc/payment/pay-by-prime"
+    os.environ.setdefault("MOCK_TAPPAY_DELAY", str(args.tappay_delay))
+    # 下單情境會佔用名額，壓測時放大名額避免中途額滿
+    os.environ.setdefault("SLOT_CAPACITY", "1000000")
+    # 所有壓測請求來自同一個用戶端，預設關閉限流
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+
+    # 檢查查詢計畫時要走資料庫查詢路徑
+    if args.explain:
+        args.no_catalog = True
+
+    if args.catalog_file:
+        # 由 mmap 的目錄檔載入景點目錄（與多 worker 部署相同）
+        os.environ["CATALOG_FILE"] = args.db + ".catalog"
+
+    replica_path = args.db + ".replica"
+    if args.replica:
+        # seed() 會匯入 config，副本設定要在那之前放進環境變數
+        os.environ["REPLICA_DATABASE_URLS"] = f"sqlite+aiosqlite:///{replica_path}"
+
+    attractions = seed(args.db, args.scale, args.users)
+    if args.replica:
+        # 以種子資料庫的複本模擬唯讀副本（不會同步寫入，剛寫入的使用者會被導回主資料庫）
+        shutil.copyfile(args.db, replica_path)
+
+    import httpx
+    import jwt
+    from sqlalchemy import event
+    import mock_tappay
+    import payment
+    import passwords
+    from app import app
+    from catalog import load_catalog, export_catalog
+    from config import SECRET_KEY, ALGORITHM, CATALOG_FILE
+    from database import engine, get_sync_connection
+    from query_plans import QueryCollector, check
+
+    # 以 context variable 統計每個請求執行的 SQL 數
+    query_counter = contextvars.ContextVar("query_counter", default=None)
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def count_query(conn, cursor, statement, parameters, context, executemany):
+        counter = query_counter.get()
+        if counter is not None:
+            counter[0] += 1
+
+    collector = QueryCollector()
+    if args.explain:
+        collector.attach(engine.sync_engine)
+
+    if CATALOG_FILE:
+        with get_sync_connection() as conn:
+            export_catalog(conn, CATALOG_FILE)
+
+    if not args.no_catalog:
+        catalog = await load_catalog()
+        keywords = [a.name[:2] for a in catalog.attractions[:200]] + catalog.mrts[:20]
+        categories = catalog.facets.ranked["category"]
+        points = [(a.lat, a.lng) for a in catalog.attractions[:200]]
+    else:
+        keywords = ["溫泉", "公園", "博物館", "北投", "士林"]
+        categories = ["藝文館所", "戶外踏青", "宗教信仰", "養生溫泉"]
+        # 台北車站、信義區、士林、北投、淡水
+        points = [(25.0478, 121.5170), (25.0330, 121.5654), (25.0930, 121.5246), (25.1370, 121.5030), (25.1677, 121.4450)]
+
+    payment.use_client(httpx.AsyncClient(transport=httpx.ASGITransport(app=mock_tappay.app)))
+    expires = datetime.datetime.utcnow() + datetime.timedelta(days=1)
+    ctx = {
+        "attractions": attractions,
+        "pages": max(1, attractions // 12),
+        "users": args.users,
+        "tokens": [jwt.encode({"user_id": i, "exp": expires}, SECRET_KEY, algorithm=ALGORITHM)
+                   for i in range(1, args.users + 1)],
+        "keywords": keywords,
+        "categories": categories,
+        "points": points,
+        "cursors": {},
+        "signups": 0,
+        "retries": {},
+    }
+    scenarios = build_scenarios(ctx)
+    selected = args.scenarios.split(",") if args.scenarios else list(scenarios)
+
+    results = {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for name in selected:
+            total = args.requests
+            # bcrypt 相關情境成本高，次數另外設定
+            if name in ("signup", "login"):
+                total = min(total, args.auth_requests)
+            results[name] = await run_scenario(client, scenarios[name], total, args.concurrency, query_counter)
+            r = results[name]
+            print(f"{name:20s} {r['rps']:>9.1f} req/s  p50 {r['p50_ms']:>8.2f}ms  p95 {r['p95_ms']:>8.2f}ms  "
+                  f"p99 {r['p99_ms']:>8.2f}ms  {r['queries_per_request']:>5.2f} SQL/req  錯誤 {r['errors']}")
+
+    plan_failures = 0
+    if args.explain:
+        lines, plan_failures = await check(engine, collector)
+        print(f"查詢計畫（共 {len(collector.statements)} 種 SQL）：")
+        print("\n".join(lines))
+
+    await payment.close_client()
+    passwords.shutdown()
+    await engine.dispose()
+
+    report = {
+        "meta": {
+            "scale": args.scale,
+            "attractions": attractions,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "catalog": not args.no_catalog,
+            "python": sys.version.split()[0],
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        },
+        "scenarios": results,
+    }
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"已儲存基準檔：{args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("效能退步：")
+            for line in regressions:
+                print("  " + line)
+            return 1
+        print("與基準相比沒有效能退步")
+
+    if plan_failures:
+        print(f"有 {plan_failures} 個查詢出現全表掃描或額外排序")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="API 壓測")
+    parser.add_argument("--db", default=os.path.join(tempfile.gettempdir(), "taipei-day-trip-bench.db"),
+                        help="壓測用 SQLite 檔案路徑（每次執行會重建）")
+    parser.add_argument("--scale", type=int, default=1, help="景點資料放大倍數")
+    parser.add_argument("--users", type=int, default=50, help="預先建立的使用者數")
+    parser.add_argument("--concurrency", type=int, default=10, help="同時進行的請求數")
+    parser.add_argument("--requests", type=int, default=300, help="每個情境的請求數")
+    parser.add_argument("--auth-requests", type=int, default=50, help="註冊與登入情境的請求數上限")
+    parser.add_argument("--scenarios", help="只執行指定情境（以逗號分隔）")
+    parser.add_argument("--no-catalog", action="store_true", help="不載入景點目錄快照，改測資料庫查詢路徑")
+    parser.add_argument("--catalog-file", action="store_true",
+                        help="先輸出二進位目錄檔，景點目錄改由 mmap 的目錄檔載入")
+    parser.add_argument("--replica", action="store_true", help="另建一個 SQLite 複本當作唯讀副本")
+    parser.add_argument("--explain", action="store_true",
+                        help="收集各情境執行的 SQL 並檢查查詢計畫（會改走資料庫查詢路徑），有全表掃描或 filesort 時失敗")
+    parser.add_argument("--tappay-delay", type=float, default=0.05, help="模擬 TapPay 回應時間（秒）")
+    parser.add_argument("--baseline", help="與此基準檔比較")
+    parser.add_argument("--save-baseline", help="將結果存成基準檔")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="容許的退步比例")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,214 @@
+# 景點目錄快照：啟動時從 MySQL 載入一次，之後景點與捷運站 API 直接由記憶體回應
+# 有設定 CATALOG_FILE 且檔案存在時改由 mmap 的目錄檔載入（見 catalog_file.py），多個 worker 共用同一份景點內容
+from bisect import bisect_right
+import json
+import struct
+from typing import NamedTuple, Optional
+from sqlalchemy import text
+from catalog_file import CatalogFile, IdKeys, IdLookup, Points, TermPostings, file_stamp, write_catalog
+from config import CATALOG_FILE
+from database import get_read_connection
+from facets import FacetIndex, bitmap_of, docs_of
+from search import SearchIndex
+from spatial import GridIndex
+
+
+class AttractionRecord(NamedTuple):
+    id: int
+    name: str
+    category: str
+    description: str
+    address: str
+    transport: str
+    mrt: Optional[str]
+    lat: float
+    lng: float
+    images: list    # 已排序好的圖片網址，唯讀共用，不要修改
+
+    def to_dict(self):
+        return self._asdict()
+
+
+class CatalogSnapshot:
+    """唯讀的目錄快照，建立後不再修改，更新時整個替換"""
+
+    __slots__ = ("version", "stamp", "attractions", "by_id", "ids", "id_keys", "mrts", "index", "facets", "spatial")
+
+    def __init__(self, version, attractions, terms=None):
+        """terms 指定時搜尋索引只收錄這些詞（見 SearchIndex）"""
+        self.version = version
+        if isinstance(attractions, CatalogFile):
+            # 由目錄檔載入：景點在取用時才從檔案解碼，搜尋與空間索引直接讀檔案，不在每個 worker 重建
+            # stamp 為檔案的 (inode, 修改時間, 大小)，用來偵測檔案被替換
+            self.stamp = attractions.stamp
+            self.attractions = attractions
+            self.by_id = IdLookup(attractions)
+            self.ids = attractions.ids
+            self.id_keys = IdKeys(attractions)
+            facet_postings = attractions.facet_postings()
+            self.index = SearchIndex(attractions, postings=TermPostings(attractions), lengths=attractions.lengths(),
+                                     mrts=facet_postings["mrt"])
+            self.facets = FacetIndex(attractions, postings=facet_postings)
+            self.spatial = GridIndex(attractions, cells=attractions.grid_cells(), points=Points(attractions))
+        else:
+            self.stamp = None
+            self.attractions = tuple(attractions)
+            self.by_id = {a.id: a for a in self.attractions}
+            self.ids = [a.id for a in self.attractions]
+            self.id_keys = [(a.id,) for a in self.attractions]
+            self.index = SearchIndex(self.attractions, terms=terms)
+            self.facets = FacetIndex(self.attractions)
+            self.spatial = GridIndex(self.attractions)
+        # 捷運站排名（依景點數由多到少）
+        self.mrts = self.facets.ranked["mrt"]
+
+    def search(self, keyword=None, category=None, mrt=None):
+        """回傳 (排序鍵列表, 文件序號列表)，兩者一一對應且依排序鍵遞增
+
+        沒有關鍵字時排序鍵是 (id,)，有關鍵字時是 (-相關度, id)；
+        只回傳文件序號，由呼叫端取出需要的那幾筆（目錄檔載入時取用才解碼）
+        """
+        filtered = category is not None or mrt is not None
+        if filtered:
+            mask = self.facets.mask({"category": category, "mrt": mrt})
+
+        if not keyword:
+            if not filtered:
+                return self.id_keys, range(len(self.attractions))
+            docs = docs_of(mask)
+            return [(self.ids[doc],) for doc in docs], docs
+
+        hits = self.index.search(keyword)
+        if filtered:
+            hits = [(doc, score) for doc, score in hits if mask >> doc & 1]
+        keys = [(-score, self.ids[doc]) for doc, score in hits]
+        return keys, [doc for doc, _ in hits]
+
+    def facet_counts(self, keyword=None, category=None, mrt=None):
+        """目前條件下各分類與捷運站的景點數"""
+        base = None
+        if keyword:
+            base = bitmap_of((doc for doc, _ in self.index.search(keyword)), len(self.attractions))
+        return self.facets.counts({"category": category, "mrt": mrt}, base=base)
+
+    def page(self, keyword, per_page, page=0, after=None, category=None, mrt=None):
+        """回傳 (景點, 下一頁頁碼, 下一頁排序鍵)
+
+        有 after（上一頁最後一筆的排序鍵）時走 keyset 分頁，頁碼固定為 None
+        """
+        keys, docs = self.search(keyword, category=category, mrt=mrt)
+        if after is not None:
+            start = bisect_right(keys, after)
+        else:
+            start = page * per_page
+        end = start + per_page
+        items = [self.attractions[doc] for doc in docs[start:end]]
+        if end >= len(docs):
+            return items, None, None
+        return items, (page + 1 if after is None else None), keys[end - 1]
+
+
+_snapshot: Optional[CatalogSnapshot] = None
+# 無法使用的目錄檔，檔案沒有再被替換前不重複嘗試
+_rejected_stamp = None
+
+
+def get_catalog() -> Optional[CatalogSnapshot]:
+    # 尚未載入時回傳 None，呼叫端改走資料庫
+    return _snapshot
+
+
+async def fetch_catalog_version(conn) -> int:
+    row = (await conn.execute(text("SELECT version FROM catalog_meta WHERE id = 1"))).fetchone()
+    return row[0] if row else 0
+
+
+def decode_images(value):
+    # attraction_read.images 是 JSON 欄位，驅動程式可能回傳字串或已解析的列表
+    if value is None:
+        return []
+    if isinstance(value, (str, bytes)):
+        return json.loads(value)
+    return value
+
+
+async def build_snapshot(conn) -> CatalogSnapshot:
+    version = await fetch_catalog_version(conn)
+
+    result = await conn.execute(text("""
+        SELECT id, name, category, description, address, transport, mrt, lat, lng, images
+        FROM attraction_read
+        ORDER BY id
+    """))
+    attractions = [
+        AttractionRecord(
+            row.id, row.name, row.category, row.description, row.address,
+            row.transport, row.mrt, float(row.lat), float(row.lng),
+            decode_images(row.images)
+        )
+        for row in result
+    ]
+    return CatalogSnapshot(version, attractions)
+
+
+def open_snapshot(path) -> CatalogSnapshot:
+    catalog_file = CatalogFile(path, AttractionRecord)
+    return CatalogSnapshot(catalog_file.version, catalog_file)
+
+
+def export_catalog(conn, path):
+    """以同步連線讀取 attraction_read 並寫成目錄檔（insert_data.py 匯入後呼叫），回傳筆數"""
+    row = conn.execute(text("SELECT version FROM catalog_meta WHERE id = 1")).fetchone()
+    result = conn.execute(text("""
+        SELECT id, name, category, description, address, transport, mrt, lat, lng, images
+        FROM attraction_read
+        ORDER BY id
+    """))
+    attractions = [
+        AttractionRecord(
+            row.id, row.name, row.category, row.description, row.address,
+            row.transport, row.mrt, float(row.lat), float(row.lng),
+            decode_images(row.images)
+        )
+        for row in result
+    ]
+    write_catalog(path, row[0] if row else 0, attractions)
+    return len(attractions)
+
+
+async def load_catalog() -> CatalogSnapshot:
+    global _snapshot, _rejected_stamp
+    snapshot = None
+    stamp = file_stamp(CATALOG_FILE) if CATALOG_FILE else None
+    if stamp is not None:
+        try:
+            snapshot = open_snapshot(CATALOG_FILE)
+        except (OSError, ValueError, struct.error) as e:
+            _rejected_stamp = stamp
+            print("景點目錄檔無法使用，改由資料庫載入：", e)
+    if snapshot is None:
+        async with get_read_connection() as conn:
+            snapshot = await build_snapshot(conn)
+    # 單一指派，正在處理中的請求仍持有舊快照（舊的目錄檔在沒有人使用後才會釋放）
+    _snapshot = snapshot
+    source = CATALOG_FILE if snapshot.stamp is not None else "資料庫"
+    print(f"景點目錄已載入：版本 {snapshot.version}，共 {len(snapshot.attractions)} 筆（{source}）")
+    return snapshot
+
+
+async def refresh_catalog() -> bool:
+    # 使用目錄檔時檔案被替換才重新載入，否則版本號有變才重新載入，回傳是否有替換
+    if CATALOG_FILE:
+        stamp = file_stamp(CATALOG_FILE)
+        if stamp is not None and stamp != _rejected_stamp:
+            if _snapshot is not None and _snapshot.stamp == stamp:
+                return False
+            await load_catalog()
+            return True
+
+    async with get_read_connection() as conn:
+        version = await fetch_catalog_version(conn)
+    if _snapshot is not None and _snapshot.stamp is None and _snapshot.version == version:
+        return False
+    await load_catalog()
+    return True
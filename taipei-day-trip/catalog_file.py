@@ -0,0 +1,310 @@
+# 景點目錄檔：insert_data.py 匯入後輸出的二進位檔，API 的每個 worker 以 mmap 唯讀開啟，
+# 景點內容與搜尋、空間索引只存在作業系統的 page cache，多個 worker 共用同一份，不會隨 worker 數增加
+#
+# 格式（little-endian）：
+#   檔頭     HEADER
+#   景點表   RECORD × count，依 id 遞增排序（文件序號即為列號）
+#   圖片表   IMAGE × 圖片總數，每筆景點的圖片連續存放
+#   facet    每個欄位：值的數量（uint32）+ FACET × 值的數量，值依第一次出現的順序
+#   格子     格子數（uint32）+ CELL × 格子數，依 (列, 欄) 排序
+#   文件序號 uint32 陣列，FACET 與 CELL 指向其中一段
+#   詞表     詞數（uint32）+ TERM × 詞數，依詞的 UTF-8 位元組排序，查詢時二分搜尋
+#   posting  文件序號與加權詞頻兩個 uint32 陣列（各為 posting 總數），TERM 指向其中一段
+#   文件長度 uint32 × count，BM25 使用的加權長度
+#   景點 id  uint32 × count，與景點表同順序，供二分搜尋與排序鍵使用
+#   字串池   UTF-8，相同字串只存一次；所有字串以 (位移, 長度) 參照
+# 除字串池外每一段的長度都是 4 的倍數，uint32 陣列直接以 memoryview 讀取，不複製
+import mmap
+import os
+import struct
+import sys
+from bisect import bisect_left
+from collections.abc import Sequence
+from search import build_postings
+from spatial import build_cells
+
+MAGIC = b"TDTCAT02"
+# magic, 目錄版本, 筆數, 景點表, 圖片表, facet, 格子, 文件序號, 詞表, posting, 文件長度, 景點 id, 字串池
+HEADER = struct.Struct("<8sQ" + "I" * 11)
+STRING_FIELDS = ("name", "category", "description", "address", "transport", "mrt")
+RECORD = struct.Struct("<Idd" + "II" * len(STRING_FIELDS) + "II")  # id, lat, lng, 字串參照, 第一張圖片, 圖片數
+POINT = struct.Struct("<Idd")               # RECORD 開頭的 id, lat, lng
+IMAGE = struct.Struct("<II")
+FACET = struct.Struct("<IIII")              # 值的字串參照, 第一個文件序號, 文件數
+FACET_FIELDS = ("category", "mrt")
+CELL = struct.Struct("<iiII")               # 列, 欄, 第一個文件序號, 文件數
+TERM = struct.Struct("<IIII")               # 詞的字串參照, 第一個 posting, posting 數
+COUNT = struct.Struct("<I")
+NONE = 0xFFFFFFFF                           # 字串長度為此值代表 None
+
+
+def file_stamp(path):
+    """檔案被替換（os.replace）後 inode 會改變，據此判斷是否需要重新載入；檔案不存在時回傳 None"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def _uint32s(values):
+    return struct.pack(f"<{len(values)}I", *values)
+
+
+def write_catalog(path, version, attractions):
+    """將景點與索引寫成目錄檔；先寫暫存檔再替換，正在使用舊檔的 worker 不受影響"""
+    pool = bytearray()
+    refs = {}
+
+    def ref(value):
+        if value is None:
+            return 0, NONE
+        if value not in refs:
+            data = value.encode("utf-8")
+            refs[value] = (len(pool), len(data))
+            pool.extend(data)
+        return refs[value]
+
+    records = bytearray()
+    images = bytearray()
+    postings = {field: {} for field in FACET_FIELDS}
+    image_count = 0
+    attractions = sorted(attractions, key=lambda a: a.id)
+    for doc, a in enumerate(attractions):
+        strings = [part for field in STRING_FIELDS for part in ref(getattr(a, field))]
+        for url in a.images:
+            images += IMAGE.pack(*ref(url))
+        records += RECORD.pack(a.id, a.lat, a.lng, *strings, image_count, len(a.images))
+        image_count += len(a.images)
+        for field in FACET_FIELDS:
+            value = getattr(a, field)
+            if value is not None:
+                postings[field].setdefault(value, []).append(doc)
+
+    docs = []
+    facets = bytearray()
+    for field in FACET_FIELDS:
+        facets += COUNT.pack(len(postings[field]))
+        for value, value_docs in postings[field].items():
+            facets += FACET.pack(*ref(value), len(docs), len(value_docs))
+            docs.extend(value_docs)
+
+    grid = build_cells(attractions)
+    cells = bytearray(COUNT.pack(len(grid)))
+    for (row, col), cell_docs in sorted(grid.items()):
+        cells += CELL.pack(row, col, len(docs), len(cell_docs))
+        docs.extend(cell_docs)
+
+    term_postings, lengths, _ = build_postings(attractions)
+    terms = bytearray(COUNT.pack(len(term_postings)))
+    term_docs = []
+    term_tfs = []
+    for term in sorted(term_postings, key=lambda term: term.encode("utf-8")):
+        term_doc_list, tfs = term_postings[term]
+        terms += TERM.pack(*ref(term), len(term_docs), len(term_doc_list))
+        term_docs.extend(term_doc_list)
+        term_tfs.extend(tfs)
+
+    sections = [records, images, facets, cells, _uint32s(docs), terms,
+                _uint32s(term_docs) + _uint32s(term_tfs), _uint32s(lengths),
+                _uint32s([a.id for a in attractions]), pool]
+    offsets = []
+    offset = HEADER.size
+    for section in sections:
+        offsets.append(offset)
+        offset += len(section)
+    header = HEADER.pack(MAGIC, version, len(attractions), *offsets)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        for part in (header, *sections):
+            f.write(part)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return offset
+
+
+class CatalogFile(Sequence):
+    """以 mmap 開啟的目錄檔，可當作景點的唯讀序列使用；存取時才從檔案解碼該筆景點"""
+
+    def __init__(self, path, record_type):
+        # uint32 陣列直接以原生格式讀取
+        if sys.byteorder != "little" or struct.calcsize("I") != 4:
+            raise ValueError("目錄檔為 little-endian 格式，這台主機無法直接使用")
+        self.path = path
+        self.stamp = file_stamp(path)
+        self._record_type = record_type
+        with open(path, "rb") as f:
+            # 關閉檔案後 mmap 仍然有效；舊的目錄檔被替換後，仍持有舊快照的請求繼續讀舊檔
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < HEADER.size:
+            raise ValueError("目錄檔格式錯誤")
+        (magic, self.version, self.count, self._records, self._images, self._facets, self._cells,
+         self._docs, self._terms, self._postings, self._lengths, self._ids, self._strings) = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError("目錄檔格式錯誤")
+        if (self._records + self.count * RECORD.size > self._images
+                or self._ids + self.count * 4 > self._strings or self._strings > len(self._map)):
+            raise ValueError("目錄檔內容不完整")
+        self._view = memoryview(self._map)
+        self.ids = self._uint32s(self._ids, self.count)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, doc):
+        if isinstance(doc, slice):
+            return [self.record(i) for i in range(*doc.indices(self.count))]
+        if doc < 0:
+            doc += self.count
+        if not 0 <= doc < self.count:
+            raise IndexError(doc)
+        return self.record(doc)
+
+    def _string(self, offset, length):
+        if length == NONE:
+            return None
+        start = self._strings + offset
+        return str(self._map[start:start + length], "utf-8")
+
+    def _uint32s(self, offset, count):
+        # 不複製的唯讀 uint32 陣列，支援 len、索引與迭代
+        return self._view[offset:offset + count * 4].cast("I")
+
+    def record(self, doc):
+        fields = RECORD.unpack_from(self._map, self._records + doc * RECORD.size)
+        strings = [self._string(fields[i], fields[i + 1]) for i in range(3, 3 + 2 * len(STRING_FIELDS), 2)]
+        start = self._images + fields[-2] * IMAGE.size
+        images = [self._string(offset, length)
+                  for offset, length in IMAGE.iter_unpack(self._map[start:start + fields[-1] * IMAGE.size])]
+        return self._record_type(fields[0], *strings, fields[1], fields[2], images)
+
+    def find(self, attraction_id):
+        """以二分搜尋找出景點的文件序號，不存在時回傳 None"""
+        doc = bisect_left(self.ids, attraction_id)
+        if doc < self.count and self.ids[doc] == attraction_id:
+            return doc
+        return None
+
+    def facet_postings(self):
+        """欄位 → 值 → 文件序號，與 FacetIndex 從景點逐筆建立的結果相同"""
+        postings = {}
+        offset = self._facets
+        for field in FACET_FIELDS:
+            (size,) = COUNT.unpack_from(self._map, offset)
+            offset += COUNT.size
+            values = {}
+            for _ in range(size):
+                value_offset, value_length, start, count = FACET.unpack_from(self._map, offset)
+                offset += FACET.size
+                values[self._string(value_offset, value_length)] = self._uint32s(self._docs + start * 4, count)
+            postings[field] = values
+        return postings
+
+    def grid_cells(self):
+        """格子 (列, 欄) → 文件序號，供 GridIndex 使用；格子數不多，查表用的 dict 放在記憶體"""
+        (size,) = COUNT.unpack_from(self._map, self._cells)
+        cells = {}
+        for row, col, start, count in CELL.iter_unpack(self._map[self._cells + COUNT.size:self._cells + COUNT.size + size * CELL.size]):
+            cells[(row, col)] = self._uint32s(self._docs + start * 4, count)
+        return cells
+
+    def lengths(self):
+        return self._uint32s(self._lengths, self.count)
+
+
+class TermPostings:
+    """搜尋索引的 posting list，介面與 dict 的 get 相同：詞 → (文件序號, 加權詞頻)，以二分搜尋詞表"""
+
+    def __init__(self, catalog_file):
+        self._file = catalog_file
+        self._map = catalog_file._map
+        (self._size,) = COUNT.unpack_from(self._map, catalog_file._terms)
+        self._entries = catalog_file._terms + COUNT.size
+        # 詞頻陣列緊接在文件序號陣列之後
+        self._total = (catalog_file._lengths - catalog_file._postings) // 8
+
+    def __len__(self):
+        return self._size
+
+    def _term(self, index):
+        offset, length, start, count = TERM.unpack_from(self._map, self._entries + index * TERM.size)
+        term_start = self._file._strings + offset
+        return self._map[term_start:term_start + length], start, count
+
+    def get(self, term, default=None):
+        key = term.encode("utf-8")
+        lo, hi = 0, self._size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term(mid)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self._size:
+            return default
+        found, start, count = self._term(lo)
+        if found != key:
+            return default
+        docs_at = self._file._postings + start * 4
+        return (self._file._uint32s(docs_at, count),
+                self._file._uint32s(docs_at + self._total * 4, count))
+
+
+class Points(Sequence):
+    """各文件的 (id, 緯度, 經度)，直接從景點表讀取"""
+
+    def __init__(self, catalog_file):
+        self._map = catalog_file._map
+        self._records = catalog_file._records
+        self._count = catalog_file.count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, doc):
+        if not 0 <= doc < self._count:
+            raise IndexError(doc)
+        return POINT.unpack_from(self._map, self._records + doc * RECORD.size)
+
+
+class IdKeys(Sequence):
+    """各文件的排序鍵 (id,)，供 keyset 分頁二分搜尋"""
+
+    def __init__(self, catalog_file):
+        self._ids = catalog_file.ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __getitem__(self, doc):
+        if isinstance(doc, slice):
+            return [(attraction_id,) for attraction_id in self._ids[doc]]
+        return (self._ids[doc],)
+
+
+class IdLookup:
+    """依景點 id 取得景點，介面與 dict 相同（get、in、[]），查詢時才解碼"""
+
+    def __init__(self, catalog_file):
+        self._file = catalog_file
+
+    def get(self, attraction_id, default=None):
+        doc = self._file.find(attraction_id)
+        return default if doc is None else self._file.record(doc)
+
+    def __getitem__(self, attraction_id):
+        doc = self._file.find(attraction_id)
+        if doc is None:
+            raise KeyError(attraction_id)
+        return self._file.record(doc)
+
+    def __contains__(self, attraction_id):
+        return self._file.find(attraction_id) is not None
+
+    def __iter__(self):
+        return iter(self._file.ids)
+
+    def __len__(self):
+        return len(self._file)
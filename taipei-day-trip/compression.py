@@ -0,0 +1,96 @@
+# 回應壓縮：瀏覽器支援且已安裝 brotli 時使用 br，否則使用 gzip；小於門檻的回應不壓縮
+import gzip
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # brotli 為選用套件
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "image/svg+xml")
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size=500, gzip_level=6, brotli_quality=4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def choose_encoding(self, accept_encoding):
+        """依 Accept-Encoding 的 q 值選擇編碼：q=0 代表不接受，* 套用在沒有列出的編碼，同分時優先 br"""
+        weights = {}
+        for part in accept_encoding.lower().split(","):
+            coding, _, params = part.partition(";")
+            coding = coding.strip()
+            if not coding:
+                continue
+            q = 1.0
+            for param in params.split(";"):
+                name, _, value = param.partition("=")
+                if name.strip() == "q":
+                    try:
+                        q = float(value)
+                    except ValueError:
+                        q = 0.0     # 無法解析的 q 值視為不接受
+            weights[coding] = q
+
+        best, best_q = None, 0.0
+        for coding in (("br", "gzip") if brotli is not None else ("gzip",)):
+            q = weights.get(coding, weights.get("*", 0.0))
+            if q > best_q:
+                best, best_q = coding, q
+        return best
+
+    def compress(self, body, encoding):
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = self.choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+        chunks = []
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                # 已壓縮或不適合壓縮的內容（例如圖片）直接送出，不暫存
+                if "content-encoding" in headers or not content_type.startswith(COMPRESSIBLE_TYPES):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start_message = message
+                return
+
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+
+            body = b"".join(chunks)
+            headers = MutableHeaders(scope=start_message)
+            if len(body) >= self.minimum_size:
+                body = self.compress(body, encoding)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
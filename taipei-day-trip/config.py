@@ -1,23 +1,103 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 from pathlib import Path
 
 # 明確指定 .env 的位置（與啟動檔同目錄）
 env_path = Path(__file__).resolve().parent / ".env"
 
-load_dotenv()  # 載入環境變數
+load_dotenv(env_path)  # 載入環境變數（已存在的環境變數優先）
 
 SECRET_KEY = os.getenv("SECRET_KEY", "default-fallback-key")
 ALGORITHM = "HS256"
 TOKEN_EXPIRE_DAYS = 7
 
+# 已驗證 token 與使用者資料的快取容量與存活時間（秒）
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_TTL = int(os.getenv("TOKEN_CACHE_TTL", "300"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "60"))
+
+# bcrypt 雜湊成本；調整後使用者下次登入時會自動以新成本重新雜湊
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# 執行 bcrypt 的 process 數與最多可排隊的工作數（超過回傳 503）
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", str(os.cpu_count() or 1)))
+BCRYPT_MAX_PENDING = int(os.getenv("BCRYPT_MAX_PENDING", "32"))
+
 MERCHANT_KEY=os.getenv("MERCHANT_KEY", "")
 PARTNER_KEY = os.getenv("PARTNER_KEY", "") 
 
+# TapPay pay-by-prime 端點，本機測試可指向 mock_tappay.py
+TAPPAY_URL = os.getenv("TAPPAY_URL", "https://sandbox.tappaysdk.com/tpc/payment/pay-by-prime")
+# TapPay 交易紀錄查詢（Record API），核對付款結果未知的訂單
+TAPPAY_RECORD_URL = os.getenv("TAPPAY_RECORD_URL", "https://sandbox.tappaysdk.com/tpc/transaction/query")
+TAPPAY_TIMEOUT = float(os.getenv("TAPPAY_TIMEOUT", "10"))
+TAPPAY_RETRIES = int(os.getenv("TAPPAY_RETRIES", "2"))
+
 DB_USER = os.getenv("DB_USER", "root")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "")
 DB_HOST = os.getenv("DB_HOST", "localhost")
 DB_NAME = os.getenv("DB_NAME", "taipei_trip")
 
-print("DB_USER =", DB_USER)
-print("DB_PASSWORD =", DB_PASSWORD)
\ No newline at end of file
+# API 使用的非同步連線字串，測試時可設為 sqlite+aiosqlite:///./test.db
+DATABASE_URL = os.getenv("DATABASE_URL", f"mysql+aiomysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}")
+# 命令列腳本（insert_data.py）使用的同步連線字串
+SYNC_DATABASE_URL = os.getenv("SYNC_DATABASE_URL", f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}")
+# 唯讀副本的非同步連線字串，以逗號分隔；未設定時所有讀取都走主資料庫
+REPLICA_DATABASE_URLS = [url.strip() for url in os.getenv("REPLICA_DATABASE_URLS", "").split(",") if url.strip()]
+# 副本延遲超過此秒數就暫停使用，多久檢查一次副本狀態（秒）
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_CHECK_SECONDS = float(os.getenv("REPLICA_CHECK_SECONDS", "10"))
+# 使用者寫入後這段時間內的讀取仍走主資料庫（read-your-writes）
+STICKY_PRIMARY_SECONDS = float(os.getenv("STICKY_PRIMARY_SECONDS", "10"))
+
+# 超過此秒數的 SQL 會記錄為慢查詢
+SLOW_QUERY_SECONDS = float(os.getenv("SLOW_QUERY_SECONDS", "0.2"))
+
+# 啟動預熱時主資料庫連不上，每隔幾秒重試（秒）
+STARTUP_RETRY_SECONDS = float(os.getenv("STARTUP_RETRY_SECONDS", "2"))
+
+# 景點目錄快照多久檢查一次版本號（秒）
+CATALOG_REFRESH_SECONDS = int(os.getenv("CATALOG_REFRESH_SECONDS", "60"))
+# 二進位目錄檔路徑（insert_data.py 匯入後輸出）；有設定且檔案存在時各 worker 以 mmap 共用，不再各自查詢資料庫
+CATALOG_FILE = os.getenv("CATALOG_FILE", "")
+
+# 訂單編號的主機編號；多台主機部署時每台需設定不同值（ORDER_WORKER_ID 為舊名稱），主機內的各 process 再由本機檔案鎖分配編號
+# 每台主機可同時執行 ORDER_WORKERS_PER_HOST 個 process，主機編號的範圍為 0 到 1000 / ORDER_WORKERS_PER_HOST - 1
+ORDER_HOST_ID = int(os.getenv("ORDER_HOST_ID") or os.getenv("ORDER_WORKER_ID") or "0")
+ORDER_WORKERS_PER_HOST = int(os.getenv("ORDER_WORKERS_PER_HOST", "100"))
+ORDER_WORKER_LOCK_DIR = os.getenv("ORDER_WORKER_LOCK_DIR", os.path.join(tempfile.gettempdir(), "taipei-day-trip-order-workers"))
+
+# 每個景點每個時段（上半天／下半天）的預設名額，與可預約名額日曆的快取秒數
+SLOT_CAPACITY = int(os.getenv("SLOT_CAPACITY", "20"))
+AVAILABILITY_CACHE_TTL = float(os.getenv("AVAILABILITY_CACHE_TTL", "5"))
+# Idempotency-Key 處理中超過此秒數（需大於 TapPay 逾時與重試的總時間）視為處理中斷，可由重送的請求接手；
+# 保存的回應保留多久，多久清除一次過期的 key（秒）
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "120"))
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_PURGE_SECONDS = float(os.getenv("IDEMPOTENCY_PURGE_SECONDS", "3600"))
+
+# 建立超過此秒數仍為 UNPAID 的訂單（付款結果未知或處理中斷）視為付款失敗並釋放名額，多久檢查一次（秒）
+ORDER_PAYMENT_TIMEOUT = int(os.getenv("ORDER_PAYMENT_TIMEOUT", "900"))
+ORDER_EXPIRE_CHECK_SECONDS = float(os.getenv("ORDER_EXPIRE_CHECK_SECONDS", "60"))
+
+# 限流：RATE_LIMITS 可覆寫各路由的規則（名稱=每秒請求數:burst，以逗號分隔，見 ratelimit.py）
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") != "0"
+RATE_LIMIT_OVERRIDES = os.getenv("RATE_LIMITS", "")
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "100000"))
+# 在反向代理之後時，以 X-Forwarded-For 的第一個位址當作用戶端 IP
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "0") == "1"
+# 同時處理中的 API 請求上限，記憶體中的目錄讀取可額外使用 PRIORITY_HEADROOM
+MAX_INFLIGHT_REQUESTS = int(os.getenv("MAX_INFLIGHT_REQUESTS", "64"))
+PRIORITY_HEADROOM = int(os.getenv("PRIORITY_HEADROOM", "32"))
+
+# 伺服器端渲染頁面的快取容量與存活時間（秒）；快取鍵包含目錄版本，目錄更新後舊頁面不會再被使用
+PAGE_CACHE_SIZE = int(os.getenv("PAGE_CACHE_SIZE", "2048"))
+PAGE_CACHE_TTL = int(os.getenv("PAGE_CACHE_TTL", "3600"))
+
+# /api/batch 一次最多可包含的子請求數，與 /api/attractions?ids= 一次最多可查詢的景點數
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", "10"))
+MAX_ATTRACTION_IDS = int(os.getenv("MAX_ATTRACTION_IDS", "50"))
+
+# 回應大於此位元組數才壓縮
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "500"))
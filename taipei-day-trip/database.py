@@ -1,18 +1,213 @@
+import asyncio
+import itertools
+import time
+from contextlib import asynccontextmanager
 from sqlalchemy import create_engine, text
 from sqlalchemy.engine import Connection
-from config import DB_USER, DB_PASSWORD, DB_HOST, DB_NAME
-
-# 建立 SQLAlchemy 引擎（內建 connection pool）
-engine = create_engine(
-    f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}",
-    pool_size=10,            # 最多連線數
-    max_overflow=5,          # 超出 pool_size 時額外的連線數
-    pool_pre_ping=True,      # 每次連線前測試是否還活著（避免 timeout）
-    pool_recycle=3600,       # 每小時重啟一次連線（避免 MySQL timeout）
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncConnection
+from cache import TTLCache
+from config import (DATABASE_URL, SYNC_DATABASE_URL, REPLICA_DATABASE_URLS, REPLICA_MAX_LAG_SECONDS,
+                    STICKY_PRIMARY_SECONDS, USER_CACHE_SIZE)
+import metrics
+
+# 連線池設定（SQLite 測試環境不適用）
+def pool_options(url):
+    if not url.startswith("mysql"):
+        return {}
+    return dict(
+        pool_size=10,            # 最多連線數
+        max_overflow=5,          # 超出 pool_size 時額外的連線數
+        pool_pre_ping=True,      # 每次連線前測試是否還活著（避免 timeout）
+        pool_recycle=3600,       # 每小時重啟一次連線（避免 MySQL timeout）
+    )
+
+# 建立 API 使用的非同步引擎（主資料庫，所有寫入都走這裡；MySQL 走 aiomysql，測試可用 sqlite+aiosqlite）
+engine = create_async_engine(
+    DATABASE_URL,
     echo=False,              # 可改 True 來看 SQL log
+    **pool_options(DATABASE_URL)
+)
+
+# 記錄每個 SQL 的耗時與 pool 使用狀況
+metrics.instrument_engine(engine.sync_engine)
+
+# 目前使用的資料庫種類（mysql / sqlite），少數語法需要依此切換
+DIALECT = engine.dialect.name
+
+
+def older_than(column):
+    """column 早於現在往前 :seconds 秒的 SQL 條件
+
+    現在時間由資料庫計算，與 created 欄位的預設值使用相同的時鐘與時區
+    """
+    if DIALECT == "mysql":
+        return f"{column} < NOW(3) - INTERVAL :seconds SECOND"
+    return f"{column} < strftime('%Y-%m-%d %H:%M:%f', 'now', '-' || :seconds || ' seconds')"
+
+# 匯入資料等命令列腳本使用的同步引擎
+sync_engine = create_engine(
+    SYNC_DATABASE_URL,
+    pool_pre_ping=True,
+    echo=False,
     future=True              # 使用 SQLAlchemy 2.0 API
 )
 
-# 提供一個連線（需手動關閉）
-def get_db_connection() -> Connection:
-    return engine.connect()
\ No newline at end of file
+
+class Replica:
+    """唯讀副本，各自有獨立的 connection pool，由 check_replicas 更新健康狀態"""
+
+    def __init__(self, url):
+        self.url = url
+        self.engine = create_async_engine(url, echo=False, **pool_options(url))
+        self.healthy = True
+        self.lag = 0.0
+        metrics.instrument_engine(self.engine.sync_engine, track_pool=False)
+
+    def mark(self, healthy, reason=""):
+        if healthy != self.healthy:
+            state = "恢復使用" if healthy else f"暫停使用（{reason}）"
+            print(f"唯讀副本 {self.engine.url.render_as_string(hide_password=True)} {state}")
+        self.healthy = healthy
+
+
+replicas = [Replica(url) for url in REPLICA_DATABASE_URLS]
+_next_replica = itertools.count()
+
+# 最近有寫入的使用者，這段時間內的讀取固定走主資料庫
+_recent_writers = TTLCache(USER_CACHE_SIZE, STICKY_PRIMARY_SECONDS)
+
+
+def mark_written(user_id):
+    # 寫入後呼叫，讓同一位使用者接下來的讀取看得到自己剛寫入的資料
+    _recent_writers.set(user_id, True)
+
+
+def _pick_replica():
+    # 在健康的副本之間輪流使用，全部不可用時回傳 None
+    healthy = [replica for replica in replicas if replica.healthy]
+    if not healthy:
+        return None
+    return healthy[next(_next_replica) % len(healthy)]
+
+
+async def _connect(target) -> AsyncConnection:
+    # 從 pool 取得連線並記錄等待時間
+    conn = target.connect()
+    started = time.perf_counter()
+    await conn.start()
+    metrics.observe_pool_wait(time.perf_counter() - started)
+    return conn
+
+# 提供一個主資料庫的非同步連線（搭配 async with 使用），寫入與需要最新資料的讀取使用
+@asynccontextmanager
+async def get_db_connection() -> AsyncConnection:
+    conn = await _connect(engine)
+    try:
+        yield conn
+    finally:
+        await conn.close()
+
+# 提供一個唯讀連線：優先使用健康的副本，副本連不上時改用主資料庫
+# 帶入 user_id 時，該使用者剛寫入過就直接使用主資料庫
+@asynccontextmanager
+async def get_read_connection(user_id=None) -> AsyncConnection:
+    conn = None
+    replica = None
+    if user_id is None or _recent_writers.get(user_id) is None:
+        replica = _pick_replica()
+    if replica is not None:
+        try:
+            conn = await _connect(replica.engine)
+        except (DBAPIError, OSError) as e:
+            replica.mark(False, f"連線失敗: {e}")
+    if conn is None:
+        conn = await _connect(engine)
+    try:
+        yield conn
+    finally:
+        await conn.close()
+
+
+async def _replica_lag(conn):
+    """回傳副本落後主資料庫的秒數；複寫中斷時回傳 inf"""
+    if conn.dialect.name != "mysql":
+        return 0.0
+    try:
+        result = await conn.execute(text("SHOW REPLICA STATUS"))
+    except DBAPIError:
+        # MySQL 8.0.22 以前的語法
+        result = await conn.execute(text("SHOW SLAVE STATUS"))
+    row = result.mappings().fetchone()
+    if row is None:
+        # 不是複寫副本（例如測試用的獨立資料庫），視為沒有延遲
+        return 0.0
+    lag = row.get("Seconds_Behind_Source", row.get("Seconds_Behind_Master"))
+    return float("inf") if lag is None else float(lag)
+
+
+async def _measure(replica):
+    async with replica.engine.connect() as conn:
+        return await _replica_lag(conn)
+
+
+async def check_replicas(timeout=2.0):
+    # 連不上或延遲過大的副本暫停使用，恢復後自動加回
+    for replica in replicas:
+        try:
+            replica.lag = await asyncio.wait_for(_measure(replica), timeout)
+        except (DBAPIError, OSError, asyncio.TimeoutError) as e:
+            replica.mark(False, f"健康檢查失敗: {e}")
+            continue
+        if replica.lag > REPLICA_MAX_LAG_SECONDS:
+            replica.mark(False, f"延遲 {replica.lag} 秒")
+        else:
+            replica.mark(True)
+
+
+async def warm_pool(target):
+    """預先建立 pool_size 條連線並放回 pool，回傳建立的連線數
+
+    需同時持有所有連線，否則 pool 會一直重複使用同一條
+    """
+    size = target.sync_engine.pool.size() if hasattr(target.sync_engine.pool, "size") else 1
+    results = await asyncio.gather(*(_connect(target) for _ in range(size)), return_exceptions=True)
+    conns = [result for result in results if not isinstance(result, BaseException)]
+    try:
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            raise errors[0]
+        await asyncio.gather(*(conn.execute(text("SELECT 1")) for conn in conns))
+    finally:
+        await asyncio.gather(*(conn.close() for conn in conns))
+    return len(conns)
+
+
+async def warm_pools():
+    # 主資料庫連不上時拋出例外；副本連不上只標記為不健康，讀取會改走主資料庫
+    counts = {"primary": await warm_pool(engine)}
+    for replica in replicas:
+        try:
+            counts[replica.engine.url.render_as_string(hide_password=True)] = await warm_pool(replica.engine)
+        except (DBAPIError, OSError) as e:
+            replica.mark(False, f"連線失敗: {e}")
+    return counts
+
+
+async def dispose_engines():
+    # 關閉時釋放主資料庫與所有副本的連線池
+    await engine.dispose()
+    for replica in replicas:
+        await replica.engine.dispose()
+    sync_engine.dispose()
+
+
+def replica_status():
+    return [
+        {"url": replica.engine.url.render_as_string(hide_password=True), "healthy": replica.healthy, "lag": replica.lag}
+        for replica in replicas
+    ]
+
+# 提供一個同步連線（需手動關閉）
+def get_sync_connection() -> Connection:
+    return sync_engine.connect()
@@ -0,0 +1,79 @@
+# 分類與捷運站的 facet 索引：每個值對應一個 bitmap（Python int，第 i 個位元代表第 i 筆景點）
+# 多條件篩選是 bitmap 的 AND，計數是 popcount，不需要 GROUP BY
+
+FIELDS = ("category", "mrt")
+
+
+def bitmap_of(docs, size):
+    # 先組成二進位字串再一次轉成 int，避免逐筆 OR 產生大量暫存的大整數
+    if size == 0:
+        return 0
+    bits = bytearray(b"0" * size)
+    for doc in docs:
+        bits[size - 1 - doc] = ord("1")
+    return int(bits, 2)
+
+
+def docs_of(mask):
+    """bitmap 轉回遞增的文件序號"""
+    bits = bin(mask)[:1:-1]
+    docs = []
+    doc = bits.find("1")
+    while doc != -1:
+        docs.append(doc)
+        doc = bits.find("1", doc + 1)
+    return docs
+
+
+class FacetIndex:
+    def __init__(self, attractions, postings=None):
+        self.size = len(attractions)
+        self.all = (1 << self.size) - 1
+
+        # 欄位 → 值 → 文件序號；值依第一次出現的順序排列（目錄檔已存有相同結構時直接使用）
+        if postings is None:
+            postings = {field: {} for field in FIELDS}
+            for doc, a in enumerate(attractions):
+                for field in FIELDS:
+                    value = getattr(a, field)
+                    if value is not None:
+                        postings[field].setdefault(value, []).append(doc)
+
+        self.bitmaps = {
+            field: {value: bitmap_of(docs, self.size) for value, docs in values.items()}
+            for field, values in postings.items()
+        }
+        # 各值依景點數由多到少排序（同數量維持出現順序）
+        self.ranked = {
+            field: [value for value, docs in sorted(values.items(), key=lambda kv: len(kv[1]), reverse=True)]
+            for field, values in postings.items()
+        }
+
+    def mask(self, filters, skip=None):
+        """filters 為 {欄位: 值}，值為 None 的欄位不篩選；skip 指定忽略的欄位"""
+        mask = self.all
+        for field, value in filters.items():
+            if value is None or field == skip:
+                continue
+            mask &= self.bitmaps[field].get(value, 0)
+        return mask
+
+    def counts(self, filters, base=None):
+        """每個欄位在「其他欄位的條件」下各值的景點數
+
+        計算某欄位時不套用該欄位自己的條件，讓使用者看得到切換成其他值的結果數
+        """
+        if base is None:
+            base = self.all
+        result = {}
+        for field in FIELDS:
+            mask = base & self.mask(filters, skip=field)
+            bitmaps = self.bitmaps[field]
+            counts = []
+            for value in self.ranked[field]:
+                count = (mask & bitmaps[value]).bit_count()
+                if count:
+                    counts.append({"name": value, "count": count})
+            counts.sort(key=lambda item: item["count"], reverse=True)
+            result[field] = counts
+        return result
@@ -0,0 +1,59 @@
+# 景點目錄 API 的 HTTP 快取：以目錄版本號產生 ETag，符合 If-None-Match 時直接回 304
+import re
+from fastapi import Request, Response
+from catalog import get_catalog
+
+# 各路由的 Cache-Control 設定
+CACHE_POLICIES = [
+    (re.compile(r"^/api/attractions/\d+$"), "public, max-age=300, stale-while-revalidate=600"),
+    (re.compile(r"^/api/attractions$"), "public, max-age=60, stale-while-revalidate=300"),
+    (re.compile(r"^/api/attractions/nearby$"), "public, max-age=300, stale-while-revalidate=600"),
+    (re.compile(r"^/api/mrts$"), "public, max-age=300, stale-while-revalidate=600"),
+]
+
+
+def cache_policy(path):
+    for pattern, policy in CACHE_POLICIES:
+        if pattern.match(path):
+            return policy
+    return None
+
+
+def catalog_etag(version):
+    # 同一個網址的內容只取決於目錄版本，壓縮與否不影響，因此使用弱 ETag
+    return f'W/"catalog-{version}"'
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    target = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == target:
+            return True
+    return False
+
+
+async def catalog_cache_middleware(request: Request, call_next):
+    policy = cache_policy(request.url.path) if request.method in ("GET", "HEAD") else None
+    catalog = get_catalog()
+    # 目錄尚未載入（走資料庫）時沒有版本號，不做快取
+    if policy is None or catalog is None:
+        return await call_next(request)
+
+    etag = catalog_etag(catalog.version)
+    headers = {"ETag": etag, "Cache-Control": policy}
+
+    # 在進入 API（任何查詢）之前就回應 304
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    response = await call_next(request)
+    if response.status_code == 200:
+        response.headers.update(headers)
+    return response
@@ -0,0 +1,118 @@
+# Idempotency-Key：同一位使用者以相同 key 重送請求時，直接回放第一次的回應，不再重新處理（例如不再呼叫 TapPay）
+import hashlib
+import json
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from config import IDEMPOTENCY_LOCK_SECONDS, IDEMPOTENCY_TTL_SECONDS
+from database import get_db_connection, older_than
+
+MAX_KEY_LENGTH = 64
+# 已建立訂單但尚未完成處理時保存的回應（付款結果未知）以此狀態碼回放
+PENDING_STATUS = 200
+
+
+class IdempotencyConflict(Exception):
+    """同一個 key 已用於內容不同的請求"""
+
+
+class RequestInProgress(Exception):
+    """同一個 key 的第一次請求還在處理中"""
+
+
+def fingerprint(payload):
+    # 以內容的雜湊判斷是否為同一個請求
+    content = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+async def claim(user_id, key, request_hash):
+    """取得這個 key 的處理權，回傳 None；已處理完成時回傳 (狀態碼, 回應內容)
+
+    處理中超過 IDEMPOTENCY_LOCK_SECONDS 的 key 視為處理中斷，由這次請求接手
+    """
+    async with get_db_connection() as conn:
+        try:
+            # 以主鍵的唯一性搶處理權，同時送達的重複請求只有一個會成功
+            async with conn.begin():
+                await conn.execute(text("""
+                    INSERT INTO idempotency_keys (user_id, idem_key, request_hash)
+                    VALUES (:user_id, :key, :request_hash)
+                """), {"user_id": user_id, "key": key, "request_hash": request_hash})
+            return None
+        except IntegrityError:
+            pass
+
+        params = {"user_id": user_id, "key": key, "seconds": IDEMPOTENCY_LOCK_SECONDS}
+        async with conn.begin():
+            row = (await conn.execute(text(f"""
+                SELECT request_hash, status_code, response, {older_than("created")} AS stale FROM idempotency_keys
+                WHERE user_id = :user_id AND idem_key = :key
+            """), params)).fetchone()
+
+        if row is None:
+            # 第一次的請求剛好失敗並釋放了 key
+            raise RequestInProgress("相同的請求正在處理中，請稍後再試")
+        if row.request_hash != request_hash:
+            raise IdempotencyConflict("Idempotency-Key 已用於不同的請求")
+        if row.status_code is not None:
+            return row.status_code, json.loads(row.response)
+        if row.stale:
+            # 處理中的 process 異常結束，key 不會再被完成或釋放：已建立訂單時回放保存的回應，否則接手處理
+            if row.response is not None:
+                return PENDING_STATUS, json.loads(row.response)
+            async with conn.begin():
+                # 以條件式 UPDATE 接手，同時重送的請求只有一個會成功
+                result = await conn.execute(text(f"""
+                    UPDATE idempotency_keys SET created = CURRENT_TIMESTAMP
+                    WHERE user_id = :user_id AND idem_key = :key
+                      AND status_code IS NULL AND response IS NULL AND {older_than("created")}
+                """), params)
+            if result.rowcount == 1:
+                return None
+    raise RequestInProgress("相同的請求正在處理中，請稍後再試")
+
+
+async def save_pending(conn, user_id, key, body):
+    """在建立訂單的交易中一併保存「付款結果未知」的回應
+
+    之後即使處理失敗，這個 key 也只會回放這筆訂單，不會再建立訂單或再次呼叫 TapPay
+    """
+    await conn.execute(text("""
+        UPDATE idempotency_keys SET response = :response
+        WHERE user_id = :user_id AND idem_key = :key
+    """), {"user_id": user_id, "key": key, "response": json.dumps(body, ensure_ascii=False)})
+
+
+async def complete(user_id, key, status_code, body):
+    # 保存回應，之後相同 key 的請求直接回放
+    async with get_db_connection() as conn:
+        async with conn.begin():
+            await conn.execute(text("""
+                UPDATE idempotency_keys SET status_code = :status_code, response = :response
+                WHERE user_id = :user_id AND idem_key = :key
+            """), {"user_id": user_id, "key": key, "status_code": status_code,
+                   "response": body.decode("utf-8") if isinstance(body, bytes) else body})
+
+
+async def release(user_id, key):
+    # 處理失敗（伺服器錯誤）時：還沒建立訂單就釋放 key 讓客戶端重試，已建立訂單則改為回放保存的回應
+    params = {"user_id": user_id, "key": key, "status_code": PENDING_STATUS}
+    async with get_db_connection() as conn:
+        async with conn.begin():
+            await conn.execute(text("""
+                UPDATE idempotency_keys SET status_code = :status_code
+                WHERE user_id = :user_id AND idem_key = :key AND status_code IS NULL AND response IS NOT NULL
+            """), params)
+            await conn.execute(text("""
+                DELETE FROM idempotency_keys
+                WHERE user_id = :user_id AND idem_key = :key AND status_code IS NULL AND response IS NULL
+            """), params)
+
+
+async def purge_expired():
+    """刪除建立超過 IDEMPOTENCY_TTL_SECONDS 的 key，回傳刪除的筆數；之後以相同 key 重送會被當成新的請求"""
+    async with get_db_connection() as conn:
+        async with conn.begin():
+            result = await conn.execute(text(f"DELETE FROM idempotency_keys WHERE {older_than('created')}"),
+                                        {"seconds": IDEMPOTENCY_TTL_SECONDS})
+    return result.rowcount
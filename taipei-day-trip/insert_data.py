@@ -1,89 +1,246 @@
+import argparse
+import hashlib
 import json
-import pymysql
 import re
-from database import get_db_connection
-
-# 讀取 JSON
-with open("data/taipei-attractions.json", encoding="utf-8") as f:
-    raw_data = json.load(f)  # 讀取 JSON 內容
-
-# 確保正確讀取景點資料陣列
-data = raw_data["result"]["results"]  # 取出 `results` 陣列
-
-# 連接 MySQL
-conn = get_db_connection()
-cursor = conn.cursor()
-
-# **確保 `attractions` 表存在**
-cursor.execute("""
-    CREATE TABLE IF NOT EXISTS attractions(
-        id          INT PRIMARY KEY AUTO_INCREMENT,
-        name        VARCHAR(255) NOT NULL,
-        category    VARCHAR(50) NOT NULL,
-        description TEXT NOT NULL,
-        address     VARCHAR(255) NOT NULL,
-        transport   TEXT NOT NULL,
-        mrt         VARCHAR(50),
-        lat         DECIMAL(10, 6) NOT NULL,
-        lng         DECIMAL(10, 6) NOT NULL
-    )
-""")
-
-# **確保 `attraction_images` 表存在**
-cursor.execute("""
-    CREATE TABLE IF NOT EXISTS attraction_images(
-        id             INT PRIMARY KEY AUTO_INCREMENT,
-        attraction_id  INT NOT NULL,
-        image_url      VARCHAR(500) NOT NULL,
-        FOREIGN KEY (attraction_id) REFERENCES attractions(id) ON DELETE CASCADE
-    )
-""")
-
-# **清除舊資料，確保重新插入**
-cursor.execute("DELETE FROM attraction_images")
-cursor.execute("DELETE FROM attractions")
-conn.commit()
-
-# **插入資料**
-for index, item in enumerate(data):
-    name = item["name"]
-    category = item["CAT"]  # 使用 `CAT` 作為景點類別
-    description = item["description"]
-    address = item["address"]
-    mrt = item.get("MRT", None)  # 使用 `.get()` 避免 KeyError
-    lat = float(item["latitude"])  # 轉換為 float
-    lng = float(item["longitude"])  # 轉換為 float
-    transport = item.get("direction", "無資料")  # 使用 `.get()`，避免 KeyError
-
-    # **插入 `attractions` 表**
-    cursor.execute("""
-        INSERT INTO attractions (name, category, description, address, transport, mrt, lat, lng)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-    """, (name, category, description, address, transport, mrt, lat, lng))
-
-    # **獲取剛插入的景點 ID**
-    attraction_id = cursor.lastrowid
-    print(f" 已插入景點 {index + 1}: {name} (ID: {attraction_id})")
-
-    # **解析 `file` 欄位並存入 `attraction_images` 表**
-    if "file" in item and item["file"]:
-        # **使用正則表達式抓取所有圖片網址**
-        image_urls = re.findall(r"https?://.*?\.(?:jpg|png|jpeg|JPG|PNG|JPEG)", item["file"])
-        
-        # **確保 URLs 非空**
-        if image_urls:
-            for url in image_urls:
-                cursor.execute("""
-                    INSERT INTO attraction_images (attraction_id, image_url)
-                    VALUES (%s, %s)
-                """, (attraction_id, url))
-                print(f"    插入圖片: {url}")
-        else:
-            print(f" {name} 沒有符合條件的圖片，跳過圖片插入")
-    else:
-        print(f" {name} 沒有 `file` 欄位，跳過圖片插入")
+import time
+from sqlalchemy import text
+from catalog import export_catalog
+from catalog_file import file_stamp
+from config import CATALOG_FILE
+from database import get_sync_connection
+from migrations import migrate
+
+SOURCE_PATH = "data/taipei-attractions.json"
+IMAGE_PATTERN = re.compile(r"https?://.*?\.(?:jpg|png|jpeg|JPG|PNG|JPEG)")
+
+
+# **以串流方式逐筆讀取 `results` 陣列，不需一次載入整個檔案**
+def iter_results(path, chunk_size=1 << 16):
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf-8") as f:
+        buf = ""
+        while True:
+            idx = buf.find('"results"')
+            bracket = buf.find("[", idx) if idx != -1 else -1
+            if bracket != -1:
+                buf = buf[bracket + 1:]
+                break
+            chunk = f.read(chunk_size)
+            if not chunk:
+                raise ValueError("找不到 results 陣列")
+            buf += chunk
+
+        while True:
+            buf = buf.lstrip().lstrip(",").lstrip()
+            if buf.startswith("]"):
+                return
+            try:
+                item, end = decoder.raw_decode(buf)
+            except json.JSONDecodeError:
+                # 目前的緩衝區不是完整的一筆，繼續讀
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    raise
+                buf += chunk
+                continue
+            yield item
+            buf = buf[end:]
+
+
+# **轉換為資料表欄位，並計算內容雜湊供比對**
+def parse_item(item):
+    record = {
+        "serial_no": item["SERIAL_NO"],
+        "name": item["name"],
+        "category": item["CAT"],  # 使用 `CAT` 作為景點類別
+        "description": item["description"],
+        "address": item["address"],
+        "transport": item.get("direction", "無資料"),  # 使用 `.get()`，避免 KeyError
+        "mrt": item.get("MRT", None),
+        "lat": float(item["latitude"]),
+        "lng": float(item["longitude"]),
+    }
+    images = IMAGE_PATTERN.findall(item.get("file") or "")
+    content = json.dumps([record, images], ensure_ascii=False, sort_keys=True)
+    record["content_hash"] = hashlib.sha1(content.encode("utf-8")).hexdigest()
+    return record, images
+
+
+def batches(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def in_clause(prefix, values):
+    # 產生 IN (:p0, :p1, ...) 與對應參數
+    params = {f"{prefix}{i}": value for i, value in enumerate(values)}
+    return "(" + ", ".join(f":{key}" for key in params) + ")", params
+
+
+def write_read_model(conn, rows, batch_size):
+    # rows: 景點欄位加上 id 與圖片列表
+    read_rows = [
+        {**row, "images": json.dumps(row["images"], ensure_ascii=False),
+         "first_image": row["images"][0] if row["images"] else None}
+        for row in rows
+    ]
+    for batch in batches(read_rows, batch_size):
+        conn.execute(text("""
+            INSERT INTO attraction_read (id, name, category, description, address, transport, mrt, lat, lng, images, first_image)
+            VALUES (:id, :name, :category, :description, :address, :transport, :mrt, :lat, :lng, :images, :first_image)
+            ON DUPLICATE KEY UPDATE name = VALUES(name), category = VALUES(category),
+                description = VALUES(description), address = VALUES(address),
+                transport = VALUES(transport), mrt = VALUES(mrt), lat = VALUES(lat),
+                lng = VALUES(lng), images = VALUES(images), first_image = VALUES(first_image)
+        """), batch)
+
+
+def rebuild_read_model(conn, batch_size):
+    # 讀取用資料表與主表筆數不一致時（例如第一次建立），從主表整個重建
+    images = {}
+    for row in conn.execute(text("SELECT attraction_id, image_url FROM attraction_images ORDER BY attraction_id, id")):
+        images.setdefault(row.attraction_id, []).append(row.image_url)
+    rows = [
+        {"id": row.id, "name": row.name, "category": row.category, "description": row.description,
+         "address": row.address, "transport": row.transport, "mrt": row.mrt,
+         "lat": row.lat, "lng": row.lng, "images": images.get(row.id, [])}
+        for row in conn.execute(text("""
+            SELECT id, name, category, description, address, transport, mrt, lat, lng
+            FROM attractions
+        """))
+    ]
+    conn.execute(text("DELETE FROM attraction_read"))
+    write_read_model(conn, rows, batch_size)
+    return len(rows)
+
+
+def load(path=SOURCE_PATH, batch_size=500, catalog_file=CATALOG_FILE):
+    started = time.perf_counter()
+
+    with get_sync_connection() as conn:
+        # 資料表與索引由 migrations.py 統一管理
+        migrate(conn)
 
-# **提交變更並關閉連線**
-conn.commit()
-conn.close()
-print("資料存入成功！")
+        with conn.begin():
+            # 現有資料：serial_no（舊資料沒有時以名稱對應）→ (id, content_hash)
+            existing = {}
+            legacy = {}
+            for row in conn.execute(text("SELECT id, serial_no, name, content_hash FROM attractions")):
+                if row.serial_no:
+                    existing[row.serial_no] = (row.id, row.content_hash)
+                else:
+                    legacy[row.name] = row.id
+
+            upserts = []
+            images = {}
+            seen = set()
+            adopted = []
+            total = 0
+
+            for item in iter_results(path):
+                total += 1
+                record, urls = parse_item(item)
+                serial_no = record["serial_no"]
+                seen.add(serial_no)
+
+                current = existing.get(serial_no)
+                if current is None and record["name"] in legacy:
+                    # 舊版匯入的資料沒有 serial_no，沿用原本的 id 以免影響預定與訂單
+                    adopted.append({"id": legacy.pop(record["name"]), "serial_no": serial_no})
+                    current = (None, None)
+                if current is not None and current[1] == record["content_hash"]:
+                    continue
+                upserts.append(record)
+                images[serial_no] = urls
+
+            stale = [row_id for serial_no, (row_id, _) in existing.items() if serial_no not in seen]
+            stale.extend(legacy.values())
+
+            # **所有變更在同一個交易中套用，提交前 API 讀到的仍是舊資料**
+            if adopted:
+                conn.execute(text("UPDATE attractions SET serial_no = :serial_no WHERE id = :id"), adopted)
+
+            for batch in batches(upserts, batch_size):
+                conn.execute(text("""
+                    INSERT INTO attractions (serial_no, name, category, description, address, transport, mrt, lat, lng, content_hash)
+                    VALUES (:serial_no, :name, :category, :description, :address, :transport, :mrt, :lat, :lng, :content_hash)
+                    ON DUPLICATE KEY UPDATE name = VALUES(name), category = VALUES(category),
+                        description = VALUES(description), address = VALUES(address),
+                        transport = VALUES(transport), mrt = VALUES(mrt), lat = VALUES(lat),
+                        lng = VALUES(lng), content_hash = VALUES(content_hash)
+                """), batch)
+
+            if upserts:
+                ids = {}
+                for batch in batches([r["serial_no"] for r in upserts], batch_size):
+                    clause, params = in_clause("s", batch)
+                    result = conn.execute(text(f"SELECT id, serial_no FROM attractions WHERE serial_no IN {clause}"), params)
+                    for row in result:
+                        ids[row.serial_no] = row.id
+
+                for batch in batches(list(ids.values()), batch_size):
+                    clause, params = in_clause("a", batch)
+                    conn.execute(text(f"DELETE FROM attraction_images WHERE attraction_id IN {clause}"), params)
+
+                image_rows = [
+                    {"attraction_id": ids[serial_no], "image_url": url}
+                    for serial_no, urls in images.items()
+                    for url in urls
+                ]
+                for batch in batches(image_rows, batch_size):
+                    conn.execute(text("""
+                        INSERT INTO attraction_images (attraction_id, image_url)
+                        VALUES (:attraction_id, :image_url)
+                    """), batch)
+
+                write_read_model(conn, [
+                    {**{k: v for k, v in record.items() if k not in ("serial_no", "content_hash")},
+                     "id": ids[record["serial_no"]], "images": images[record["serial_no"]]}
+                    for record in upserts
+                ], batch_size)
+
+            for batch in batches(stale, batch_size):
+                clause, params = in_clause("d", batch)
+                conn.execute(text(f"DELETE FROM attractions WHERE id IN {clause}"), params)
+
+            # **讀取用資料表缺資料時整個重建（刪除的景點會由外鍵連帶刪除）**
+            rebuilt = 0
+            counts = conn.execute(text("""
+                SELECT (SELECT COUNT(*) FROM attractions), (SELECT COUNT(*) FROM attraction_read)
+            """)).fetchone()
+            if counts[0] != counts[1]:
+                rebuilt = rebuild_read_model(conn, batch_size)
+
+            # **有變更才更新目錄版本號，通知 API 重新載入**
+            if upserts or stale or adopted or rebuilt:
+                conn.execute(text("""
+                    INSERT INTO catalog_meta (id, version) VALUES (1, 1)
+                    ON DUPLICATE KEY UPDATE version = version + 1
+                """))
+
+        # **輸出給 API worker 以 mmap 共用的目錄檔；沒有變更且檔案已存在時不替換，避免 worker 無謂地重新載入**
+        if catalog_file and (upserts or stale or adopted or rebuilt or file_stamp(catalog_file) is None):
+            count = export_catalog(conn, catalog_file)
+            print(f"已輸出目錄檔 {catalog_file}（{count} 筆）")
+
+    elapsed = time.perf_counter() - started
+    rate = total / elapsed if elapsed > 0 else float("inf")
+    print(f"共 {total} 筆景點：新增或更新 {len(upserts)} 筆，刪除 {len(stale)} 筆，"
+          f"未變更 {total - len(upserts)} 筆")
+    print(f"耗時 {elapsed:.2f} 秒（{rate:.0f} 筆/秒）")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="匯入景點資料")
+    parser.add_argument("--path", default=SOURCE_PATH, help="景點 JSON 檔案路徑")
+    parser.add_argument("--batch-size", type=int, default=500, help="每批寫入的筆數")
+    parser.add_argument("--catalog-file", default=CATALOG_FILE, help="匯入後輸出的二進位目錄檔路徑（預設為 CATALOG_FILE）")
+    parser.add_argument("--catalog-only", action="store_true", help="不匯入資料，只從資料庫重新輸出目錄檔")
+    args = parser.parse_args()
+    if args.catalog_only:
+        if not args.catalog_file:
+            parser.error("需要 --catalog-file 或設定 CATALOG_FILE")
+        with get_sync_connection() as conn:
+            print(f"已輸出目錄檔 {args.catalog_file}（{export_catalog(conn, args.catalog_file)} 筆）")
+    else:
+        load(args.path, args.batch_size, args.catalog_file)
@@ -0,0 +1,87 @@
+# 行程名額：每個 (景點, 日期, 時段) 一列計數，以條件式 UPDATE 佔用與釋放名額，不需要鎖表
+import datetime
+from sqlalchemy import text
+from cache import TTLCache
+from config import SLOT_CAPACITY, AVAILABILITY_CACHE_TTL
+from database import get_read_connection
+
+TIMES = ("morning", "afternoon")
+MAX_DAYS = 90
+
+# 時段第一次被預約時才建立計數列，已存在時不覆蓋；SQLite 供測試與壓測使用
+SLOT_INSERT = {
+    "mysql": """
+        INSERT IGNORE INTO slot_inventory (attraction_id, date, time, capacity, reserved)
+        VALUES (:attraction_id, :date, :time, :capacity, 0)
+    """,
+    "sqlite": """
+        INSERT OR IGNORE INTO slot_inventory (attraction_id, date, time, capacity, reserved)
+        VALUES (:attraction_id, :date, :time, :capacity, 0)
+    """,
+}
+
+
+class SoldOut(Exception):
+    """該時段已額滿"""
+
+
+class UnknownAttraction(Exception):
+    """景點不存在"""
+
+
+def _slot(attraction_id, date, time):
+    return {"attraction_id": attraction_id, "date": date, "time": time}
+
+
+async def reserve(conn, attraction_id, date, time):
+    # INSERT IGNORE 會連外鍵錯誤一起忽略，景點不存在時會被當成額滿，需先確認
+    result = await conn.execute(text("SELECT id FROM attractions WHERE id = :attraction_id"), {"attraction_id": attraction_id})
+    if result.fetchone() is None:
+        raise UnknownAttraction("無效的景點的 ID")
+    # 只有還有空位時才會更新成功，同時搶同一時段的請求由資料列鎖自然排隊，不會超賣
+    await conn.execute(text(SLOT_INSERT[conn.dialect.name]), {**_slot(attraction_id, date, time), "capacity": SLOT_CAPACITY})
+    result = await conn.execute(text("""
+        UPDATE slot_inventory SET reserved = reserved + 1
+        WHERE attraction_id = :attraction_id AND date = :date AND time = :time AND reserved < capacity
+    """), _slot(attraction_id, date, time))
+    if result.rowcount != 1:
+        raise SoldOut("此時段已額滿")
+
+
+async def release(conn, attraction_id, date, time):
+    await conn.execute(text("""
+        UPDATE slot_inventory SET reserved = reserved - 1
+        WHERE attraction_id = :attraction_id AND date = :date AND time = :time AND reserved > 0
+    """), _slot(attraction_id, date, time))
+
+
+# attraction_id → {(日期, 時段): 剩餘名額}，只包含已有人預約的時段；到期前的變動不反映在這裡
+_counters = TTLCache(1000, AVAILABILITY_CACHE_TTL)
+
+
+async def get_counters(attraction_id):
+    # 快取命中時不取用資料庫連線
+    counters = _counters.get(attraction_id)
+    if counters is not None:
+        return counters
+
+    async with get_read_connection() as conn:
+        result = await conn.execute(text("""
+            SELECT date, time, capacity, reserved FROM slot_inventory
+            WHERE attraction_id = :attraction_id AND date >= :today
+        """), {"attraction_id": attraction_id, "today": datetime.date.today().isoformat()})
+        counters = {(str(row.date), row.time): max(row.capacity - row.reserved, 0) for row in result}
+    _counters.set(attraction_id, counters)
+    return counters
+
+
+def remaining(counters, date, time):
+    return counters.get((date, time), SLOT_CAPACITY)
+
+
+def calendar(counters, start, days):
+    """從 start 起 days 天每個時段的剩餘名額，沒有計數列的時段為完整名額"""
+    return [
+        {"date": day, **{time: remaining(counters, day, time) for time in TIMES}}
+        for day in ((start + datetime.timedelta(days=offset)).isoformat() for offset in range(days))
+    ]
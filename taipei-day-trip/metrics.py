@@ -0,0 +1,189 @@
+# 執行期指標：請求延遲、每請求 SQL 數、SQL 耗時、connection pool 使用狀況與 TapPay 呼叫延遲
+# 以 Prometheus 文字格式輸出於 /metrics
+import contextvars
+import logging
+import re
+import time
+from fastapi import Request
+from sqlalchemy import event
+from config import SLOW_QUERY_SECONDS
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in self.values.items():
+            lines.append(f"{self.name}{_format_labels(self.labels, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {}  # labels → [各 bucket 計數, 總和, 次數]
+
+    def observe(self, value, *labels):
+        state = self.values.get(labels)
+        if state is None:
+            state = self.values[labels] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[0][i] += 1
+        state[1] += value
+        state[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in self.values.items():
+            for bound, bucket_count in zip(self.buckets, counts):
+                label_str = _format_labels(self.labels + ("le",), labels + (bound,))
+                lines.append(f"{self.name}_bucket{label_str} {bucket_count}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels + ('le',), labels + ('+Inf',))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, labels)} {count}")
+        return lines
+
+
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "HTTP 請求處理時間", ("method", "route", "status"))
+REQUEST_QUERIES = Histogram("http_request_sql_queries", "每個 HTTP 請求執行的 SQL 數", ("route",), COUNT_BUCKETS)
+QUERY_LATENCY = Histogram("db_query_duration_seconds", "SQL 執行時間", ("route",))
+SLOW_QUERIES = Counter("db_slow_queries_total", "超過門檻的慢查詢數", ("route",))
+POOL_WAIT = Histogram("db_pool_checkout_wait_seconds", "從 connection pool 取得連線的等待時間")
+POOL_CHECKOUTS = Counter("db_pool_checkouts_total", "connection pool 取出連線次數")
+TAPPAY_LATENCY = Histogram("tappay_request_duration_seconds", "TapPay pay-by-prime 呼叫時間", ("outcome",))
+REJECTED_REQUESTS = Counter("http_requests_rejected_total", "被限流或負載保護拒絕的請求數", ("reason",))
+
+# 目前請求的統計資料（scope 與 SQL 數），由 middleware 設定
+_request_stats = contextvars.ContextVar("request_stats", default=None)
+_pool = None
+
+
+def current_route_from(scope):
+    # 以路由樣板（例如 /api/attractions/{id}）當標籤，避免標籤數無限增加
+    route = scope.get("route")
+    return route.path if route is not None else "unmatched"
+
+
+def current_route():
+    # 不在請求中（例如啟動時載入目錄）時標為 "-"
+    stats = _request_stats.get()
+    if stats is None:
+        return "-"
+    return current_route_from(stats["scope"])
+
+
+def _shape(parameters):
+    # 只記錄參數名稱與型別，不記錄內容
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            return f"{len(parameters)} x {_shape(parameters[0])}"
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+def instrument_engine(engine, track_pool=True):
+    """在同步引擎（AsyncEngine 請傳入 .sync_engine）上掛 SQL 與 pool 事件
+
+    track_pool 為 True 的引擎（主資料庫）才輸出 pool 大小等 gauge
+    """
+    global _pool
+    if track_pool:
+        _pool = engine.pool
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        route = current_route()
+        QUERY_LATENCY.observe(elapsed, route)
+
+        stats = _request_stats.get()
+        if stats is not None:
+            stats["queries"] += 1
+
+        if elapsed >= SLOW_QUERY_SECONDS:
+            SLOW_QUERIES.inc(route)
+            logger.warning("慢查詢 %.3fs [%s] %s 參數: %s", elapsed, route,
+                           re.sub(r"\s+", " ", statement).strip()[:300], _shape(parameters))
+
+    @event.listens_for(engine, "checkout")
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        POOL_CHECKOUTS.inc()
+
+
+def observe_pool_wait(seconds):
+    POOL_WAIT.observe(seconds)
+
+
+def _pool_lines():
+    # QueuePool 才有 size / overflow（SQLite 測試時可能是其他 pool）
+    if _pool is None or not hasattr(_pool, "overflow"):
+        return []
+    return [
+        "# HELP db_pool_size connection pool 設定大小",
+        "# TYPE db_pool_size gauge",
+        f"db_pool_size {_pool.size()}",
+        "# HELP db_pool_checked_out 目前借出的連線數",
+        "# TYPE db_pool_checked_out gauge",
+        f"db_pool_checked_out {_pool.checkedout()}",
+        "# HELP db_pool_overflow 目前使用中的 overflow 連線數（負值表示尚未建立的連線）",
+        "# TYPE db_pool_overflow gauge",
+        f"db_pool_overflow {_pool.overflow()}",
+    ]
+
+
+def render():
+    lines = []
+    for metric in (REQUEST_LATENCY, REQUEST_QUERIES, QUERY_LATENCY, SLOW_QUERIES,
+                   POOL_WAIT, POOL_CHECKOUTS, TAPPAY_LATENCY, REJECTED_REQUESTS):
+        lines.extend(metric.render())
+    lines.extend(_pool_lines())
+    return "\n".join(lines) + "\n"
+
+
+async def metrics_middleware(request: Request, call_next):
+    stats = {"scope": request.scope, "queries": 0}
+    token = _request_stats.set(stats)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        _request_stats.reset(token)
+        route = current_route_from(request.scope)
+        REQUEST_LATENCY.observe(time.perf_counter() - started, request.method, route, status)
+        REQUEST_QUERIES.observe(stats["queries"], route)
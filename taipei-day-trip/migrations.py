@@ -0,0 +1,259 @@
+# 資料庫結構與索引：依版本號依序套用 migration，已套用的版本記錄在 schema_migrations
+# 同一份定義適用 MySQL 與 SQLite（測試與壓測），少數型別依資料庫替換
+import argparse
+from sqlalchemy import inspect, text
+
+# 依資料庫替換的欄位定義
+COLUMN_TYPES = {
+    "mysql": {
+        "pk": "INTEGER PRIMARY KEY AUTO_INCREMENT",
+        "created": "DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP",
+        "created_ms": "DATETIME(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3)",
+    },
+    "sqlite": {
+        "pk": "INTEGER PRIMARY KEY AUTOINCREMENT",
+        "created": "TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP",
+        "created_ms": "TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now'))",
+    },
+}
+
+TABLES = [
+    # 會員
+    """
+    CREATE TABLE IF NOT EXISTS users(
+        id        {pk},
+        name      VARCHAR(255) NOT NULL,
+        email     VARCHAR(255) NOT NULL UNIQUE,
+        password  VARCHAR(255) NOT NULL
+    )
+    """,
+    # 景點主表（由 insert_data.py 匯入）
+    """
+    CREATE TABLE IF NOT EXISTS attractions(
+        id            {pk},
+        serial_no     VARCHAR(32) UNIQUE,
+        name          VARCHAR(255) NOT NULL,
+        category      VARCHAR(50) NOT NULL,
+        description   TEXT NOT NULL,
+        address       VARCHAR(255) NOT NULL,
+        transport     TEXT NOT NULL,
+        mrt           VARCHAR(50),
+        lat           DECIMAL(10, 6) NOT NULL,
+        lng           DECIMAL(10, 6) NOT NULL,
+        content_hash  CHAR(40)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS attraction_images(
+        id             {pk},
+        attraction_id  INTEGER NOT NULL,
+        image_url      VARCHAR(500) NOT NULL,
+        FOREIGN KEY (attraction_id) REFERENCES attractions(id) ON DELETE CASCADE
+    )
+    """,
+    # API 讀取用的反正規化資料，圖片已依序存成 JSON 陣列
+    """
+    CREATE TABLE IF NOT EXISTS attraction_read(
+        id           INTEGER PRIMARY KEY,
+        name         VARCHAR(255) NOT NULL,
+        category     VARCHAR(50) NOT NULL,
+        description  TEXT NOT NULL,
+        address      VARCHAR(255) NOT NULL,
+        transport    TEXT NOT NULL,
+        mrt          VARCHAR(50),
+        lat          DECIMAL(10, 6) NOT NULL,
+        lng          DECIMAL(10, 6) NOT NULL,
+        images       JSON NOT NULL,
+        first_image  VARCHAR(500),
+        FOREIGN KEY (id) REFERENCES attractions(id) ON DELETE CASCADE
+    )
+    """,
+    # API 依版本號判斷是否重新載入景點目錄
+    """
+    CREATE TABLE IF NOT EXISTS catalog_meta(
+        id       TINYINT PRIMARY KEY,
+        version  BIGINT NOT NULL
+    )
+    """,
+    # 每位使用者只有一筆預定（post_booking 的 upsert 依賴 user_id 唯一）
+    """
+    CREATE TABLE IF NOT EXISTS booking(
+        id             {pk},
+        user_id        INTEGER NOT NULL UNIQUE,
+        attraction_id  INTEGER NOT NULL,
+        date           DATE NOT NULL,
+        time           VARCHAR(20) NOT NULL,
+        price          INTEGER NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+        FOREIGN KEY (attraction_id) REFERENCES attractions(id) ON DELETE CASCADE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS orders(
+        id             {pk},
+        order_number   VARCHAR(32) NOT NULL UNIQUE,
+        user_id        INTEGER NOT NULL,
+        attraction_id  INTEGER NOT NULL,
+        date           DATE NOT NULL,
+        time           VARCHAR(20) NOT NULL,
+        price          INTEGER NOT NULL,
+        contact_name   VARCHAR(255) NOT NULL,
+        contact_email  VARCHAR(255) NOT NULL,
+        contact_phone  VARCHAR(20) NOT NULL,
+        status         VARCHAR(10) NOT NULL,
+        created        {created_ms},
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    )
+    """,
+    # 每個景點、日期、時段的名額與已預約數
+    """
+    CREATE TABLE IF NOT EXISTS slot_inventory(
+        attraction_id  INTEGER NOT NULL,
+        date           DATE NOT NULL,
+        time           VARCHAR(20) NOT NULL,
+        capacity       INTEGER NOT NULL,
+        reserved       INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (attraction_id, date, time),
+        FOREIGN KEY (attraction_id) REFERENCES attractions(id) ON DELETE CASCADE
+    )
+    """,
+    # 下單請求的 Idempotency-Key 與保存的回應
+    """
+    CREATE TABLE IF NOT EXISTS idempotency_keys(
+        user_id       INTEGER NOT NULL,
+        idem_key      VARCHAR(64) NOT NULL,
+        request_hash  CHAR(64) NOT NULL,
+        status_code   SMALLINT,
+        response      TEXT,
+        created       {created},
+        PRIMARY KEY (user_id, idem_key)
+    )
+    """,
+]
+
+# (資料表, 索引名稱, 欄位, 是否唯一)；已有相同欄位開頭的索引時不重複建立
+INDEXES = [
+    ("users", "uq_users_email", ["email"], True),
+    ("attractions", "idx_attractions_mrt", ["mrt"], False),
+    # 重建讀取用資料表時依 (attraction_id, id) 讀取圖片，InnoDB 與 SQLite 的索引都已隱含主鍵
+    ("attraction_images", "idx_attraction_images_attraction", ["attraction_id"], False),
+    # 目錄未載入時的捷運站與分類篩選
+    ("attraction_read", "idx_attraction_read_mrt", ["mrt"], False),
+    ("attraction_read", "idx_attraction_read_category", ["category"], False),
+    ("booking", "uq_booking_user", ["user_id"], True),
+    ("orders", "uq_orders_number", ["order_number"], True),
+    # 歷史訂單依 (user_id, created) 分頁
+    ("orders", "idx_orders_user_created", ["user_id", "created"], False),
+]
+
+
+def create_tables(conn):
+    types = COLUMN_TYPES[conn.dialect.name]
+    for ddl in TABLES:
+        conn.execute(text(ddl.format(**types)))
+
+
+def upgrade_legacy_columns(conn):
+    # 手動建立或舊版 insert_data.py 建立的 MySQL 資料表補上後來加入的欄位
+    if conn.dialect.name != "mysql":
+        return
+    inspector = inspect(conn)
+    columns = {column["name"]: column for column in inspector.get_columns("attractions")}
+    if "serial_no" not in columns:
+        conn.execute(text("ALTER TABLE attractions ADD COLUMN serial_no VARCHAR(32) UNIQUE AFTER id"))
+    if "content_hash" not in columns:
+        conn.execute(text("ALTER TABLE attractions ADD COLUMN content_hash CHAR(40)"))
+
+    columns = {column["name"]: column for column in inspector.get_columns("orders")}
+    if "created" not in columns:
+        conn.execute(text("ALTER TABLE orders ADD COLUMN created DATETIME(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3)"))
+    # 訂單編號為 23 碼（見 order_numbers.py）
+    if (getattr(columns["order_number"]["type"], "length", None) or 0) < 32:
+        conn.execute(text("ALTER TABLE orders MODIFY order_number VARCHAR(32) NOT NULL"))
+
+
+def has_index(conn, table, columns, unique=False):
+    inspector = inspect(conn)
+    primary = inspector.get_pk_constraint(table).get("constrained_columns") or []
+    candidates = [(primary, True)]
+    candidates += [(index["column_names"], index.get("unique", False)) for index in inspector.get_indexes(table)]
+    candidates += [(constraint["column_names"], True) for constraint in inspector.get_unique_constraints(table)]
+    for names, is_unique in candidates:
+        if unique:
+            if is_unique and names == columns:
+                return True
+        elif names[:len(columns)] == columns:
+            return True
+    return False
+
+
+# 逾時未付款訂單的清理依 (status, created) 找出最舊的 UNPAID 訂單
+ORDER_STATUS_INDEXES = [
+    ("orders", "idx_orders_status_created", ["status", "created"], False),
+]
+
+# 過期的 Idempotency-Key 依 created 清除
+IDEMPOTENCY_INDEXES = [
+    ("idempotency_keys", "idx_idempotency_keys_created", ["created"], False),
+]
+
+
+def create_indexes(conn, indexes=INDEXES):
+    for table, name, columns, unique in indexes:
+        if not has_index(conn, table, columns, unique):
+            kind = "UNIQUE INDEX" if unique else "INDEX"
+            conn.execute(text(f"CREATE {kind} {name} ON {table} ({', '.join(columns)})"))
+
+
+MIGRATIONS = [
+    (1, "建立所有資料表", create_tables),
+    (2, "補上舊版資料表缺少的欄位", upgrade_legacy_columns),
+    (3, "建立次要索引", create_indexes),
+    (4, "建立訂單狀態索引", lambda conn: create_indexes(conn, ORDER_STATUS_INDEXES)),
+    (5, "建立 Idempotency-Key 清除用的索引", lambda conn: create_indexes(conn, IDEMPOTENCY_INDEXES)),
+]
+
+
+def applied_versions(conn):
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS schema_migrations(
+            version     INTEGER PRIMARY KEY,
+            name        VARCHAR(255) NOT NULL,
+            applied_at  {COLUMN_TYPES[conn.dialect.name]["created"]}
+        )
+    """))
+    return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def migrate(conn):
+    """套用尚未套用的 migration（同步連線），回傳這次套用的版本"""
+    applied = applied_versions(conn)
+    done = []
+    for version, name, apply in MIGRATIONS:
+        if version in applied:
+            continue
+        apply(conn)
+        conn.execute(text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"),
+                     {"version": version, "name": name})
+        conn.commit()   # MySQL 的 DDL 本來就會自動提交，這裡確保版本紀錄一起寫入
+        print(f"已套用 migration {version}：{name}")
+        done.append(version)
+    conn.commit()
+    return done
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="資料庫結構 migration")
+    parser.add_argument("--status", action="store_true", help="只列出各版本是否已套用")
+    args = parser.parse_args()
+
+    from database import get_sync_connection
+    with get_sync_connection() as conn:
+        if args.status:
+            applied = applied_versions(conn)
+            conn.commit()
+            for version, name, _ in MIGRATIONS:
+                print(f"{version:>3} {'已套用' if version in applied else '未套用'}  {name}")
+        else:
+            if not migrate(conn):
+                print("資料庫結構已是最新版本")
@@ -0,0 +1,43 @@
+# 本機測試用的 TapPay 模擬伺服器
+# 啟動：uvicorn mock_tappay:app --port 9000
+# 並設定 TAPPAY_URL=http://localhost:9000/tpc/payment/pay-by-prime
+#       TAPPAY_RECORD_URL=http://localhost:9000/tpc/transaction/query
+import asyncio
+import os
+import random
+from fastapi import FastAPI, Request
+
+app = FastAPI()
+
+# 模擬 TapPay 的回應時間（秒）與失敗率
+MOCK_DELAY = float(os.getenv("MOCK_TAPPAY_DELAY", "0.3"))
+MOCK_FAIL_RATE = float(os.getenv("MOCK_TAPPAY_FAIL_RATE", "0"))
+
+# 訂單編號 → 交易紀錄，供交易紀錄查詢使用
+records = {}
+
+@app.post("/tpc/payment/pay-by-prime")
+async def pay_by_prime(request: Request):
+    body = await request.json()
+    await asyncio.sleep(MOCK_DELAY)
+
+    # prime 為 "fail" 或依失敗率抽中時回傳付款失敗
+    rec_trade_id = f"MOCK{random.randrange(10**12):012d}"
+    if body.get("prime") == "fail" or random.random() < MOCK_FAIL_RATE:
+        records.setdefault(body.get("order_number"), []).append({"rec_trade_id": rec_trade_id, "record_status": -1})
+        return {"status": 10003, "msg": "Card Error"}
+
+    records.setdefault(body.get("order_number"), []).append({"rec_trade_id": rec_trade_id, "record_status": 1})
+    return {
+        "status": 0,
+        "msg": "Success",
+        "amount": body.get("amount"),
+        "rec_trade_id": rec_trade_id
+    }
+
+
+@app.post("/tpc/transaction/query")
+async def query_records(request: Request):
+    body = await request.json()
+    order_number = (body.get("filters") or {}).get("order_number")
+    return {"status": 0, "msg": "Success", "trade_records": records.get(order_number, [])}
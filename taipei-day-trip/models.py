@@ -0,0 +1,104 @@
+# API 回應的資料模型，只用於 OpenAPI 文件（路由以 responses 宣告，執行時不驗證也不經過模型），實際輸出由 ORJSONResponse 直接序列化
+from pydantic import BaseModel
+from typing import Any, List, Optional, Union
+from catalog import decode_images
+from order import AttractionInfo, TripInfo
+
+class Attraction(BaseModel):
+    id: int
+    name: str
+    category: str
+    description: str
+    address: str
+    transport: str
+    mrt: Optional[str] = None
+    lat: float
+    lng: float
+    images: List[str]
+
+class FacetCount(BaseModel):
+    name: str
+    count: int
+
+class Facets(BaseModel):
+    category: List[FacetCount]
+    mrt: List[FacetCount]
+
+class AttractionPage(BaseModel):
+    nextPage: Optional[int] = None
+    nextCursor: Optional[str] = None
+    data: List[Attraction]
+    facets: Optional[Facets] = None     # 只有 facets=true 時才回傳
+
+class AttractionDetail(BaseModel):
+    data: Attraction
+
+class NearbyAttraction(Attraction):
+    distance: int       # 公尺
+
+class NearbyList(BaseModel):
+    data: List[NearbyAttraction]
+
+class AvailabilityDay(BaseModel):
+    date: str
+    morning: int        # 剩餘名額
+    afternoon: int
+
+class AvailabilityCalendar(BaseModel):
+    capacity: int
+    data: List[AvailabilityDay]
+
+class MrtList(BaseModel):
+    data: List[str]
+
+class User(BaseModel):
+    id: int
+    name: str
+    email: str
+
+class UserAuth(BaseModel):
+    data: Optional[User] = None
+
+class Booking(BaseModel):
+    attraction: AttractionInfo
+    date: str
+    time: str
+    price: int
+
+class BookingResponse(BaseModel):
+    data: Optional[Booking] = None
+
+class OrderSummary(BaseModel):
+    number: str
+    price: int
+    trip: TripInfo
+    status: int         # 1 為已付款
+    created: str
+
+class OrderHistory(BaseModel):
+    nextCursor: Optional[str] = None
+    data: List[OrderSummary]
+
+class BatchResult(BaseModel):
+    id: Union[str, int]
+    status: int
+    body: Any = None
+
+class BatchResponse(BaseModel):
+    responses: List[BatchResult]
+
+
+# 資料庫列一次轉成可直接序列化的 dict（DECIMAL 轉 float、圖片 JSON 解開）
+def attraction_from_row(row):
+    return {
+        "id": row.id,
+        "name": row.name,
+        "category": row.category,
+        "description": row.description,
+        "address": row.address,
+        "transport": row.transport,
+        "mrt": row.mrt,
+        "lat": float(row.lat),
+        "lng": float(row.lng),
+        "images": decode_images(row.images),
+    }
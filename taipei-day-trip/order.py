@@ -1,13 +1,13 @@
 # models/order.py
 
 from pydantic import BaseModel
-from typing import Literal
+from typing import Literal, Optional
 
 class AttractionInfo(BaseModel):
     id: int
     name: str
     address: str
-    image: str
+    image: Optional[str] = None
 
 class TripInfo(BaseModel):
     attraction: AttractionInfo
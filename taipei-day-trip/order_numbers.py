@@ -0,0 +1,88 @@
+# 訂單編號產生器（Snowflake 形式）：毫秒時間 + worker 編號 + 同一毫秒內的序號，不需查詢資料庫
+# 編號格式為 YYYYMMDDHHMMSSmmm + 3 位 worker + 3 位序號，共 23 位數字，依字串排序即為時間順序
+import os
+import threading
+import time
+from datetime import datetime
+from config import ORDER_HOST_ID, ORDER_WORKERS_PER_HOST, ORDER_WORKER_LOCK_DIR
+
+WORKER_LIMIT = 1000
+SEQUENCE_LIMIT = 1000
+
+try:
+    import fcntl
+except ImportError:     # Windows 沒有 fcntl，改用 pid
+    fcntl = None
+
+
+def _claim_worker_id():
+    """取得這個 process 專用的 worker 編號：主機編號 × ORDER_WORKERS_PER_HOST + 本機 slot
+
+    slot 在本機以檔案鎖搶第一個空的編號，process 結束時鎖自動釋放；
+    主機編號由設定決定，不同主機、同一主機的不同 process 都不會拿到相同的 worker 編號
+    """
+    hosts = WORKER_LIMIT // ORDER_WORKERS_PER_HOST
+    if not 0 <= ORDER_HOST_ID < hosts:
+        raise ValueError(f"ORDER_HOST_ID 需介於 0 與 {hosts - 1} 之間（ORDER_WORKERS_PER_HOST={ORDER_WORKERS_PER_HOST}）")
+    base = ORDER_HOST_ID * ORDER_WORKERS_PER_HOST
+    if fcntl is None:
+        return base + os.getpid() % ORDER_WORKERS_PER_HOST, None
+
+    os.makedirs(ORDER_WORKER_LOCK_DIR, exist_ok=True)
+    for slot in range(ORDER_WORKERS_PER_HOST):
+        handle = open(os.path.join(ORDER_WORKER_LOCK_DIR, f"worker-{slot:03d}.lock"), "w")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            continue
+        return base + slot, handle     # 保留 handle 才能持有鎖
+    raise RuntimeError("沒有可用的訂單編號 worker")
+
+
+class OrderNumberGenerator:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._worker_id = None
+        self._lock_handle = None
+        self._last_ms = 0
+        self._sequence = 0
+
+    @property
+    def worker_id(self):
+        # fork 出來的子 process 會繼承父 process 的狀態，發現 pid 不同時重新取得編號
+        if self._pid != os.getpid():
+            self._worker_id, self._lock_handle = _claim_worker_id()
+            self._pid = os.getpid()
+            self._last_ms = 0
+            self._sequence = 0
+        return self._worker_id
+
+    def next(self):
+        with self._lock:
+            worker_id = self.worker_id
+            now_ms = time.time_ns() // 1_000_000
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._sequence = 0
+            else:
+                # 同一毫秒內、或系統時間被往回調時，沿用上次的時間繼續遞增序號，
+                # 序號用完就借用下一毫秒，確保編號只會遞增
+                self._sequence += 1
+                if self._sequence >= SEQUENCE_LIMIT:
+                    self._last_ms += 1
+                    self._sequence = 0
+            ms = self._last_ms
+            sequence = self._sequence
+
+        stamp = datetime.fromtimestamp(ms / 1000).strftime("%Y%m%d%H%M%S")
+        return f"{stamp}{ms % 1000:03d}{worker_id:03d}{sequence:03d}"
+
+
+_generator = OrderNumberGenerator()
+
+
+def next_order_number():
+    return _generator.next()
+
@@ -0,0 +1,67 @@
+# 伺服器端渲染的首頁與景點頁：第一頁景點、捷運站與景點內容直接寫進 HTML，並嵌入相同的 JSON 供前端接手，
+# 瀏覽器不必等 /api/attractions、/api/mrts 回應才顯示內容
+# 頁面不含任何使用者資料（登入狀態由前端以 localStorage 的 token 判斷），渲染結果可依目錄版本直接快取
+from fastapi.responses import HTMLResponse
+from fastapi.templating import Jinja2Templates
+from cache import TTLCache
+from catalog import get_catalog
+from config import PAGE_CACHE_SIZE, PAGE_CACHE_TTL
+
+# 與 /api/attractions 每頁筆數、attraction.js 顯示的附近景點數相同
+PER_PAGE = 12
+NEARBY_LIMIT = 4
+NEARBY_RADIUS = 2000
+
+templates = Jinja2Templates(directory="templates")
+
+# (目錄版本, 頁面, 頁碼／景點編號) → 渲染好的 HTML
+_rendered = TTLCache(PAGE_CACHE_SIZE, PAGE_CACHE_TTL)
+
+
+def _render(name, **context):
+    return templates.get_template(name).render(**context)
+
+
+def _cached(key, build):
+    html = _rendered.get(key)
+    if html is None:
+        html = build()
+        _rendered.set(key, html)
+    return HTMLResponse(html)
+
+
+def render_index(page=0):
+    catalog = get_catalog()
+    # 目錄尚未載入時回傳不含資料的頁面，由前端呼叫 API（與 API 改走資料庫的情況相同）
+    if catalog is None:
+        return HTMLResponse(_render("index.html", initial=None))
+
+    def build():
+        items, next_page, _ = catalog.page(None, PER_PAGE, page=page)
+        initial = {
+            "page": {"nextPage": next_page, "data": [a.to_dict() for a in items]},
+            "mrts": catalog.mrts,
+        }
+        return _render("index.html", initial=initial)
+
+    return _cached((catalog.version, "index", page), build)
+
+
+def render_attraction(attraction_id):
+    catalog = get_catalog()
+    if catalog is None:
+        return HTMLResponse(_render("attraction.html", initial=None))
+
+    record = catalog.by_id.get(attraction_id)
+    if record is None:
+        return HTMLResponse(_render("attraction.html", initial=None), status_code=404)
+
+    def build():
+        hits = catalog.spatial.nearby(record.lat, record.lng, NEARBY_RADIUS, NEARBY_LIMIT, exclude=record.id)
+        initial = {
+            "attraction": record.to_dict(),
+            "nearby": [{**a.to_dict(), "distance": round(distance)} for distance, a in hits],
+        }
+        return _render("attraction.html", initial=initial)
+
+    return _cached((catalog.version, "attraction", attraction_id), build)
@@ -0,0 +1,29 @@
+# 景點列表與歷史訂單的 cursor 分頁：cursor 內容是上一頁最後一筆的排序鍵與排序方式，對前端而言是不透明字串
+import base64
+import json
+
+
+def encode_cursor(key, sort):
+    """sort 標示排序鍵的排序方式，解析時必須相同，不同排序產生的 cursor 不能混用"""
+    raw = json.dumps({"s": sort, "k": list(key)}, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor, sort, size):
+    """解析 cursor 回排序鍵（tuple，size 個欄位），格式不正確或排序方式不同時拋出 ValueError"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        key = data["k"]
+    except Exception:
+        raise ValueError("無效的 cursor")
+    if data.get("s") != sort:
+        raise ValueError("cursor 與目前的查詢條件不符")
+    # bool 是 int 的子類別，需另外排除
+    if (not isinstance(key, list) or len(key) != size
+            or not all(isinstance(v, (int, float, str)) and not isinstance(v, bool) for v in key)):
+        raise ValueError("無效的 cursor")
+    # 排序鍵的最後一個欄位一定是 id
+    if not isinstance(key[-1], int):
+        raise ValueError("無效的 cursor")
+    return tuple(key)
@@ -0,0 +1,95 @@
+# 密碼雜湊與驗證：bcrypt 交給獨立的 process pool 執行，避免卡住 event loop
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from config import BCRYPT_ROUNDS, BCRYPT_WORKERS, BCRYPT_MAX_PENDING
+
+
+class PasswordServiceBusy(Exception):
+    """排隊中的雜湊工作已達上限，或 worker process 異常結束正在重建 pool，呼叫端應回傳 503"""
+
+
+_executor = None
+_pending = 0
+
+
+# bcrypt 只在 worker process 中匯入，API process 本身不需要載入
+def _hash(password: bytes, rounds: int) -> bytes:
+    import bcrypt
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds))
+
+
+def _check(password: bytes, hashed: bytes) -> bool:
+    import bcrypt
+    return bcrypt.checkpw(password, hashed)
+
+
+def _ready():
+    import bcrypt
+    return bcrypt is not None
+
+
+def _get_executor():
+    # 第一次使用時才建立 process pool
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=BCRYPT_WORKERS)
+    return _executor
+
+
+def _discard_executor(broken):
+    # worker process 異常結束後整個 pool 都無法再使用，丟棄後下一個請求會建立新的 pool；
+    # 同時失敗的多個請求只有第一個需要處理
+    global _executor
+    if _executor is broken:
+        _executor = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+
+async def _submit(fn, *args):
+    # 只在 event loop 執行緒中增減計數，不需要上鎖
+    global _pending
+    if _pending >= BCRYPT_MAX_PENDING:
+        raise PasswordServiceBusy("系統忙碌中，請稍後再試")
+    _pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        executor = _get_executor()
+        try:
+            return await loop.run_in_executor(executor, fn, *args)
+        except BrokenProcessPool:
+            _discard_executor(executor)
+            raise PasswordServiceBusy("密碼服務重新啟動中，請稍後再試")
+    finally:
+        _pending -= 1
+
+
+async def hash_password(password: str) -> str:
+    hashed = await _submit(_hash, password.encode("utf-8"), BCRYPT_ROUNDS)
+    return hashed.decode("utf-8")
+
+
+async def verify_password(password: str, hashed: str) -> bool:
+    return await _submit(_check, password.encode("utf-8"), hashed.encode("utf-8"))
+
+
+async def warm_up():
+    # 預先啟動所有 worker process 並匯入 bcrypt，第一次登入不必等 process 建立
+    loop = asyncio.get_running_loop()
+    executor = _get_executor()
+    await asyncio.gather(*(loop.run_in_executor(executor, _ready) for _ in range(BCRYPT_WORKERS)))
+
+
+def needs_rehash(hashed: str) -> bool:
+    # bcrypt 格式為 $2b$<cost>$...，cost 與目前設定不同就需要重新雜湊
+    try:
+        return int(hashed.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
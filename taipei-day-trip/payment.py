@@ -0,0 +1,206 @@
+# TapPay 付款與訂單狀態：付款呼叫期間不持有資料庫交易或連線
+import asyncio
+import logging
+import time
+import metrics
+import inventory
+from sqlalchemy import text
+from config import (PARTNER_KEY, MERCHANT_KEY, TAPPAY_URL, TAPPAY_RECORD_URL, TAPPAY_TIMEOUT, TAPPAY_RETRIES,
+                    ORDER_PAYMENT_TIMEOUT)
+from database import get_db_connection, older_than
+
+logger = logging.getLogger(__name__)
+
+# 訂單狀態機：UNPAID 建立後轉為 PAID 或 FAILED；
+# 已送出付款請求卻沒有得到結果（TapPay 逾時、回應錯誤或付款後更新訂單失敗）時轉為 UNKNOWN，
+# 客戶可能已被扣款，確認交易結果後才能轉為 PAID 或 FAILED
+UNPAID = "UNPAID"
+PAID = "PAID"
+FAILED = "FAILED"
+PAYMENT_UNKNOWN = "UNKNOWN"
+
+TRANSITIONS = {
+    UNPAID: {PAID, FAILED, PAYMENT_UNKNOWN},
+    PAYMENT_UNKNOWN: {PAID, FAILED},
+    PAID: set(),
+    FAILED: set(),
+}
+
+# TapPay 交易紀錄的 record_status：授權成功、請款完成、部分退款代表已扣款，處理中代表結果尚未確定；
+# 其餘（交易錯誤、全額退款、取消）代表沒有扣款
+CHARGED_RECORDS = {0, 1, 2}
+PENDING_RECORDS = {4}
+
+
+class InvalidTransition(Exception):
+    """訂單目前的狀態不允許這次轉換（例如重複付款）"""
+
+
+class TapPayError(Exception):
+    """無法取得 TapPay 的有效回應（連線失敗、逾時、連線中斷或回應格式錯誤），付款結果未知"""
+
+
+async def transition(conn, order_id, from_status, to_status):
+    # 以條件式 UPDATE 確保只有在預期狀態下才會轉換，不需要鎖表
+    if to_status not in TRANSITIONS[from_status]:
+        raise InvalidTransition(f"訂單狀態不可由 {from_status} 轉為 {to_status}")
+    result = await conn.execute(
+        text("UPDATE orders SET status = :to_status WHERE id = :order_id AND status = :from_status"),
+        {"order_id": order_id, "from_status": from_status, "to_status": to_status}
+    )
+    if result.rowcount != 1:
+        raise InvalidTransition(f"訂單 {order_id} 不在 {from_status} 狀態")
+
+
+async def mark_unknown(order_id, order_number):
+    """付款結果未知的訂單轉為 UNKNOWN，標示客戶可能已被扣款；失敗時只記錄，逾時後兩種狀態同樣會與 TapPay 核對"""
+    try:
+        async with get_db_connection() as conn:
+            async with conn.begin():
+                await transition(conn, order_id, UNPAID, PAYMENT_UNKNOWN)
+    except Exception:
+        logger.exception("訂單 %s 無法標記為付款結果未知", order_number)
+
+
+async def expire_unpaid_orders(limit=100):
+    """建立超過 ORDER_PAYMENT_TIMEOUT 仍未完成付款的訂單，與 TapPay 交易紀錄核對後結案，回傳結案的筆數
+
+    UNPAID（處理中斷）與 UNKNOWN（付款結果未知）的訂單都可能已扣款：查到扣款紀錄時轉為 PAID，
+    確認沒有扣款時才轉為 FAILED 並釋放名額；無法查詢或交易仍在處理中的訂單保留，下一輪再核對。
+    轉換是條件式的，多個 worker 同時執行或訂單剛好完成付款時不會重複釋放
+    """
+    rows = []
+    async with get_db_connection() as conn:
+        for status in (UNPAID, PAYMENT_UNKNOWN):
+            # 分開查詢兩種狀態，各自走 (status, created) 索引
+            rows += (await conn.execute(text(f"""
+                SELECT id, order_number, attraction_id, date, time, status FROM orders
+                WHERE status = :status AND {older_than("created")}
+                ORDER BY created
+                LIMIT :limit
+            """), {"status": status, "seconds": ORDER_PAYMENT_TIMEOUT, "limit": limit})).fetchall()
+
+    resolved = 0
+    for row in rows:
+        # 查詢 TapPay 期間不持有資料庫連線
+        try:
+            outcome = await query_trade(row.order_number)
+        except TapPayError as e:
+            logger.warning("訂單 %s 無法與 TapPay 交易紀錄核對，保留待下次處理：%s", row.order_number, e)
+            continue
+        if outcome is None:
+            logger.warning("訂單 %s 的 TapPay 交易仍在處理中，保留待下次處理", row.order_number)
+            continue
+        try:
+            async with get_db_connection() as conn:
+                async with conn.begin():
+                    await transition(conn, row.id, row.status, outcome)
+                    if outcome == FAILED:
+                        await inventory.release(conn, row.attraction_id, row.date, row.time)
+        except InvalidTransition:
+            continue
+        resolved += 1
+        logger.warning("訂單 %s 逾時未完成付款，核對 TapPay 交易紀錄後改為 %s", row.order_number, outcome)
+    return resolved
+
+
+_client = None
+
+
+def get_client():
+    # 共用一個 client，重複使用與 TapPay 之間的連線
+    global _client
+    if _client is None:
+        import httpx    # 第一次付款時才匯入，不拖慢啟動
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(TAPPAY_TIMEOUT),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+            headers={"Content-Type": "application/json", "x-api-key": PARTNER_KEY}
+        )
+    return _client
+
+
+def use_client(client):
+    # 壓測時改用自訂的 client（例如直接呼叫 mock_tappay 的 ASGI app）
+    global _client
+    _client = client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def pay_by_prime(prime, amount, phone, name, email, order_number):
+    import httpx
+    payload = {
+        "prime": prime,
+        "partner_key": PARTNER_KEY,
+        "merchant_id": MERCHANT_KEY,
+        "amount": amount,
+        "details": "Taipei Trip",
+        # 付款結果未知時以訂單編號查詢 TapPay 的交易紀錄
+        "order_number": order_number,
+        "cardholder": {
+            "phone_number": phone,
+            "name": name,
+            "email": email
+        }
+    }
+
+    # 只有在請求尚未送出（連線失敗）時才重試，避免同一個 prime 被扣款兩次
+    started = time.perf_counter()
+    for attempt in range(TAPPAY_RETRIES + 1):
+        try:
+            response = await get_client().post(TAPPAY_URL, json=payload)
+            break
+        except httpx.ConnectError as e:
+            if attempt == TAPPAY_RETRIES:
+                metrics.TAPPAY_LATENCY.observe(time.perf_counter() - started, "connect_error")
+                raise TapPayError(f"無法連線 TapPay: {e}")
+            await asyncio.sleep(0.2 * (2 ** attempt))
+        except httpx.TimeoutException as e:
+            metrics.TAPPAY_LATENCY.observe(time.perf_counter() - started, "timeout")
+            raise TapPayError(f"TapPay 回應逾時: {e}")
+        except httpx.HTTPError as e:
+            # 請求可能已送達（例如讀取回應時連線中斷），不能重試
+            metrics.TAPPAY_LATENCY.observe(time.perf_counter() - started, "transport_error")
+            raise TapPayError(f"TapPay 連線中斷: {e}")
+
+    # 回應不是 JSON 物件（例如閘道回傳的 HTML 錯誤頁）時，同樣無法得知是否已扣款
+    try:
+        tappay_result = response.json()
+    except ValueError:
+        tappay_result = None
+    if not isinstance(tappay_result, dict):
+        metrics.TAPPAY_LATENCY.observe(time.perf_counter() - started, "invalid_response")
+        raise TapPayError(f"TapPay 回應格式錯誤（HTTP {response.status_code}）")
+    metrics.TAPPAY_LATENCY.observe(time.perf_counter() - started,
+                                   "success" if tappay_result.get("status") == 0 else "declined")
+    return tappay_result
+
+
+async def query_trade(order_number):
+    """以訂單編號查詢 TapPay 交易紀錄，回傳 PAID、FAILED，交易仍在處理中時回傳 None；無法查詢時拋出 TapPayError"""
+    import httpx
+    payload = {
+        "partner_key": PARTNER_KEY,
+        "records_per_page": 50,
+        "filters": {"order_number": order_number}
+    }
+    try:
+        response = await get_client().post(TAPPAY_RECORD_URL, json=payload)
+        result = response.json()
+    except (httpx.HTTPError, ValueError) as e:
+        raise TapPayError(f"無法查詢 TapPay 交易紀錄: {e}")
+    # 只有查詢成功才能斷定沒有扣款；其他狀態一律視為無法確認
+    if not isinstance(result, dict) or result.get("status") != 0:
+        raise TapPayError(f"TapPay 交易紀錄查詢失敗（HTTP {response.status_code}）")
+    statuses = {record.get("record_status") for record in result.get("trade_records") or ()}
+    if statuses & CHARGED_RECORDS:
+        return PAID
+    if statuses & PENDING_RECORDS:
+        return None
+    return FAILED
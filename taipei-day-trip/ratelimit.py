@@ -0,0 +1,141 @@
+# 限流與負載保護：在進入路由（取得資料庫連線、呼叫 bcrypt 或 TapPay）之前就拒絕過量的請求
+import math
+import re
+import time
+from fastapi import Request
+from fastapi.responses import ORJSONResponse
+from auth import bearer_token, verify_token
+from cache import TTLCache
+from catalog import get_catalog
+from config import (RATE_LIMIT_ENABLED, RATE_LIMIT_OVERRIDES, RATE_LIMIT_MAX_CLIENTS, TRUST_FORWARDED_FOR,
+                    MAX_INFLIGHT_REQUESTS, PRIORITY_HEADROOM)
+import metrics
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now):
+        """取得一個 token；成功回傳 0，否則回傳還要等待的秒數"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimit:
+    """單一路由的限流規則；per 為 "ip" 或 "user"（未登入時退回以 IP 計算）"""
+
+    def __init__(self, name, method, pattern, rate, burst, per="ip", query=None):
+        self.name = name
+        self.method = method
+        self.pattern = re.compile(pattern)
+        self.per = per
+        self.query = query      # 只在帶有此查詢參數時套用（例如關鍵字搜尋）
+        self.configure(rate, burst)
+
+    def configure(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        # 閒置超過補滿所需時間的 bucket 可以丟掉，下次重新建立時本來就是滿的
+        self.buckets = TTLCache(RATE_LIMIT_MAX_CLIENTS, math.ceil(burst / rate))
+
+    def matches(self, request: Request):
+        return (request.method == self.method and self.pattern.match(request.url.path)
+                and (self.query is None or request.query_params.get(self.query)))
+
+    def check(self, client):
+        now = time.monotonic()
+        bucket = self.buckets.get(client)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.burst, now)
+        wait = bucket.take(now)
+        self.buckets.set(client, bucket)
+        return wait
+
+
+# rate 為每秒補充的請求數，burst 為可累積的上限
+RATE_LIMITS = [
+    RateLimit("login", "PUT", r"^/api/user/auth$", rate=10 / 60, burst=10),
+    RateLimit("signup", "POST", r"^/api/user$", rate=5 / 60, burst=5),
+    RateLimit("order", "POST", r"^/api/orders$", rate=10 / 60, burst=5, per="user"),
+    RateLimit("search", "GET", r"^/api/attractions$", rate=5, burst=20, query="keyword"),
+]
+
+
+def _apply_overrides(overrides):
+    # 格式：名稱=每秒請求數:burst，以逗號分隔，例如 "login=0.5:20,search=10:40"
+    rules = {rule.name: rule for rule in RATE_LIMITS}
+    for item in filter(None, (part.strip() for part in overrides.split(","))):
+        name, _, value = item.partition("=")
+        rate, _, burst = value.partition(":")
+        if name.strip() not in rules:
+            raise ValueError(f"未知的限流規則：{name}")
+        rules[name.strip()].configure(float(rate), float(burst))
+
+
+_apply_overrides(RATE_LIMIT_OVERRIDES)
+
+# 目錄快照已載入時由記憶體回應、不使用資料庫的讀取
+CHEAP_READS = re.compile(r"^/api/(attractions(/\d+|/nearby)?|mrts)$")
+
+_inflight = 0
+
+
+def client_ip(request: Request):
+    if TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("X-Forwarded-For")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "-"
+
+
+def client_key(request: Request, per):
+    if per == "user":
+        # 只驗證 JWT（有快取），不查資料庫
+        token = bearer_token(request)
+        user_id = verify_token(token) if token else None
+        if user_id is not None:
+            return f"user:{user_id}"
+    return f"ip:{client_ip(request)}"
+
+
+def _reject(status_code, retry_after, message, reason):
+    metrics.REJECTED_REQUESTS.inc(reason)
+    return ORJSONResponse(status_code=status_code, headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+                          content={"error": True, "message": message})
+
+
+async def rate_limit_middleware(request: Request, call_next):
+    global _inflight
+    path = request.url.path
+    if not RATE_LIMIT_ENABLED or not path.startswith("/api/"):
+        return await call_next(request)
+
+    for rule in RATE_LIMITS:
+        if rule.matches(request):
+            wait = rule.check(client_key(request, rule.per))
+            if wait > 0:
+                return _reject(429, wait, "請求過於頻繁，請稍後再試", rule.name)
+            break
+
+    # 一般請求超過上限就拒絕；記憶體中的目錄讀取另外保留一段額度，過載時仍可回應
+    limit = MAX_INFLIGHT_REQUESTS
+    if request.method == "GET" and CHEAP_READS.match(path) and get_catalog() is not None:
+        limit += PRIORITY_HEADROOM
+    if _inflight >= limit:
+        return _reject(503, 1, "伺服器忙碌中，請稍後再試", "overload")
+
+    _inflight += 1
+    try:
+        return await call_next(request)
+    finally:
+        _inflight -= 1
@@ -0,0 +1,167 @@
+# 景點關鍵字搜尋：中日韓文字切成單字與雙字（bigram），英數字以單字為單位，建立倒排索引
+#
+# 搜尋語意（目錄快照與資料庫備援路徑相同，見 api.keyword_matches）：
+#   - 比對景點名稱與描述，查詢中以空白或標點分開的每一段都要命中（AND）
+#   - 中日韓文字切成雙字，每個雙字都要出現在名稱或描述中（不要求相連）；只有一個字時比對單字
+#   - 英數字以完整的詞比對、不分大小寫："taipei" 不會命中 "taipei101"
+#   - 捷運站名稱與查詢完全相符的景點一定命中，並排在最前面
+#   - 結果依 BM25 相關度由高到低排序，同分時依 id 遞增
+import math
+import re
+
+# 中日韓統一表意文字（含擴充 A 與相容區）與假名、韓文
+_CJK = r"\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+_TOKEN_RE = re.compile(rf"[{_CJK}]+|[0-9a-z]+")
+_CJK_RE = re.compile(rf"[{_CJK}]")
+
+NAME_WEIGHT = 3     # 名稱命中的權重高於描述
+MRT_BOOST = 100.0   # 捷運站完全相符的景點排在最前面
+K1 = 1.2
+B = 0.75
+
+
+def _grams(run, with_unigrams):
+    if not _CJK_RE.match(run):
+        return [run]
+    if len(run) == 1:
+        return [run]
+    grams = [run[i:i + 2] for i in range(len(run) - 1)]
+    if with_unigrams:
+        grams.extend(run)
+    return grams
+
+
+def tokenize(text):
+    # 建索引用：同時收錄單字與雙字，讓單一字的查詢也能命中
+    terms = []
+    for run in _TOKEN_RE.findall(text.lower()):
+        terms.extend(_grams(run, with_unigrams=True))
+    return terms
+
+
+def query_terms(query):
+    # 查詢用：只取雙字（單一字才用單字），以空白分隔的多個詞全部都要命中
+    terms = []
+    for run in _TOKEN_RE.findall(query.lower()):
+        for term in _grams(run, with_unigrams=False):
+            if term not in terms:
+                terms.append(term)
+    return terms
+
+
+def _length(text):
+    # 等於 len(tokenize(text))：多字的中日韓文字段有 n - 1 個雙字與 n 個單字，其他段各一個詞
+    length = 0
+    for run in _TOKEN_RE.findall(text.lower()):
+        length += 2 * len(run) - 1 if len(run) > 1 and _CJK_RE.match(run) else 1
+    return length
+
+
+def _occurrences(text, term):
+    # 等於 tokenize(text).count(term)：中日韓文字的詞一定落在同一段內，直接找子字串（可重疊）；英數字須為完整的詞
+    text = text.lower()
+    if not _CJK_RE.match(term):
+        return _TOKEN_RE.findall(text).count(term)
+    count = 0
+    start = text.find(term)
+    while start != -1:
+        count += 1
+        start = text.find(term, start + 1)
+    return count
+
+
+def build_postings(attractions, terms=None):
+    """回傳 (詞 → (依序號排序的文件, 對應的加權詞頻), 各文件的加權長度, 捷運站 → 文件序號)
+
+    terms 指定時只建立這些詞的 posting list（只服務一個查詢時不需要其他詞），文件長度仍計入所有詞
+    """
+    postings = {}
+    lengths = []
+    mrts = {}
+
+    for doc, a in enumerate(attractions):
+        length = 0
+        for field, weight in ((a.name, NAME_WEIGHT), (a.description, 1)):
+            field = field or ""
+            if terms is None:
+                for term in tokenize(field):
+                    tfs = postings.setdefault(term, {})
+                    tfs[doc] = tfs.get(doc, 0) + weight
+                    length += weight
+                continue
+            # 只需要少數幾個詞時直接計數，不必切出所有的詞
+            length += _length(field) * weight
+            for term in terms:
+                count = _occurrences(field, term)
+                if count:
+                    tfs = postings.setdefault(term, {})
+                    tfs[doc] = tfs.get(doc, 0) + count * weight
+        lengths.append(length)
+        if a.mrt:
+            mrts.setdefault(a.mrt, []).append(doc)
+
+    postings = {
+        term: (tuple(sorted(tfs)), tuple(tfs[d] for d in sorted(tfs)))
+        for term, tfs in postings.items()
+    }
+    return postings, lengths, mrts
+
+
+class SearchIndex:
+    """景點名稱與描述的倒排索引，posting list 以文件序號排序
+
+    目錄檔已存有索引時直接使用（postings 為 詞 → (文件序號, 加權詞頻) 的查表物件，lengths 為各文件的加權長度），
+    不再逐筆建立
+    """
+
+    def __init__(self, attractions, postings=None, lengths=None, mrts=None, terms=None):
+        self.size = len(attractions)
+        if postings is None:
+            postings, lengths, mrts = build_postings(attractions, terms)
+        self.postings = postings
+        self.lengths = lengths
+        self.avg_length = (sum(lengths) / len(lengths)) if len(lengths) else 0.0
+        # 捷運站 → 文件序號
+        self.mrts = mrts
+
+    def _idf(self, df):
+        return math.log(1 + (self.size - df + 0.5) / (df + 0.5))
+
+    def search(self, query):
+        """回傳符合的 (文件序號, 分數)，依相關度由高到低排序"""
+        terms = query_terms(query)
+        scores = {}
+
+        if terms:
+            lists = []
+            for term in terms:
+                posting = self.postings.get(term)
+                if posting is None:
+                    lists = []
+                    break
+                lists.append((term, posting))
+
+            if lists:
+                # 所有文件都沒有文字時平均長度為 0，不做長度正規化
+                avg_length = self.avg_length or 1.0
+                # 由最短的 posting list 開始取交集
+                lists.sort(key=lambda item: len(item[1][0]))
+                matched = set(lists[0][1][0])
+                for _, (docs, _) in lists[1:]:
+                    matched.intersection_update(docs)
+                    if not matched:
+                        break
+
+                for term, (docs, tfs) in lists:
+                    idf = self._idf(len(docs))
+                    for doc, tf in zip(docs, tfs):
+                        if doc not in matched:
+                            continue
+                        norm = K1 * (1 - B + B * self.lengths[doc] / avg_length)
+                        scores[doc] = scores.get(doc, 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+
+        # 保留原本「捷運站名稱完全相符」的搜尋行為
+        for doc in self.mrts.get(query.strip(), ()):
+            scores[doc] = scores.get(doc, 0.0) + MRT_BOOST
+
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
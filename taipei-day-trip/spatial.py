@@ -0,0 +1,70 @@
+# 景點的經緯度網格索引：依格子取出候選景點，再以 haversine 距離篩選並取最近的 k 筆
+import heapq
+import math
+
+EARTH_RADIUS = 6371000.0   # 公尺
+CELL_DEGREES = 0.01        # 每格約 1.1 公里（緯度方向）
+
+
+def haversine(lat1, lng1, lat2, lng2):
+    """兩點間的大圓距離（公尺）"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(a))
+
+
+def _cell(lat, lng):
+    return (math.floor(lat / CELL_DEGREES), math.floor(lng / CELL_DEGREES))
+
+
+def build_cells(attractions):
+    """格子 (列, 欄) → 文件序號"""
+    cells = {}
+    for doc, a in enumerate(attractions):
+        cells.setdefault(_cell(a.lat, a.lng), []).append(doc)
+    return cells
+
+
+class GridIndex:
+    def __init__(self, attractions, cells=None, points=None):
+        self.attractions = attractions
+        # 只保留篩選需要的 (id, 緯度, 經度)，命中後才取出完整的景點；目錄檔已存有格子時直接使用
+        self.points = [(a.id, a.lat, a.lng) for a in attractions] if points is None else points
+        self.cells = build_cells(attractions) if cells is None else cells
+
+    def nearby(self, lat, lng, radius, limit, exclude=None):
+        """回傳半徑（公尺）內最近的 limit 筆 (距離, 景點)，由近到遠排序"""
+        # 半徑換算成經緯度範圍，經度方向依緯度放大
+        dlat = math.degrees(radius / EARTH_RADIUS)
+        cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+        dlng = min(math.degrees(radius / (EARTH_RADIUS * cos_lat)), 180.0)
+
+        min_row, min_col = _cell(lat - dlat, lng - dlng)
+        max_row, max_col = _cell(lat + dlat, lng + dlng)
+
+        candidates = []
+        if (max_row - min_row + 1) * (max_col - min_col + 1) > len(self.cells):
+            # 範圍比已使用的格子還多時，直接掃描有資料的格子
+            for (row, col), docs in self.cells.items():
+                if min_row <= row <= max_row and min_col <= col <= max_col:
+                    candidates.extend(docs)
+        else:
+            for row in range(min_row, max_row + 1):
+                for col in range(min_col, max_col + 1):
+                    docs = self.cells.get((row, col))
+                    if docs:
+                        candidates.extend(docs)
+
+        hits = []
+        for doc in candidates:
+            attraction_id, point_lat, point_lng = self.points[doc]
+            if attraction_id == exclude:
+                continue
+            distance = haversine(lat, lng, point_lat, point_lng)
+            if distance <= radius:
+                hits.append((distance, doc))
+
+        return [(distance, self.attractions[doc]) for distance, doc in heapq.nsmallest(limit, hits)]
@@ -0,0 +1,80 @@
+# 啟動預熱：app 開始接受請求後在背景建立連線池、載入景點目錄與首頁、啟動 bcrypt worker，
+# 全部完成前 /ready 回應 503，滾動更新時負載平衡器不會把流量導到還沒預熱的 process
+import asyncio
+import time
+from catalog import load_catalog
+from config import STARTUP_RETRY_SECONDS
+import database
+import pages
+import passwords
+
+
+class StartupReport:
+    """記錄每個啟動步驟的耗時，由 /ready 回傳"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.steps = []
+        self.ready = False
+        self.ready_seconds = None
+
+    def record(self, name, seconds, error=None):
+        step = {"name": name, "ms": round(seconds * 1000, 1), "error": error, "attempts": 1}
+        # 重試的步驟只保留最後一次，記錄嘗試次數
+        if self.steps and self.steps[-1]["name"] == name and self.steps[-1]["error"]:
+            step["attempts"] += self.steps.pop()["attempts"]
+        self.steps.append(step)
+        if step["attempts"] == 1 or not error:
+            print(f"啟動：{name} {seconds * 1000:.1f}ms" + (f"（失敗：{error}）" if error else ""))
+
+    async def run(self, name, step):
+        started = time.perf_counter()
+        try:
+            result = await step()
+        except Exception as e:
+            self.record(name, time.perf_counter() - started, str(e))
+            raise
+        self.record(name, time.perf_counter() - started)
+        return result
+
+    def mark_ready(self):
+        self.ready = True
+        self.ready_seconds = time.perf_counter() - self.started
+        print(f"啟動完成：{self.ready_seconds * 1000:.1f}ms 後可接受流量")
+
+    def to_dict(self):
+        return {
+            "ready": self.ready,
+            "ms": round(self.ready_seconds * 1000, 1) if self.ready_seconds is not None else None,
+            "steps": self.steps,
+        }
+
+
+async def preload_pages():
+    # 首頁（捷運站列表與第一頁景點）先渲染進頁面快取
+    pages.render_index()
+
+
+async def warm_up(report):
+    # 主資料庫連不上時持續重試，連線池建立完成前都不算就緒
+    while True:
+        try:
+            await report.run("連線池", database.warm_pools)
+            break
+        except Exception:
+            await asyncio.sleep(STARTUP_RETRY_SECONDS)
+
+    try:
+        await report.run("景點目錄", load_catalog)
+        await report.run("首頁", preload_pages)
+    except Exception:
+        # 目錄載入失敗時 API 會改走資料庫查詢，不影響就緒
+        pass
+
+    try:
+        await report.run("bcrypt worker", passwords.warm_up)
+    except Exception:
+        # 第一次登入時仍會自動建立 worker
+        pass
+
+    report.mark_ready()
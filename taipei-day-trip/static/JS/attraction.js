@@ -1,4 +1,12 @@
 document.addEventListener("DOMContentLoaded", async function() {
+    // 伺服器已渲染景點內容與附近景點時，直接使用嵌入的資料
+    const initial = readInitialData();
+    if (initial) {
+        renderAttraction(initial.attraction);
+        bindNearbyCards();
+        return;
+    }
+
     // 修正錯誤的 URL 參數解析
     const pathParts = window.location.pathname.split("/");
     const attractionId = pathParts[pathParts.length - 1];
@@ -22,6 +30,7 @@ document.addEventListener("DOMContentLoaded", async function() {
 
         // 修正資料存取方式
         renderAttraction(data.data);
+        fetchNearby(data.data);
     } catch (error) {
         console.error("Error loading attraction data:", error);
     }
@@ -100,6 +109,85 @@ function renderAttraction(attraction) {
     updatePrice(2000);
 }
 
+// 讀取伺服器端渲染時嵌入的資料，目錄未載入時頁面不含資料，回傳 null
+function readInitialData() {
+    const element = document.getElementById("initial-data");
+    return element ? JSON.parse(element.textContent) : null;
+}
+
+function bindNearbyCards() {
+    document.querySelectorAll("#nearby-spots .spot-card").forEach(card => {
+        card.addEventListener("click", () => {
+            window.location.href = `/attraction/${card.dataset.id}`;
+        });
+    });
+}
+
+// 附近景點：以目前景點的經緯度查詢，排除自己
+async function fetchNearby(attraction) {
+    const params = new URLSearchParams({
+        lat: attraction.lat,
+        lng: attraction.lng,
+        exclude: attraction.id,
+        limit: 4
+    });
+
+    try {
+        const response = await fetch(`/api/attractions/nearby?${params}`);
+        if (!response.ok) return;
+        const data = await response.json();
+        if (data.data.length === 0) return;
+
+        const container = document.getElementById("nearby-spots");
+        data.data.forEach(spot => container.appendChild(createNearbyCard(spot)));
+        document.getElementById("nearby").hidden = false;
+    } catch (error) {
+        console.error("Error loading nearby attractions:", error);
+    }
+}
+
+function createNearbyCard(spot) {
+    const card = document.createElement("div");
+    card.classList.add("spot-card");
+    card.addEventListener("click", () => {
+        window.location.href = `/attraction/${spot.id}`;
+    });
+
+    const imageContainer = document.createElement("div");
+    imageContainer.classList.add("spot-image");
+
+    const img = document.createElement("img");
+    img.src = spot.images?.[0] || "default.jpg";
+    img.alt = spot.name;
+
+    const nameOverlay = document.createElement("div");
+    nameOverlay.classList.add("spot-name-overlay");
+    nameOverlay.textContent = spot.name;
+
+    imageContainer.appendChild(img);
+    imageContainer.appendChild(nameOverlay);
+
+    const info = document.createElement("div");
+    info.classList.add("spot-info");
+
+    const mrt = document.createElement("span");
+    mrt.classList.add("spot-mrt");
+    mrt.textContent = spot.mrt || "無";
+
+    // 距離小於 1 公里顯示公尺，否則顯示公里
+    const distance = document.createElement("span");
+    distance.classList.add("spot-category");
+    distance.textContent = spot.distance < 1000 ? `${spot.distance} 公尺` : `${(spot.distance / 1000).toFixed(1)} 公里`;
+
+    info.appendChild(mrt);
+    info.appendChild(distance);
+
+    card.appendChild(imageContainer);
+    card.appendChild(info);
+
+    return card;
+}
+
 
 //預約行程
 document.getElementById("order-button").addEventListener("click", async () => {
@@ -43,17 +43,12 @@ document.addEventListener("DOMContentLoaded", async () => {
         return;
       }
   
-      await fetchUserInfo(token, userNameElement);
-  
       try {
-        const res = await fetch("/api/booking", {
-          method: "GET",
-          headers: {
-            "Authorization": `Bearer ${token}`
-          }
-        });
-  
-        const data = await res.json();
+        // 使用者資料與預定行程以一個批次請求取得
+        const [auth, bookingResult] = await fetchBatch(token, ["/api/user/auth", "/api/booking"]);
+        showUserInfo(auth.body, userNameElement);
+
+        const data = bookingResult.body;
   
         if (data.data) {
           const booking = data.data;
@@ -75,6 +70,7 @@ document.addEventListener("DOMContentLoaded", async () => {
         }
       } catch (error) {
         console.error("載入 booking 錯誤：", error);
+        userNameElement.textContent = "使用者";
         tourSection.style.display = "none";
         contentSection.style.display = "none";
         paymentSection.style.display = "none";
@@ -91,33 +87,37 @@ document.addEventListener("DOMContentLoaded", async () => {
     }
   });
   
-  async function fetchUserInfo(token, userNameElement) {
-    try {
-      const res = await fetch("/api/user/auth", {
-        method: "GET",
-        headers: {
-          "Authorization": `Bearer ${token}`
-        }
-      });
-  
-      const result = await res.json();
-      if (result.data && result.data.name) {
-        const name = result.data.name;
-        const email = result.data.email || "";
-  
-        // 原本的功能
-        userNameElement.textContent = name;
-  
-        // 自動填入聯絡姓名與信箱
-        const contactNameInput = document.getElementById("contact-name");
-        const contactEmailInput = document.getElementById("contact-email");
-        if (contactNameInput) contactNameInput.value = name;
-        if (contactEmailInput) contactEmailInput.value = email;
-      } else {
-        userNameElement.textContent = "使用者";
-      }
-    } catch (err) {
-      console.error("取得使用者資訊錯誤：", err);
+  // 一次送出多個唯讀 API 請求（/api/batch），依序回傳各自的 { status, body }
+  async function fetchBatch(token, urls) {
+    const res = await fetch("/api/batch", {
+      method: "POST",
+      headers: {
+        "Content-Type": "application/json",
+        "Authorization": `Bearer ${token}`
+      },
+      body: JSON.stringify({ requests: urls.map(url => ({ url })) })
+    });
+    if (!res.ok) {
+      throw new Error(`HTTP 錯誤！狀態碼: ${res.status}`);
+    }
+    const data = await res.json();
+    return data.responses;
+  }
+
+  function showUserInfo(result, userNameElement) {
+    if (result && result.data && result.data.name) {
+      const name = result.data.name;
+      const email = result.data.email || "";
+
+      // 原本的功能
+      userNameElement.textContent = name;
+
+      // 自動填入聯絡姓名與信箱
+      const contactNameInput = document.getElementById("contact-name");
+      const contactEmailInput = document.getElementById("contact-email");
+      if (contactNameInput) contactNameInput.value = name;
+      if (contactEmailInput) contactEmailInput.value = email;
+    } else {
       userNameElement.textContent = "使用者";
     }
   }
@@ -160,6 +160,7 @@ if (logoutButton) {
 }
 
 let currentBooking = null; // 全域變數，儲存 /api/booking 拿到的資料
+let orderIdempotencyKey = null; // 同一筆訂單重送時沿用，避免重複建立訂單與扣款
 
 document.addEventListener("DOMContentLoaded", async () => {
   setupTapPay(159815, "app_2SUKCo0UuUWUPSFJbBqKadBYBwMcaNKASef9BTEZh2aEL5uXDa7j5L30heEA");
@@ -255,17 +256,24 @@ document.addEventListener("DOMContentLoaded", async () => {
 
     console.log("送出訂單：", body); // ✅ DEBUG 用
 
+    if (!orderIdempotencyKey) {
+      orderIdempotencyKey = crypto.randomUUID();
+    }
+
     try {
       const res = await fetch("/api/orders", {
         method: "POST",
         headers: {
           "Content-Type": "application/json",
-          Authorization: `Bearer ${token}`
+          Authorization: `Bearer ${token}`,
+          "Idempotency-Key": orderIdempotencyKey
         },
         body: JSON.stringify(body)
       });
 
       const result = await res.json();
+      // 已收到伺服器回應，下一次送出視為新的訂單
+      orderIdempotencyKey = null;
 
       if (result.data && result.data.number) {
         window.location.href = `/thankyou?number=${result.data.number}`;
@@ -273,8 +281,11 @@ document.addEventListener("DOMContentLoaded", async () => {
         alert(result.message || "付款失敗，請稍後再試");
       }
     } catch (error) {
+      // 沒收到回應（例如逾時）時保留 key，重送會取得第一次的結果而不會重複扣款
       console.error("付款錯誤：", error);
       alert("伺服器錯誤");
+      submitBtn.disabled = false;
+      submitBtn.textContent = "確認訂單並付款";
     }
   });
 });
\ No newline at end of file
@@ -1,9 +1,30 @@
 // 確保 DOM 加載完畢
 document.addEventListener("DOMContentLoaded", () => {
-    fetchMRTStations();
-    fetchAttractions(); // 初始載入
+    const initial = readInitialData();
+    if (!initial) {
+        fetchMRTStations();
+        fetchAttractions(); // 初始載入
+        return;
+    }
+
+    // 伺服器已渲染捷運站與第一頁景點，只需綁定點擊事件並從下一頁接著載入
+    document.querySelectorAll(".mrt-scroll span").forEach(span => {
+        span.addEventListener("click", () => searchByMRT(span.textContent));
+    });
+    document.querySelectorAll("#spots .spot-card").forEach(card => {
+        card.addEventListener("click", () => {
+            window.location.href = `/attraction/${card.dataset.id}`;
+        });
+    });
+    currentPage = initial.page.nextPage;
 });
 
+// 讀取伺服器端渲染時嵌入的資料，目錄未載入時頁面不含資料，回傳 null
+function readInitialData() {
+    const element = document.getElementById("initial-data");
+    return element ? JSON.parse(element.textContent) : null;
+}
+
 // 變數設定
 let currentPage = 1;    // 初始載入 page=1（因為 page=0 已經加載）
 let isLoading = false;
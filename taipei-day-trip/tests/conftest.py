@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+
+# 應用程式的模組都在上一層目錄，以扁平的名稱互相匯入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 需要資料庫的測試一律使用暫存的 SQLite 檔案，不會連到設定中的資料庫；必須在載入 config 之前設定
+_db_path = os.path.join(tempfile.mkdtemp(prefix="taipei-day-trip-test-"), "test.db")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_db_path}"
+os.environ["SYNC_DATABASE_URL"] = f"sqlite:///{_db_path}"
+os.environ["REPLICA_DATABASE_URLS"] = ""
+os.environ["CATALOG_FILE"] = ""
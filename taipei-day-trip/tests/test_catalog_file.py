@@ -0,0 +1,131 @@
+# 景點目錄檔：寫入後以 mmap 讀回，景點與各索引都要和從景點逐筆建立的結果相同
+import pytest
+import catalog
+from catalog import AttractionRecord, CatalogSnapshot
+from catalog_file import CatalogFile, HEADER, TermPostings, write_catalog
+from search import build_postings
+from spatial import build_cells
+
+PLACES = [
+    ("北投溫泉博物館", "博物館", "日治時期的公共浴場，北投溫泉的歷史", "北投", 25.136, 121.507),
+    ("地熱谷", "溫泉", "北投溫泉的源頭，終年冒著熱氣", "新北投", 25.137, 121.511),
+    ("大安森林公園", "公園", "台北市中心的都市森林公園", "大安森林公園", 25.030, 121.535),
+    ("Taipei 101", "購物", "taipei101 觀景台，台北的地標", "台北101/世貿", 25.034, 121.564),
+    ("陽明山國家公園", "公園", "火山地形與溫泉", None, 25.155, 121.548),
+    ("淡水老街", "老街", "淡水河畔的老街與夕陽", "淡水", 25.169, 121.440),
+]
+
+
+def records():
+    # id 不連續且不依順序，寫入時應依 id 排序
+    result = []
+    for i, (name, category, description, mrt, lat, lng) in enumerate(PLACES * 3):
+        attraction_id = 1000 - i * 7
+        images = [f"https://example.com/{attraction_id}/{n}.jpg" for n in range(i % 3)]
+        result.append(AttractionRecord(attraction_id, f"{name}{i}", category, description, f"地址{i}", "交通",
+                                       mrt, lat + i / 1000, lng, images))
+    return result
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = tmp_path / "catalog.bin"
+    write_catalog(str(path), 7, records())
+    return str(path)
+
+
+@pytest.fixture
+def expected():
+    return CatalogSnapshot(7, sorted(records(), key=lambda a: a.id))
+
+
+def test_records_round_trip(path, expected):
+    catalog_file = CatalogFile(path, AttractionRecord)
+    assert catalog_file.version == 7
+    assert list(catalog_file) == list(expected.attractions)
+    assert catalog_file[-1] == expected.attractions[-1]
+    assert catalog_file[2:5] == list(expected.attractions[2:5])
+    with pytest.raises(IndexError):
+        catalog_file[len(expected.attractions)]
+
+
+def test_find_by_id(path, expected):
+    catalog_file = CatalogFile(path, AttractionRecord)
+    assert list(catalog_file.ids) == [a.id for a in expected.attractions]
+    for doc, a in enumerate(expected.attractions):
+        assert catalog_file.find(a.id) == doc
+    for missing in (0, 1001, expected.attractions[0].id + 1):
+        assert catalog_file.find(missing) is None
+
+
+def test_term_postings_binary_search(path, expected):
+    catalog_file = CatalogFile(path, AttractionRecord)
+    postings, lengths, _ = build_postings(expected.attractions)
+    terms = TermPostings(catalog_file)
+    assert len(terms) == len(postings)
+    for term, (docs, tfs) in postings.items():
+        found = terms.get(term)
+        assert found is not None, term
+        assert (list(found[0]), list(found[1])) == (list(docs), list(tfs))
+    # 排在詞表最前面、最後面與中間的不存在的詞
+    for missing in ("", "000", "zzz", "北京", "taipei102", "\U0002a6d6"):
+        assert terms.get(missing) is None
+    assert list(catalog_file.lengths()) == lengths
+
+
+def test_grid_cells_and_facets(path, expected):
+    catalog_file = CatalogFile(path, AttractionRecord)
+    cells = {cell: list(docs) for cell, docs in catalog_file.grid_cells().items()}
+    assert cells == build_cells(expected.attractions)
+    facet_postings = {field: {value: list(docs) for value, docs in values.items()}
+                      for field, values in catalog_file.facet_postings().items()}
+    assert facet_postings["mrt"] == {
+        value: [doc for doc, a in enumerate(expected.attractions) if a.mrt == value]
+        for value in dict.fromkeys(a.mrt for a in expected.attractions if a.mrt)
+    }
+
+
+def test_snapshot_from_file_matches_memory(path, expected):
+    snapshot = catalog.open_snapshot(path)
+    assert snapshot.mrts == expected.mrts
+    assert list(snapshot.id_keys) == expected.id_keys
+    for keyword in (None, "溫泉", "北投", "公園 台北", "taipei", "taipei101", "大安森林公園", "不存在"):
+        for category in (None, "公園", "溫泉"):
+            assert [list(part) for part in snapshot.search(keyword, category)] == \
+                   [list(part) for part in expected.search(keyword, category)]
+            assert snapshot.facet_counts(keyword, category) == expected.facet_counts(keyword, category)
+        first = snapshot.page(keyword, 4)
+        assert first == expected.page(keyword, 4)
+        if first[2] is not None:
+            assert snapshot.page(keyword, 4, after=first[2]) == expected.page(keyword, 4, after=first[2])
+    for a in expected.attractions:
+        for radius in (500, 5000, 50000):
+            assert snapshot.spatial.nearby(a.lat, a.lng, radius, 5, exclude=a.id) == \
+                   expected.spatial.nearby(a.lat, a.lng, radius, 5, exclude=a.id)
+    some = expected.attractions[3]
+    assert snapshot.by_id.get(some.id) == some and some.id in snapshot.by_id
+    assert snapshot.by_id.get(1) is None and 1 not in snapshot.by_id
+
+
+def test_empty_catalog(tmp_path):
+    path = str(tmp_path / "empty.bin")
+    write_catalog(path, 1, [])
+    snapshot = catalog.open_snapshot(path)
+    assert len(snapshot.attractions) == 0
+    assert snapshot.search("公園")[1] == []
+    assert snapshot.spatial.nearby(25.0, 121.5, 1000, 5) == []
+
+
+def test_rejects_other_formats(path, tmp_path):
+    with open(path, "rb") as f:
+        data = f.read()
+    bad_files = {
+        "bad-magic.bin": b"TDTCAT01" + data[8:],     # 舊版格式
+        "truncated.bin": data[:HEADER.size + 10],
+        "short.bin": data[:HEADER.size - 1],
+    }
+    for name, content in bad_files.items():
+        bad = tmp_path / name
+        bad.write_bytes(content)
+        with pytest.raises(ValueError):
+            CatalogFile(str(bad), AttractionRecord)
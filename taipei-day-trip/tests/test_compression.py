@@ -0,0 +1,38 @@
+# 回應壓縮的編碼選擇：依 Accept-Encoding 的 q 值，q=0 的編碼不能使用
+import pytest
+import compression
+
+
+@pytest.fixture
+def middleware():
+    return compression.CompressionMiddleware(app=None)
+
+
+@pytest.fixture
+def with_brotli(monkeypatch):
+    # 只測試選擇邏輯，不需要真的安裝 brotli
+    monkeypatch.setattr(compression, "brotli", object())
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip, deflate, br", "br"),
+    ("br;q=0, gzip", "gzip"),
+    ("br; q=0.0, gzip;q=0.5", "gzip"),
+    ("br;q=0.4, gzip;q=0.8", "gzip"),
+    ("BR;Q=1, gzip;q=0.9", "br"),
+    ("gzip;q=0, br;q=0", None),
+    ("*", "br"),
+    ("*;q=0, gzip", "gzip"),
+    ("br;q=0, *", "gzip"),
+    ("br;q=abc, gzip", "gzip"),
+    ("identity", None),
+    ("", None),
+])
+def test_choose_encoding(middleware, with_brotli, header, expected):
+    assert middleware.choose_encoding(header) == expected
+
+
+def test_without_brotli_only_gzip(middleware, monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+    assert middleware.choose_encoding("br, gzip;q=0.1") == "gzip"
+    assert middleware.choose_encoding("br") is None
@@ -0,0 +1,72 @@
+# 分類與捷運站的 facet：多條件篩選與各值的景點數
+from types import SimpleNamespace
+import pytest
+from facets import FacetIndex, bitmap_of, docs_of
+
+ATTRACTIONS = [
+    SimpleNamespace(category="公園", mrt="大安"),
+    SimpleNamespace(category="公園", mrt="北投"),
+    SimpleNamespace(category="溫泉", mrt="北投"),
+    SimpleNamespace(category="溫泉", mrt="北投"),
+    SimpleNamespace(category="博物館", mrt=None),
+]
+
+
+@pytest.fixture
+def index():
+    return FacetIndex(ATTRACTIONS)
+
+
+def counts(result, field):
+    return {item["name"]: item["count"] for item in result[field]}
+
+
+def test_bitmap_round_trip():
+    assert docs_of(bitmap_of([0, 3, 64, 65], 70)) == [0, 3, 64, 65]
+    assert bitmap_of([], 0) == 0
+    assert docs_of(0) == []
+
+
+def test_mask_combines_filters(index):
+    assert docs_of(index.mask({"category": "溫泉", "mrt": "北投"})) == [2, 3]
+    assert docs_of(index.mask({"category": "公園", "mrt": "北投"})) == [1]
+    assert docs_of(index.mask({"category": None, "mrt": None})) == [0, 1, 2, 3, 4]
+    assert index.mask({"category": "不存在"}) == 0
+
+
+def test_counts_without_filters(index):
+    result = index.counts({"category": None, "mrt": None})
+    assert counts(result, "category") == {"公園": 2, "溫泉": 2, "博物館": 1}
+    # 沒有捷運站的景點不計入
+    assert counts(result, "mrt") == {"北投": 3, "大安": 1}
+    assert [item["name"] for item in result["mrt"]] == ["北投", "大安"]
+
+
+def test_counts_skip_own_field(index):
+    result = index.counts({"category": "溫泉", "mrt": None})
+    # 分類的數量不套用分類自己的條件，仍可看到切換成其他分類的結果數
+    assert counts(result, "category") == {"公園": 2, "溫泉": 2, "博物館": 1}
+    assert counts(result, "mrt") == {"北投": 2}
+
+
+def test_counts_apply_other_fields(index):
+    result = index.counts({"category": "公園", "mrt": "北投"})
+    assert counts(result, "category") == {"公園": 1, "溫泉": 2}
+    assert counts(result, "mrt") == {"大安": 1, "北投": 1}
+
+
+def test_counts_with_keyword_base(index):
+    # base 為關鍵字搜尋命中的景點，兩個欄位都只在這些景點中計數
+    result = index.counts({"category": "溫泉", "mrt": None}, base=bitmap_of([0, 2, 4], len(ATTRACTIONS)))
+    assert counts(result, "category") == {"公園": 1, "溫泉": 1, "博物館": 1}
+    assert counts(result, "mrt") == {"北投": 1}
+
+
+def test_prebuilt_postings_match(index):
+    postings = {
+        "category": {"公園": [0, 1], "溫泉": [2, 3], "博物館": [4]},
+        "mrt": {"大安": [0], "北投": [1, 2, 3]},
+    }
+    prebuilt = FacetIndex(ATTRACTIONS, postings=postings)
+    assert prebuilt.bitmaps == index.bitmaps
+    assert prebuilt.ranked == index.ranked
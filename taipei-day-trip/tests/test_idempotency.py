@@ -0,0 +1,142 @@
+# Idempotency-Key：取得處理權、回放第一次的回應、內容不同時拒絕，以及處理中斷後的接手
+import asyncio
+import uuid
+import pytest
+from sqlalchemy import text
+import database
+import idempotency
+import migrations
+
+USER = 1
+ORDER = {"price": 2000, "trip": {"attraction": {"id": 1}, "date": "2030-01-01", "time": "morning"}}
+
+
+@pytest.fixture(scope="module", autouse=True)
+def schema():
+    with database.get_sync_connection() as conn:
+        migrations.migrate(conn)
+
+
+@pytest.fixture
+def key():
+    return uuid.uuid4().hex
+
+
+def run(coro):
+    # 每個測試各自的事件迴圈，結束時關閉連線池，避免連線跨迴圈使用
+    async def main():
+        try:
+            return await coro
+        finally:
+            await database.engine.dispose()
+    return asyncio.run(main())
+
+
+def claim(key, payload=ORDER, user_id=USER):
+    return run(idempotency.claim(user_id, key, idempotency.fingerprint(payload)))
+
+
+def backdate(key, user_id=USER):
+    # 把 key 的建立時間改到很久以前，模擬處理中斷或已過期的 key
+    with database.get_sync_connection() as conn:
+        conn.execute(text("UPDATE idempotency_keys SET created = '2000-01-01 00:00:00.000' "
+                          "WHERE user_id = :user_id AND idem_key = :key"), {"user_id": user_id, "key": key})
+        conn.commit()
+
+
+def test_fingerprint_ignores_key_order():
+    reordered = {"trip": ORDER["trip"], "price": 2000}
+    assert idempotency.fingerprint(reordered) == idempotency.fingerprint(ORDER)
+    assert idempotency.fingerprint({**ORDER, "price": 2500}) != idempotency.fingerprint(ORDER)
+
+
+def test_claim_then_replay(key):
+    assert claim(key) is None
+    run(idempotency.complete(USER, key, 200, b'{"data":{"number":"1"}}'))
+    assert claim(key) == (200, {"data": {"number": "1"}})
+    # 重送多次都回放同一個回應
+    assert claim(key) == (200, {"data": {"number": "1"}})
+
+
+def test_client_errors_are_replayed(key):
+    assert claim(key) is None
+    run(idempotency.complete(USER, key, 400, b'{"error":true,"message":"x"}'))
+    assert claim(key) == (400, {"error": True, "message": "x"})
+
+
+def test_conflict_on_different_payload(key):
+    assert claim(key) is None
+    with pytest.raises(idempotency.IdempotencyConflict):
+        claim(key, {**ORDER, "price": 1})
+    run(idempotency.complete(USER, key, 200, b"{}"))
+    with pytest.raises(idempotency.IdempotencyConflict):
+        claim(key, {**ORDER, "price": 1})
+
+
+def test_in_progress(key):
+    assert claim(key) is None
+    with pytest.raises(idempotency.RequestInProgress):
+        claim(key)
+
+
+def test_keys_are_per_user(key):
+    assert claim(key, user_id=1) is None
+    assert claim(key, user_id=2) is None
+
+
+def test_release_before_order_allows_retry(key):
+    assert claim(key) is None
+    run(idempotency.release(USER, key))
+    assert claim(key) is None
+
+
+def test_release_after_order_replays_pending(key):
+    async def create_order():
+        async with database.get_db_connection() as conn:
+            async with conn.begin():
+                await idempotency.save_pending(conn, USER, key, {"data": {"number": "9", "payment": {"status": -1}}})
+
+    assert claim(key) is None
+    run(create_order())
+    # 訂單已建立：處理中仍回應 409，失敗釋放後回放付款結果未知的回應，不會再建立訂單
+    with pytest.raises(idempotency.RequestInProgress):
+        claim(key)
+    run(idempotency.release(USER, key))
+    assert claim(key) == (idempotency.PENDING_STATUS, {"data": {"number": "9", "payment": {"status": -1}}})
+
+
+def test_stale_claim_is_taken_over(key):
+    assert claim(key) is None
+    backdate(key)
+    assert claim(key) is None
+    # 接手後重新計時，不會再被第三個請求接手
+    with pytest.raises(idempotency.RequestInProgress):
+        claim(key)
+    with pytest.raises(idempotency.IdempotencyConflict):
+        claim(key, {**ORDER, "price": 1})
+
+
+def test_stale_claim_with_order_replays_pending(key):
+    async def create_order():
+        async with database.get_db_connection() as conn:
+            async with conn.begin():
+                await idempotency.save_pending(conn, USER, key, {"data": {"number": "9"}})
+
+    assert claim(key) is None
+    run(create_order())
+    backdate(key)
+    # 已建立訂單的 key 不會被接手，以免重複建立訂單
+    assert claim(key) == (idempotency.PENDING_STATUS, {"data": {"number": "9"}})
+
+
+def test_purge_expired(key):
+    fresh = uuid.uuid4().hex
+    for k in (key, fresh):
+        assert claim(k) is None
+        run(idempotency.complete(USER, k, 200, b"{}"))
+    backdate(key)
+    assert run(idempotency.purge_expired()) >= 1
+    # 未過期的 key 保留
+    assert claim(fresh) == (200, {})
+    # 過期的 key 被清除後，相同 key 被當成新的請求
+    assert claim(key, {**ORDER, "price": 1}) is None
@@ -0,0 +1,64 @@
+# 訂單編號產生器：多個 process、多台主機同時產生編號時不會重複
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import pytest
+import order_numbers
+
+PROCESSES = 4
+COUNT = 20000
+
+
+@pytest.fixture
+def host(monkeypatch, tmp_path):
+    # 每台主機有自己的檔案鎖目錄，各自的 process 從 slot 0 開始搶
+    def configure(host_id):
+        monkeypatch.setattr(order_numbers, "ORDER_HOST_ID", host_id)
+        monkeypatch.setattr(order_numbers, "ORDER_WORKER_LOCK_DIR", str(tmp_path / f"host-{host_id}"))
+    return configure
+
+
+def _generate(count):
+    # 在 fork 出來的 process 中執行，會重新取得自己的 worker 編號
+    return [order_numbers.next_order_number() for _ in range(count)]
+
+
+def generate(processes, count):
+    context = multiprocessing.get_context("fork")
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context) as pool:
+        return list(pool.map(_generate, [count] * processes))
+
+
+@pytest.mark.parametrize("host_id", [0, 7])
+def test_processes_on_one_host_do_not_collide(host, host_id):
+    host(host_id)
+    results = generate(PROCESSES, COUNT)
+    numbers = [number for result in results for number in result]
+    assert len(set(numbers)) == len(numbers)
+    assert all(result == sorted(result) for result in results)
+    assert {len(number) for number in numbers} == {23}
+
+
+def test_hosts_do_not_collide(host):
+    numbers = []
+    for host_id in (3, 7):
+        host(host_id)
+        numbers += [number for result in generate(2, COUNT) for number in result]
+    assert len(set(numbers)) == len(numbers)
+
+
+def test_worker_id_combines_host_and_slot(host):
+    host(7)
+    first, first_lock = order_numbers._claim_worker_id()
+    second, second_lock = order_numbers._claim_worker_id()
+    try:
+        assert first == 7 * order_numbers.ORDER_WORKERS_PER_HOST
+        assert second == first + 1
+    finally:
+        first_lock.close()
+        second_lock.close()
+
+
+def test_host_id_out_of_range(host):
+    host(order_numbers.WORKER_LIMIT // order_numbers.ORDER_WORKERS_PER_HOST)
+    with pytest.raises(ValueError):
+        order_numbers._claim_worker_id()
@@ -0,0 +1,114 @@
+# cursor 分頁：cursor 帶有排序方式，不同排序產生的 cursor 不能混用
+import asyncio
+import base64
+import json
+import orjson
+import pytest
+import api
+import catalog
+from catalog import AttractionRecord, CatalogSnapshot
+from pagination import decode_cursor, encode_cursor
+
+ATTRACTIONS = [
+    AttractionRecord(i, f"{name}{i}", category, description, "地址", "交通", mrt, 25.0 + i / 1000, 121.5, [])
+    for i, (name, category, description, mrt) in enumerate([
+        ("北投溫泉", "溫泉", "溫泉公園", "北投"),
+        ("大安公園", "公園", "都市中的公園", "大安"),
+        ("溫泉博物館", "博物館", "北投溫泉的歷史", "北投"),
+        ("青年公園", "公園", "公園與游泳池", None),
+        ("地熱谷", "溫泉", "北投的溫泉源頭", "北投"),
+    ] * 6, start=1)
+]
+
+
+def raw_cursor(data):
+    return base64.urlsafe_b64encode(json.dumps(data).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def test_round_trip():
+    for key, sort in [((42,), "id"), ((-3.25, 7), "score:1"), (("2024-01-01 10:00:00.123", 9), "created")]:
+        assert decode_cursor(encode_cursor(key, sort), sort, len(key)) == key
+
+
+def test_sort_mismatch_rejected():
+    cursor = encode_cursor((-3.25, 7), "score:1")
+    for sort in ("score:2", "score:db", "id"):
+        with pytest.raises(ValueError):
+            decode_cursor(cursor, sort, 2)
+
+
+def test_size_mismatch_rejected():
+    with pytest.raises(ValueError):
+        decode_cursor(encode_cursor((7,), "id"), "id", 2)
+
+
+@pytest.mark.parametrize("cursor", [
+    "not-base64!!",
+    raw_cursor([1]),
+    raw_cursor({"s": "id"}),
+    raw_cursor({"s": "id", "k": []}),
+    raw_cursor({"s": "id", "k": [True]}),
+    raw_cursor({"s": "id", "k": [1.5]}),
+    raw_cursor({"s": "id", "k": [None]}),
+    raw_cursor({"k": [1]}),
+])
+def test_invalid_cursor_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, "id", 1)
+
+
+def test_bool_score_rejected():
+    with pytest.raises(ValueError):
+        decode_cursor(raw_cursor({"s": "score:1", "k": [False, 3]}), "score:1", 2)
+
+
+@pytest.mark.parametrize("keyword, category", [(None, None), (None, "公園"), ("溫泉", None), ("北投", "溫泉")])
+def test_keyset_pages_cover_results_once(keyword, category):
+    snapshot = CatalogSnapshot(1, ATTRACTIONS)
+    _, docs = snapshot.search(keyword, category=category)
+    expected = [snapshot.attractions[doc].id for doc in docs]
+
+    seen = []
+    after = None
+    while True:
+        items, _, next_key = snapshot.page(keyword, 4, after=after, category=category)
+        seen += [a.id for a in items]
+        if next_key is None:
+            break
+        after = next_key
+    assert seen == expected
+
+
+def get_attraction(**params):
+    params = {"page": 0, "keyword": None, "category": None, "mrt": None, "cursor": None,
+              "facets": False, "ids": None, **params}
+    response = asyncio.run(api.get_attraction(**params))
+    return response.status_code, orjson.loads(response.body)
+
+
+def test_api_rejects_cursor_from_other_sort(monkeypatch):
+    monkeypatch.setattr(catalog, "_snapshot", CatalogSnapshot(1, ATTRACTIONS))
+    status, body = get_attraction(keyword="溫泉")
+    cursor = body["nextCursor"]
+    assert status == 200 and cursor
+
+    assert get_attraction(keyword="溫泉", cursor=cursor)[0] == 200
+    # 目錄快照重新載入後分數不能比較；依 id 排序的列表也不能使用相關度的 cursor
+    monkeypatch.setattr(catalog, "_snapshot", CatalogSnapshot(2, ATTRACTIONS))
+    assert get_attraction(keyword="溫泉", cursor=cursor)[0] == 400
+    assert get_attraction(cursor=cursor)[0] == 400
+    # 沒有關鍵字時的 cursor 也不能用在關鍵字搜尋
+    assert get_attraction(keyword="溫泉", cursor=encode_cursor((3,), "id"))[0] == 400
+    # 資料庫備援路徑的 cursor 不能用在目錄快照
+    assert get_attraction(keyword="溫泉", cursor=encode_cursor((-1.0, 3), "score:db"))[0] == 400
+    # 目錄快照的 cursor 也不能用在資料庫備援路徑（在查詢資料庫之前就拒絕）
+    monkeypatch.setattr(catalog, "_snapshot", None)
+    assert get_attraction(keyword="溫泉", cursor=cursor)[0] == 400
+
+
+def test_api_id_cursor_is_shared_with_fallback(monkeypatch):
+    # 沒有關鍵字時兩條路徑都依 id 排序，cursor 標示相同
+    monkeypatch.setattr(catalog, "_snapshot", CatalogSnapshot(1, ATTRACTIONS))
+    status, body = get_attraction()
+    assert status == 200
+    assert decode_cursor(body["nextCursor"], "id", 1) == (body["data"][-1]["id"],)
@@ -0,0 +1,89 @@
+# 關鍵字搜尋：斷詞規則與 BM25 排序
+from types import SimpleNamespace
+import pytest
+import search
+
+
+def doc(name, description="", mrt=None):
+    return SimpleNamespace(name=name, description=description, mrt=mrt)
+
+
+def ids(index, query):
+    return [d for d, _ in index.search(query)]
+
+
+def test_tokenize_cjk_bigrams_and_unigrams():
+    assert search.tokenize("北投溫泉") == ["北投", "投溫", "溫泉", "北", "投", "溫", "泉"]
+    assert search.tokenize("台") == ["台"]
+
+
+def test_tokenize_ascii_words_lowercased():
+    assert search.tokenize("Taipei 101, MRT-Station") == ["taipei", "101", "mrt", "station"]
+    assert search.tokenize("台北101") == ["台北", "台", "北", "101"]
+
+
+def test_query_terms_bigrams_only_and_deduplicated():
+    assert search.query_terms("北投溫泉") == ["北投", "投溫", "溫泉"]
+    assert search.query_terms("北") == ["北"]
+    assert search.query_terms("公園 公園") == ["公園"]
+    assert search.query_terms("!!") == []
+
+
+@pytest.mark.parametrize("text", ["", "北", "哈哈哈哈", "Taipei101 taipei 台北 101台北", "a1 ＡＢ 台 北投溫泉！公園"])
+def test_direct_counts_match_tokenize(text):
+    tokens = search.tokenize(text)
+    assert search._length(text) == len(tokens)
+    for term in set(tokens) | {"哈哈", "taipei", "北", "公園"}:
+        assert search._occurrences(text, term) == tokens.count(term)
+
+
+def test_build_postings_for_selected_terms_matches_full_index():
+    docs = [doc("北投溫泉博物館", "溫泉與公園"), doc("大安森林公園", "台北的公園"), doc("Taipei 101", "taipei101 觀景台")]
+    full, lengths, mrts = search.build_postings(docs)
+    terms = {"公園", "溫泉", "taipei", "北", "不存在"}
+    part, part_lengths, part_mrts = search.build_postings(docs, terms)
+    assert part_lengths == lengths and part_mrts == mrts
+    assert part == {term: full[term] for term in terms if term in full}
+
+
+def test_all_terms_must_match():
+    index = search.SearchIndex([doc("北投溫泉"), doc("北投公園"), doc("溫泉公園")])
+    assert ids(index, "北投") == [0, 1]
+    assert ids(index, "北投 公園") == [1]
+    assert ids(index, "北投 博物館") == []
+
+
+def test_ascii_matches_whole_words_only():
+    index = search.SearchIndex([doc("Taipei101"), doc("Taipei 101")])
+    assert ids(index, "taipei") == [1]
+    assert ids(index, "TAIPEI101") == [0]
+
+
+def test_name_match_ranks_above_description_match():
+    index = search.SearchIndex([doc("美術館", "附近有溫泉"), doc("溫泉會館", "美術館旁")])
+    assert ids(index, "溫泉") == [1, 0]
+    assert ids(index, "美術館") == [0, 1]
+
+
+def test_shorter_document_ranks_higher_for_same_frequency():
+    index = search.SearchIndex([doc("公園", "很長的描述" * 20), doc("公園", "短")])
+    assert ids(index, "公園") == [1, 0]
+
+
+def test_ties_ordered_by_document():
+    index = search.SearchIndex([doc("公園"), doc("公園"), doc("公園")])
+    assert ids(index, "公園") == [0, 1, 2]
+
+
+def test_exact_mrt_station_ranks_first():
+    index = search.SearchIndex([doc("北投溫泉", "北投"), doc("地熱谷", mrt="北投")])
+    assert ids(index, "北投") == [1, 0]
+    # 捷運站完全相符即可命中，不需要出現在名稱或描述
+    assert ids(index, " 北投 ") == [1, 0]
+
+
+def test_documents_without_text():
+    index = search.SearchIndex([doc("", ""), doc(None, None, mrt="北投")])
+    assert index.avg_length == 0
+    assert index.search("公園") == []
+    assert ids(index, "北投") == [1]